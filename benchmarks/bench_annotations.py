@@ -0,0 +1,73 @@
+#!/usr/bin/python
+
+# Times writing and reading of synaptic partner annotations with CremiFile,
+# and compares reading to an element-by-element read of the same datasets.
+
+import os
+import sys
+import tempfile
+import time
+import numpy as np
+from cremi import Annotations
+from cremi.io import CremiFile
+
+def synthetic_annotations(num_partners, seed = 42):
+    """Create annotations with num_partners pairs of pre- and post-synaptic
+    sites at random locations in a 1250x1250x125 volume (in nm)."""
+
+    random = np.random.RandomState(seed)
+    ids = np.arange(2*num_partners, dtype=np.uint64)
+    types = np.array(["presynaptic_site", "postsynaptic_site"], dtype=object)[ids%2]
+    locations = random.uniform(0, 1, (2*num_partners, 3))*np.array([125*40.0, 1250*4.0, 1250*4.0])
+
+    return Annotations.from_arrays(ids, types, locations, ids.reshape((-1, 2)))
+
+def read_element_wise(cremi_file):
+    """Read the annotation datasets one element at a time, as an unbuffered
+    reader would."""
+
+    annotations = Annotations()
+    ids = cremi_file.h5file["/annotations/ids"]
+    types = cremi_file.h5file["/annotations/types"]
+    locations = cremi_file.h5file["/annotations/locations"]
+    for i in range(len(ids)):
+        annotations.add_annotation(ids[i], types[i], locations[i])
+    for (pre, post) in cremi_file.h5file["/annotations/presynaptic_site/partners"]:
+        annotations.set_pre_post_partners(pre, post)
+
+    return annotations
+
+num_annotations = int(sys.argv[1]) if len(sys.argv) > 1 else 100000
+
+annotations = synthetic_annotations(num_annotations/2)
+filename = os.path.join(tempfile.mkdtemp(), "annotations.hdf")
+
+start = time.time()
+cremi_file = CremiFile(filename, "w")
+cremi_file.write_annotations(annotations)
+cremi_file.close()
+write_time = time.time() - start
+
+cremi_file = CremiFile(filename, "r")
+
+start = time.time()
+bulk = cremi_file.read_annotations()
+bulk_time = time.time() - start
+
+start = time.time()
+element_wise = read_element_wise(cremi_file)
+element_wise_time = time.time() - start
+
+cremi_file.close()
+os.remove(filename)
+
+assert np.array_equal(bulk.ids(), element_wise.ids())
+assert np.array_equal(bulk.locations(), element_wise.locations())
+assert np.array_equal(bulk.pre_post_partners, element_wise.pre_post_partners)
+
+print "%d annotations (in s)"%num_annotations
+print
+print "write_annotations         : %8.3f"%write_time
+print "read_annotations          : %8.3f"%bulk_time
+print "element-wise read         : %8.3f"%element_wise_time
+print "speedup                   : %8.1fx"%(element_wise_time/bulk_time)
@@ -0,0 +1,50 @@
+#!/usr/bin/python
+
+# Compares the two ways of computing a border mask in create_border_mask_2d:
+# thresholding a full Euclidean distance transform ('edt') and dilating the
+# border pixels with a disk ('dilation'), for several values of max_dist.
+
+import sys
+import timeit
+import numpy as np
+from scipy import ndimage
+from cremi.evaluation.border_mask import create_border_mask_2d
+
+def synthetic_labels(shape, num_labels, seed = 42):
+    """Create a 2D label image of Voronoi cells around random seed points."""
+
+    random = np.random.RandomState(seed)
+    seeds = np.zeros(shape, dtype=np.uint64)
+    seeds[random.randint(0, shape[0], num_labels), random.randint(0, shape[1], num_labels)] = np.arange(1, num_labels + 1)
+    _, indices = ndimage.distance_transform_edt(seeds == 0, return_indices=True)
+
+    return seeds[tuple(indices)]
+
+size = int(sys.argv[1]) if len(sys.argv) > 1 else 1250
+repeats = 3
+
+image = synthetic_labels((size, size), size)
+
+print "Border mask of a %dx%d slice, best of %d runs (in ms)"%(size, size, repeats)
+print
+print "max_dist      edt   dilation   speedup   identical"
+
+for max_dist in [ 0, 1, 2, 3.5, 5, 8, 16, 32, 64, 128 ]:
+
+    times = {}
+    for method in [ 'edt', 'dilation' ]:
+        times[method] = min(timeit.repeat(
+            lambda: create_border_mask_2d(image, max_dist, method=method),
+            repeat=repeats,
+            number=1))*1000.0
+
+    identical = np.array_equal(
+        create_border_mask_2d(image, max_dist, method='edt'),
+        create_border_mask_2d(image, max_dist, method='dilation'))
+
+    print "%8.1f %8.1f %10.1f %8.1fx %11s"%(
+        max_dist,
+        times['edt'],
+        times['dilation'],
+        times['edt']/times['dilation'],
+        identical)
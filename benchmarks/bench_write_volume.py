@@ -0,0 +1,82 @@
+#!/usr/bin/python
+
+# Compares the HDF5 layout presets of CremiFile.write_volume on a synthetic
+# label volume: write throughput, file size, and the latency of reading a
+# whole section and a small random block.
+
+import os
+import sys
+import tempfile
+import time
+import numpy as np
+from cremi import Volume
+from cremi.io import CremiFile
+from cremi.io.CremiFile import volume_layouts
+
+def synthetic_labels(shape, seed = 42):
+    """Create a uint64 label volume of axis-aligned boxes, which compresses
+    roughly like a real segmentation."""
+
+    random = np.random.RandomState(seed)
+    labels = np.zeros(shape, dtype=np.uint64)
+    for label in range(1, 200):
+        begin = [ random.randint(0, s) for s in shape ]
+        size = [ random.randint(1, max(2, s/4)) for s in shape ]
+        labels[tuple(slice(b, b + s) for (b, s) in zip(begin, size))] = label + 2**40
+
+    return labels
+
+def read_times(ds, block_shape, repetitions, seed = 42):
+    """Average time to read a whole section and a random block (copied, such
+    that memory-mapped data is read as well)."""
+
+    random = np.random.RandomState(seed)
+
+    start = time.time()
+    for i in range(repetitions):
+        z = random.randint(0, ds.shape[0])
+        np.array(ds[z])
+    section_time = (time.time() - start)/repetitions
+
+    start = time.time()
+    for i in range(repetitions):
+        begin = [ random.randint(0, s - b + 1) for (s, b) in zip(ds.shape, block_shape) ]
+        np.array(ds[tuple(slice(b, b + s) for (b, s) in zip(begin, block_shape))])
+    block_time = (time.time() - start)/repetitions
+
+    return (section_time, block_time)
+
+shape = tuple(int(s) for s in sys.argv[1:4]) if len(sys.argv) > 3 else (32, 512, 512)
+block_shape = (8, 64, 64)
+repetitions = 20
+
+labels = Volume(synthetic_labels(shape), resolution = (40.0, 4.0, 4.0))
+megabytes = labels.data.nbytes/1e6
+directory = tempfile.mkdtemp()
+
+print "uint64 labels of shape %s (%.1f MB)"%(str(shape), megabytes)
+print
+print "layout        write MB/s   size MB   section ms   block ms"
+
+for layout in sorted(volume_layouts.keys()):
+
+    filename = os.path.join(directory, layout + ".hdf")
+
+    start = time.time()
+    cremi_file = CremiFile(filename, "w")
+    cremi_file.write_neuron_ids(labels, layout)
+    cremi_file.close()
+    write_time = time.time() - start
+
+    cremi_file = CremiFile(filename, "r")
+    (section_time, block_time) = read_times(cremi_file.read_neuron_ids().data, block_shape, repetitions)
+    cremi_file.close()
+
+    print "%-12s %11.1f %9.2f %12.2f %10.2f"%(
+        layout,
+        megabytes/write_time,
+        os.path.getsize(filename)/1e6,
+        section_time*1000,
+        block_time*1000)
+
+    os.remove(filename)
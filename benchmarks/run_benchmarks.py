@@ -0,0 +1,299 @@
+#!/usr/bin/python
+
+# Runs the benchmark suite on synthetic CREMI-style samples of a given scale
+# (see synthetic.py), and reports the wall time, peak memory, and throughput
+# of each benchmark. Each benchmark runs in its own process, such that peak
+# memory is measured per benchmark.
+#
+# Usage:
+#
+#   python benchmarks/run_benchmarks.py [--scale 1e6] [--output report.json]
+#                                       [--baseline baseline.json]
+#
+# With --baseline, the report is compared to a stored report, and the script
+# exits with an error if a benchmark got slower by more than --tolerance.
+
+import argparse
+import json
+import os
+import platform
+import resource
+import shutil
+import subprocess
+import sys
+import tempfile
+import time
+import numpy as np
+
+sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+import synthetic
+
+from cremi.io import CremiFile
+from cremi.evaluation import NeuronIds, Clefts, create_border_mask
+from cremi.evaluation.voi import voi
+from cremi.evaluation.rand import adapted_rand
+from cremi.evaluation.synaptic_partners import synaptic_partners_fscore
+
+# Each benchmark is a function of the directory with the samples. It prepares
+# its input (not timed), and returns a function to time and the number of
+# items it processes (for the throughput) and their unit.
+
+def read_neuron_ids(directory):
+
+    test = CremiFile(os.path.join(directory, "test.hdf"), "r").read_neuron_ids()
+    truth = CremiFile(os.path.join(directory, "truth.hdf"), "r").read_neuron_ids()
+
+    return (test, truth)
+
+def bench_voi(directory):
+
+    (test, truth) = read_neuron_ids(directory)
+    (test, truth) = (test.data[:], truth.data[:])
+
+    return (lambda: voi(test, truth), test.size, "voxels")
+
+def bench_voi_blockwise(directory):
+
+    (test, truth) = read_neuron_ids(directory)
+
+    return (lambda: voi(test.data, truth.data, block_shape=(8, None, None)), test.data.size, "voxels")
+
+def bench_adapted_rand(directory):
+
+    (test, truth) = read_neuron_ids(directory)
+    (test, truth) = (test.data[:], truth.data[:])
+
+    return (lambda: adapted_rand(test, truth), test.size, "voxels")
+
+def bench_create_border_mask(directory):
+
+    (test, truth) = read_neuron_ids(directory)
+    truth = truth.data[:]
+    target = np.zeros(truth.shape, dtype=np.uint64)
+
+    return (lambda: create_border_mask(truth, target, 25.0/synthetic.resolution[1], np.uint64(-1)), truth.size, "voxels")
+
+def bench_neuron_ids_evaluate(directory):
+
+    (test, truth) = read_neuron_ids(directory)
+
+    return (lambda: NeuronIds(truth, border_threshold=25).evaluate(test), test.data.size, "voxels")
+
+def read_clefts(directory):
+
+    test = CremiFile(os.path.join(directory, "test.hdf"), "r").read_clefts()
+    truth = CremiFile(os.path.join(directory, "truth.hdf"), "r").read_clefts()
+
+    return (test, truth)
+
+def evaluate_clefts(evaluation):
+
+    evaluation.count_false_positives()
+    evaluation.count_false_negatives()
+    evaluation.acc_false_positives()
+    evaluation.acc_false_negatives()
+
+def bench_clefts(directory):
+
+    (test, truth) = read_clefts(directory)
+
+    return (lambda: evaluate_clefts(Clefts(test, truth)), test.data.size, "voxels")
+
+def bench_clefts_blockwise(directory):
+
+    (test, truth) = read_clefts(directory)
+
+    return (lambda: evaluate_clefts(Clefts(test, truth, block_shape=(32, 512, 512))), test.data.size, "voxels")
+
+def bench_synaptic_partners_fscore(directory):
+
+    test = CremiFile(os.path.join(directory, "test.hdf"), "r")
+    truth = CremiFile(os.path.join(directory, "truth.hdf"), "r")
+    test_annotations = test.read_annotations()
+    truth_annotations = truth.read_annotations()
+    neuron_ids = truth.read_neuron_ids()
+
+    return (
+        lambda: synaptic_partners_fscore(test_annotations, truth_annotations, neuron_ids),
+        len(truth_annotations.pre_post_partners),
+        "synapses")
+
+def bench_read_annotations(directory):
+
+    truth = CremiFile(os.path.join(directory, "truth.hdf"), "r")
+    num_synapses = len(truth.read_annotations().pre_post_partners)
+
+    return (lambda: truth.read_annotations(), num_synapses, "synapses")
+
+def bench_write_volume(directory):
+
+    (test, truth) = read_neuron_ids(directory)
+    test.data = test.data[:]
+    filename = os.path.join(directory, "write_volume.hdf")
+
+    def write():
+        cremi_file = CremiFile(filename, "w")
+        cremi_file.write_neuron_ids(test)
+        cremi_file.close()
+        os.remove(filename)
+
+    return (write, test.data.nbytes/1e6, "MB")
+
+def bench_read_volume(directory):
+
+    (test, truth) = read_neuron_ids(directory)
+
+    return (lambda: test.data[:], test.data.size*8/1e6, "MB")
+
+benchmarks = [
+    ("voi", bench_voi),
+    ("voi_blockwise", bench_voi_blockwise),
+    ("adapted_rand", bench_adapted_rand),
+    ("create_border_mask", bench_create_border_mask),
+    ("neuron_ids_evaluate", bench_neuron_ids_evaluate),
+    ("clefts", bench_clefts),
+    ("clefts_blockwise", bench_clefts_blockwise),
+    ("synaptic_partners_fscore", bench_synaptic_partners_fscore),
+    ("read_annotations", bench_read_annotations),
+    ("write_volume", bench_write_volume),
+    ("read_volume", bench_read_volume),
+]
+
+def peak_rss_mb():
+
+    # ru_maxrss is in kilobytes on Linux, in bytes on OS X
+    peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    return peak/(1024.0*1024.0) if sys.platform == "darwin" else peak/1024.0
+
+def run_child(name, directory, repeats):
+    """Run a single benchmark in this process, and print the result as
+    JSON."""
+
+    # silence progress messages of the evaluation code
+    stdout = sys.stdout
+    sys.stdout = open(os.devnull, "w")
+
+    (function, items, unit) = dict(benchmarks)[name](directory)
+    setup_rss = peak_rss_mb()
+
+    times = []
+    for i in range(repeats):
+        start = time.time()
+        function()
+        times.append(time.time() - start)
+
+    sys.stdout = stdout
+
+    print json.dumps({
+        "time": min(times),
+        "throughput": items/min(times),
+        "unit": unit + "/s",
+        "setup_rss_mb": setup_rss,
+        "peak_rss_mb": peak_rss_mb()})
+
+def run_suite(scale, names, repeats, directory):
+
+    print "Creating samples of scale " + scale + " in " + directory + "..."
+    synthetic.create_sample(os.path.join(directory, "truth.hdf"), scale)
+    synthetic.create_sample(os.path.join(directory, "test.hdf"), scale, test=True)
+
+    results = {}
+    for name in names:
+
+        output = subprocess.check_output([
+            sys.executable,
+            os.path.abspath(__file__),
+            "--child", name,
+            "--data", directory,
+            "--repeats", str(repeats)])
+        results[name] = json.loads(output.strip().split("\n")[-1])
+
+        print "%-26s %9.3fs %9.1f MB peak %12.4g %s"%(
+            name,
+            results[name]["time"],
+            results[name]["peak_rss_mb"],
+            results[name]["throughput"],
+            results[name]["unit"])
+
+    return results
+
+def compare(report, baseline, tolerance, min_difference = 0.05):
+    """Compare the times of a report to a baseline report. Returns the names
+    of the benchmarks that got slower by more than tolerance (a fraction), and
+    by at least min_difference seconds (to ignore noise in short
+    benchmarks)."""
+
+    if report["scale"] != baseline["scale"]:
+        print "Warning: comparing scale " + report["scale"] + " to baseline of scale " + baseline["scale"]
+
+    print
+    print "%-26s %10s %10s %8s"%("benchmark", "baseline", "current", "ratio")
+
+    regressions = []
+    for name in sorted(report["results"].keys()):
+        if name not in baseline["results"]:
+            continue
+        before = baseline["results"][name]["time"]
+        after = report["results"][name]["time"]
+        ratio = after/before
+        slower = ratio > 1.0 + tolerance and after - before >= min_difference
+        if slower:
+            regressions.append(name)
+        print "%-26s %9.3fs %9.3fs %7.2fx%s"%(name, before, after, ratio, "  SLOWER" if slower else "")
+
+    return regressions
+
+if __name__ == "__main__":
+
+    parser = argparse.ArgumentParser(description="Run the CREMI benchmark suite.")
+    parser.add_argument("--scale", default="1e6", choices=sorted(synthetic.scales.keys()), help="number of voxels of the samples (default: %(default)s)")
+    parser.add_argument("--only", action="append", choices=[ name for (name, b) in benchmarks ], help="run only these benchmarks")
+    parser.add_argument("--repeats", type=int, default=3, help="report the best of this many runs (default: %(default)s)")
+    parser.add_argument("--output", default=None, help="write the report to this JSON file")
+    parser.add_argument("--baseline", default=None, help="compare to this report")
+    parser.add_argument("--tolerance", type=float, default=0.2, help="allowed slowdown compared to the baseline (default: %(default)s)")
+    parser.add_argument("--data", default=None, help="directory for the samples (default: a temporary directory)")
+    parser.add_argument("--child", default=None, help=argparse.SUPPRESS)
+    args = parser.parse_args()
+
+    if args.child is not None:
+        run_child(args.child, args.data, args.repeats)
+        sys.exit(0)
+
+    directory = args.data or tempfile.mkdtemp(prefix="cremi_benchmarks_")
+    if not os.path.isdir(directory):
+        os.makedirs(directory)
+
+    try:
+        results = run_suite(
+            args.scale,
+            args.only or [ name for (name, b) in benchmarks ],
+            args.repeats,
+            directory)
+    finally:
+        if args.data is None:
+            shutil.rmtree(directory, ignore_errors=True)
+
+    report = {
+        "scale": args.scale,
+        "shape": synthetic.scales[args.scale][0],
+        "num_synapses": synthetic.scales[args.scale][1],
+        "date": time.strftime("%Y-%m-%d %H:%M:%S"),
+        "platform": platform.platform(),
+        "python": platform.python_version(),
+        "numpy": np.__version__,
+        "results": results
+    }
+
+    if args.output is not None:
+        with open(args.output, "w") as f:
+            json.dump(report, f, indent=2, sort_keys=True)
+
+    if args.baseline is not None:
+        with open(args.baseline) as f:
+            baseline = json.load(f)
+        regressions = compare(report, baseline, args.tolerance)
+        if len(regressions) > 0:
+            print
+            print "Slower than baseline: " + ", ".join(regressions)
+            sys.exit(1)
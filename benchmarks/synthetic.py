@@ -0,0 +1,136 @@
+# Synthetic CREMI-style data for the benchmarks: neuron ids (with a slightly
+# shifted, over- and under-segmented "test" segmentation), synaptic clefts,
+# and synaptic partner annotations. Volumes are generated and written block
+# by block, such that the large scales do not have to fit into memory.
+
+import numpy as np
+from cremi import Annotations
+from cremi.io import CremiFile
+
+resolution = (40.0, 4.0, 4.0)
+
+# (shape of the volumes, number of synapses)
+scales = {
+    "1e6": ((10, 316, 316), 100),
+    "1e7": ((25, 632, 632), 1000),
+    "1e8": ((64, 1250, 1250), 10000),
+    "1e9": ((125, 2828, 2828), 100000),
+}
+
+cell_size = 48
+
+def neuron_ids_block(begin, shape, test = False):
+    """Generate a block of neuron ids. Neurons are columns along z, whose
+    cross-sections drift with z. The test segmentation drifts slightly
+    differently, merges pairs of neurons in every fifth row of cells, and
+    splits neurons in every seventh row every 20 sections."""
+
+    (z, y, x) = np.ogrid[
+        begin[0]:begin[0] + shape[0],
+        begin[1]:begin[1] + shape[1],
+        begin[2]:begin[2] + shape[2]]
+
+    phase = 1.0 if test else 0.0
+    drift_y = (8*np.sin(z/10.0 + phase)).astype(np.int64)
+    drift_x = (8*np.cos(z/13.0 + phase)).astype(np.int64)
+    cell_y = (y + drift_y + 64)//cell_size
+    cell_x = (x + drift_x + 64)//cell_size
+
+    if test:
+        cell_x = np.where(cell_y%5 == 0, cell_x//2, cell_x)
+        labels = cell_y*100000 + cell_x + 1
+        labels = labels + np.where(cell_y%7 == 0, (z//20)*10**9, 0)
+    else:
+        labels = cell_y*100000 + cell_x + 1
+
+    return np.broadcast_to(labels, shape).astype(np.uint64)
+
+def cleft_boxes(shape, seed):
+    """Random small boxes (begin, end, label) in a volume of the given shape,
+    about one per 10^5 voxels."""
+
+    random = np.random.RandomState(seed)
+    num_boxes = max(1, int(np.prod(shape))//100000)
+    size = np.array([2, 12, 12])
+    begins = np.array([ random.randint(0, s, num_boxes) for s in shape ]).T
+    ends = np.minimum(begins + size, shape)
+
+    return [ (b, e, i) for (i, (b, e)) in enumerate(zip(begins, ends)) ]
+
+def clefts_block(begin, shape, boxes):
+
+    block = np.full(shape, 0xffffffffffffffff, dtype=np.uint64)
+    begin = np.array(begin)
+    end = begin + np.array(shape)
+
+    for (box_begin, box_end, label) in boxes:
+        lower = np.maximum(box_begin, begin)
+        upper = np.minimum(box_end, end)
+        if (lower < upper).all():
+            block[tuple(slice(l, u) for (l, u) in zip(lower - begin, upper - begin))] = label
+
+    return block
+
+def annotations(shape, num_synapses, seed, jitter = 0.0, drop = 0.0):
+    """Pairs of pre- and post-synaptic sites at random locations, with the
+    post-synaptic site up to 80nm away from the pre-synaptic one in x and y.
+    Used with a seed for both ground truth and test, the test locations are
+    jittered by up to jitter nm, and a fraction drop of the pairs is
+    removed."""
+
+    random = np.random.RandomState(seed)
+    extent = (np.array(shape) - 1)*np.array(resolution)
+    margin = np.array([0.0, 80.0, 80.0])
+
+    pre = margin + random.uniform(0, 1, (num_synapses, 3))*(extent - 2*margin)
+    post = pre + random.uniform(-1, 1, (num_synapses, 3))*margin
+
+    noise = np.random.RandomState(seed + 1)
+    keep = noise.uniform(0, 1, num_synapses) >= drop
+    pre = pre[keep] + noise.uniform(-jitter, jitter, pre[keep].shape)
+    post = post[keep] + noise.uniform(-jitter, jitter, post[keep].shape)
+    pre = np.clip(pre, 0, extent)
+    post = np.clip(post, 0, extent)
+
+    n = len(pre)
+    ids = np.arange(2*n, dtype=np.uint64)
+    types = np.array(["presynaptic_site", "postsynaptic_site"], dtype=object)[ids%2]
+    locations = np.zeros((2*n, 3))
+    locations[0::2] = pre
+    locations[1::2] = post
+
+    return Annotations.from_arrays(ids, types, locations, ids.reshape((-1, 2)))
+
+def blocks(shape, block_shape):
+
+    for z in range(0, shape[0], block_shape[0]):
+        for y in range(0, shape[1], block_shape[1]):
+            for x in range(0, shape[2], block_shape[2]):
+                begin = (z, y, x)
+                yield (begin, tuple(min(b, s - o) for (b, s, o) in zip(block_shape, shape, begin)))
+
+def create_sample(filename, scale, test = False, seed = 42):
+    """Write a ground truth (or test) sample of the given scale."""
+
+    (shape, num_synapses) = scales[scale]
+    block_shape = (16, 512, 512)
+
+    cremi_file = CremiFile(filename, "w")
+
+    cremi_file.create_volume("/volumes/labels/neuron_ids", shape, np.uint64, resolution, layout="block-wise")
+    cremi_file.write_volume_blocks(
+        "/volumes/labels/neuron_ids",
+        ((begin, neuron_ids_block(begin, size, test)) for (begin, size) in blocks(shape, block_shape)))
+
+    boxes = cleft_boxes(shape, seed + (1 if test else 0))
+    cremi_file.create_volume("/volumes/labels/clefts", shape, np.uint64, resolution, layout="block-wise")
+    cremi_file.write_volume_blocks(
+        "/volumes/labels/clefts",
+        ((begin, clefts_block(begin, size, boxes)) for (begin, size) in blocks(shape, block_shape)))
+
+    if test:
+        cremi_file.write_annotations(annotations(shape, num_synapses, seed, jitter=40.0, drop=0.1))
+    else:
+        cremi_file.write_annotations(annotations(shape, num_synapses, seed))
+
+    cremi_file.close()
@@ -1,16 +1,154 @@
-class Annotations:
+import numpy as np
+
+class Annotations(object):
 
     def __init__(self, offset = (0.0, 0.0, 0.0)):
 
-        self.__types = {}
-        self.__locations = {}
+        # annotations are stored column-wise in arrays, which are grown
+        # geometrically; only the first __size rows are valid
+        self.__size = 0
+        self.__ids = np.zeros((0,), dtype=np.uint64)
+        self.__type_codes = np.zeros((0,), dtype=np.uint8)
+        self.__locations = np.zeros((0, 3), dtype=np.float64)
+
+        # the distinct type names, indexed by type code
+        self.__type_names = []
+
+        # map from id to row, created on demand
+        self.__index = None
+
+        self.__num_partners = 0
+        self.__partners = np.zeros((0, 2), dtype=np.uint64)
+
         self.comments = {}
-        self.pre_post_partners = []
         self.offset = offset
 
+    @classmethod
+    def from_arrays(cls, ids, types, locations, pre_post_partners = None, offset = (0.0, 0.0, 0.0)):
+        """Create annotations from arrays, without adding them one by one.
+
+        Parameters
+        ----------
+
+            ids: array-like of int, shape (n,)
+                The (unique) IDs of the annotations.
+
+            types: array-like of string, shape (n,)
+                The type of each annotation, see `add_annotation`.
+
+            locations: array-like of float, shape (n, 3)
+                The location of each annotation, relative to the offset.
+
+            pre_post_partners: array-like of int, shape (m, 2), optional
+                Pairs of IDs of pre- and post-synaptic partners.
+
+            offset: tuple, float
+                The offset of the annotations.
+        """
+
+        annotations = cls(offset)
+
+        ids = Annotations.__as_ids(ids).reshape((-1,))
+        locations = np.asarray(locations, dtype=np.float64).reshape((-1, 3))
+        if len(locations) != len(ids) or len(types) != len(ids):
+            raise ValueError("ids, types, and locations have different lengths")
+        if len(np.unique(ids)) != len(ids):
+            raise ValueError("ids are not unique")
+
+        # there are only a few distinct types, so find the rows of each type
+        # with vectorized comparisons
+        types = np.asarray(types, dtype=object).reshape((-1,))
+        codes = np.zeros((len(types),), dtype=np.uint32)
+        unassigned = np.ones((len(types),), dtype=np.bool)
+        names = []
+        while unassigned.any():
+            name = types[np.argmax(unassigned)]
+            rows = types == name
+            codes[rows] = len(names)
+            names.append(Annotations.__encode(name))
+            unassigned &= ~rows
+
+        annotations.__type_names = names
+        annotations.__type_codes = codes.astype(Annotations.__code_dtype(len(names)))
+        annotations.__ids = ids.copy()
+        annotations.__locations = locations.copy()
+        annotations.__size = len(ids)
+
+        if pre_post_partners is not None:
+            annotations.set_all_pre_post_partners(pre_post_partners)
+
+        return annotations
+
+    def to_arrays(self):
+        """Get all annotations as arrays.
+
+        Returns
+        -------
+
+            (ids, types, locations, pre_post_partners): tuple of np.ndarray
+                The IDs (shape (n,)), types (shape (n,), strings), locations
+                (shape (n, 3)), and pre- and post-synaptic partner pairs (shape
+                (m, 2)), as accepted by `from_arrays`.
+        """
+
+        return (self.ids(), self.types(), self.locations(), self.pre_post_partners)
+
     def __check(self, id):
-        if not id in self.__types.keys():
-            raise "there is no annotation with id " + str(id)
+        if not id in self.__get_index():
+            raise KeyError("there is no annotation with id " + str(id))
+
+    def __get_index(self):
+
+        if self.__index is None:
+            self.__index = dict(zip(self.__ids[:self.__size].tolist(), xrange(self.__size)))
+        return self.__index
+
+    def __type_code(self, type):
+
+        type = Annotations.__encode(type)
+        if type not in self.__type_names:
+            self.__type_names.append(type)
+            dtype = Annotations.__code_dtype(len(self.__type_names))
+            if dtype != self.__type_codes.dtype:
+                self.__type_codes = self.__type_codes.astype(dtype)
+        return self.__type_names.index(type)
+
+    @staticmethod
+    def __as_ids(ids):
+        """Convert ids to an array of type uint64. Raises a ValueError for 
+        negative ids, which would wrap around otherwise."""
+
+        ids = np.asarray(ids)
+        if ids.dtype.kind in "ifO" and (ids < 0).any():
+            raise ValueError("ids have to be non-negative")
+
+        return ids.astype(np.uint64)
+
+    @staticmethod
+    def __read_only(array):
+        """A read-only view of an array, to not expose internal storage."""
+
+        view = array.view()
+        view.flags.writeable = False
+        return view
+
+    @staticmethod
+    def __encode(s):
+        return s.encode('utf8') if isinstance(s, unicode) else str(s)
+
+    @staticmethod
+    def __code_dtype(num_types):
+        return np.uint8 if num_types <= 256 else np.uint32
+
+    @staticmethod
+    def __grow(array, size):
+        """Ensure an array has at least size rows, growing it geometrically."""
+
+        if len(array) >= size:
+            return array
+        grown = np.zeros((max(size, 2*len(array)),) + array.shape[1:], dtype=array.dtype)
+        grown[:len(array)] = array
+        return grown
 
     def add_annotation(self, id, type, location):
         """Add a new annotation.
@@ -22,16 +160,33 @@ class Annotations:
                 The ID of the new annotation.
 
             type: string
-                A string denoting the type of the annotation. Use 
-                "presynaptic_site" or "postsynaptic_site" for pre- and 
+                A string denoting the type of the annotation. Use
+                "presynaptic_site" or "postsynaptic_site" for pre- and
                 post-synaptic annotations, respectively.
 
             location: tuple, float
                 The location of the annotation, relative to the offset.
         """
 
-        self.__types[id] = type.encode('utf8')
-        self.__locations[id] = location
+        if id < 0:
+            raise ValueError("ids have to be non-negative")
+
+        index = self.__get_index()
+        code = self.__type_code(type)
+
+        if id in index:
+            row = index[id]
+        else:
+            row = self.__size
+            self.__size += 1
+            self.__ids = Annotations.__grow(self.__ids, self.__size)
+            self.__type_codes = Annotations.__grow(self.__type_codes, self.__size)
+            self.__locations = Annotations.__grow(self.__locations, self.__size)
+            self.__ids[row] = id
+            index[id] = row
+
+        self.__type_codes[row] = code
+        self.__locations[row] = location
 
     def add_comment(self, id, comment):
         """Add a comment to an annotation.
@@ -46,30 +201,81 @@ class Annotations:
 
         self.__check(pre_id)
         self.__check(post_id)
-        self.pre_post_partners.append((pre_id, post_id))
+
+        row = self.__num_partners
+        self.__num_partners += 1
+        self.__partners = Annotations.__grow(self.__partners, self.__num_partners)
+        self.__partners[row] = (pre_id, post_id)
+
+    def set_all_pre_post_partners(self, pre_post_partners):
+        """Mark several pairs of annotations as pre- and post-synaptic
+        partners at once.
+
+        Parameters
+        ----------
+
+            pre_post_partners: array-like of int, shape (m, 2)
+                Pairs of IDs of pre- and post-synaptic partners.
+        """
+
+        pre_post_partners = Annotations.__as_ids(pre_post_partners).reshape((-1, 2))
+
+        known = np.in1d(pre_post_partners.ravel(), self.ids())
+        if not known.all():
+            raise KeyError("there is no annotation with id " + str(pre_post_partners.ravel()[np.flatnonzero(~known)[0]]))
+
+        begin = self.__num_partners
+        self.__num_partners += len(pre_post_partners)
+        self.__partners = Annotations.__grow(self.__partners, self.__num_partners)
+        self.__partners[begin:self.__num_partners] = pre_post_partners
+
+    @property
+    def pre_post_partners(self):
+        """The pairs of IDs of pre- and post-synaptic partners, as a read-only 
+        array of shape (m, 2). Use `set_pre_post_partners` or 
+        `set_all_pre_post_partners` to add pairs, or assign a list of pairs to 
+        replace all of them. (Before annotations were stored in arrays, this 
+        was a list, which could be appended to.)
+        """
+
+        return Annotations.__read_only(self.__partners[:self.__num_partners])
+
+    @pre_post_partners.setter
+    def pre_post_partners(self, pre_post_partners):
+
+        # start with new storage, such that arrays returned before do not 
+        # change, and keep the old pairs if the new ones are invalid
+        previous = (self.__partners, self.__num_partners)
+        (self.__partners, self.__num_partners) = (np.zeros((0, 2), dtype=np.uint64), 0)
+        try:
+            self.set_all_pre_post_partners(pre_post_partners)
+        except:
+            (self.__partners, self.__num_partners) = previous
+            raise
 
     def ids(self):
-        """Get the ids of all annotations.
+        """Get the ids of all annotations (a read-only array).
         """
 
-        return self.__types.keys()
+        return Annotations.__read_only(self.__ids[:self.__size])
 
     def types(self):
         """Get the types of all annotations.
         """
 
-        return self.__types.values()
+        return np.array(self.__type_names, dtype=object)[self.__type_codes[:self.__size]]
 
     def locations(self):
-        """Get the locations of all annotations. Locations are in world units, 
-        relative to the offset.
+        """Get the locations of all annotations (a read-only array). Locations 
+        are in world units, relative to the offset.
         """
 
-        return self.__locations.values()
+        return Annotations.__read_only(self.__locations[:self.__size])
 
     def get_annotation(self, id):
         """Get the type and location of an annotation by its id.
         """
 
         self.__check(id)
-        return (self.__types[id], self.__locations[id])
+        row = self.__get_index()[id]
+        return (self.__type_names[self.__type_codes[row]], tuple(self.__locations[row]))
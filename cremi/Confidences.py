@@ -0,0 +1,215 @@
+import numpy as np
+
+class Confidences(object):
+
+    def __init__(self, num_levels):
+        """Create an empty set of confidence levels of segment ids.
+
+        Parameters
+        ----------
+
+            num_levels: int
+                The number of confidence levels. Each segment id can be
+                assigned to one of the levels 0 to num_levels - 1.
+        """
+
+        self.num_levels = num_levels
+
+        # the ids of each level are stored as a list of arrays, which are
+        # concatenated on demand
+        self.__ids = [ [] for level in range(num_levels) ]
+
+        # sorted ids and their levels, and a map from id to level, created on
+        # demand
+        self.__sorted = None
+        self.__index = None
+
+    @classmethod
+    def from_arrays(cls, levels, offsets, ids, num_levels = None):
+        """Create confidences from a compressed sparse row layout, as returned
+        by `to_arrays`.
+
+        Parameters
+        ----------
+
+            levels: array-like of int, shape (k,)
+                The confidence levels.
+
+            offsets: array-like of int, shape (k + 1,)
+                The ids of levels[i] are ids[offsets[i]:offsets[i + 1]].
+
+            ids: array-like of int
+                The ids of all levels.
+
+            num_levels: int, optional
+                The number of confidence levels. Defaults to the largest
+                level plus one.
+        """
+
+        levels = np.asarray(levels, dtype=np.int64).reshape((-1,))
+        offsets = np.asarray(offsets, dtype=np.int64).reshape((-1,))
+        ids = np.asarray(ids, dtype=np.uint64).reshape((-1,))
+
+        if len(offsets) != len(levels) + 1:
+            raise ValueError("need one more offset than levels")
+        if len(levels) > 0 and (offsets[0] != 0 or offsets[-1] != len(ids) or (np.diff(offsets) < 0).any()):
+            raise ValueError("offsets are not increasing from 0 to the number of ids")
+
+        if num_levels is None:
+            num_levels = int(levels.max()) + 1 if len(levels) > 0 else 0
+
+        confidences = cls(num_levels)
+        for (level, begin, end) in zip(levels.tolist(), offsets[:-1].tolist(), offsets[1:].tolist()):
+            confidences.add_all(level, ids[begin:end])
+
+        return confidences
+
+    def to_arrays(self):
+        """Get all confidence levels in a compressed sparse row layout.
+
+        Returns
+        -------
+
+            (levels, offsets, ids): tuple of np.ndarray
+                The non-empty levels, and the ids of each level: the ids of
+                levels[i] are ids[offsets[i]:offsets[i + 1]].
+        """
+
+        levels = [ level for level in range(self.num_levels) if len(self.get_ids(level)) > 0 ]
+
+        offsets = np.zeros((len(levels) + 1,), dtype=np.uint64)
+        offsets[1:] = np.cumsum([ len(self.get_ids(level)) for level in levels ])
+
+        ids = np.concatenate([ np.zeros((0,), dtype=np.uint64) ] + [ self.get_ids(level) for level in levels ])
+
+        return (np.array(levels, dtype=np.uint64), offsets, ids)
+
+    def add(self, level, id):
+        """Add a segment id to a confidence level.
+        """
+
+        self.add_all(level, [id])
+
+    def add_all(self, level, ids):
+        """Add several segment ids to a confidence level.
+
+        Parameters
+        ----------
+
+            level: int
+                The confidence level.
+
+            ids: array-like of int
+                The segment ids. Each id should be added to one level only.
+        """
+
+        level = int(level)
+        if level < 0 or level >= self.num_levels:
+            raise IndexError("level " + str(level) + " is not in [0, " + str(self.num_levels) + ")")
+
+        ids = np.array(ids, dtype=np.uint64).reshape((-1,))
+        if len(ids) == 0:
+            return
+
+        self.__ids[level].append(ids)
+        self.__sorted = None
+        self.__index = None
+
+    def get_ids(self, level):
+        """Get the segment ids of a confidence level.
+        """
+
+        ids = self.__ids[level]
+        if len(ids) == 0:
+            return np.zeros((0,), dtype=np.uint64)
+        if len(ids) > 1:
+            self.__ids[level] = ids = [ np.concatenate(ids) ]
+
+        return ids[0]
+
+    def level_of(self, id):
+        """Get the confidence level of a segment id. Raises a KeyError if the
+        id is not in any level.
+
+        The first call creates an index of all ids, after which each query
+        takes constant time. To look up many ids at once, use `levels_of`.
+        """
+
+        index = self.__get_index()
+
+        if isinstance(index, dict):
+            level = index.get(id, -1)
+        else:
+            level = int(index[id]) if 0 <= id < len(index) else -1
+
+        if level < 0:
+            raise KeyError("there is no confidence level for id " + str(id))
+
+        return level
+
+    def levels_of(self, ids):
+        """Get the confidence levels of an array of segment ids. This is a
+        vectorized version of `level_of`.
+
+        Parameters
+        ----------
+
+            ids: array-like of int
+
+        Returns
+        -------
+
+            An array of the same shape as ids, with the level of each id, or -1
+            for ids that are not in any level.
+        """
+
+        ids = np.asarray(ids, dtype=np.uint64)
+        index = self.__get_index()
+
+        if not isinstance(index, dict):
+            inside = ids < len(index)
+            return np.where(inside, index[np.where(inside, ids, np.uint64(0))], -1).astype(np.int64)
+
+        (sorted_ids, sorted_levels) = self.__get_sorted()
+        if len(sorted_ids) == 0:
+            return np.full(ids.shape, -1, dtype=np.int64)
+
+        # the last occurrence of each id, like in the index
+        positions = np.maximum(np.searchsorted(sorted_ids, ids, side='right') - 1, 0)
+        found = sorted_ids[positions] == ids
+
+        return np.where(found, sorted_levels[positions], -1)
+
+    def __get_sorted(self):
+
+        if self.__sorted is None:
+            (levels, offsets, ids) = self.to_arrays()
+            id_levels = np.repeat(levels.astype(np.int64), np.diff(offsets).astype(np.int64))
+            order = np.argsort(ids, kind='mergesort')
+            self.__sorted = (ids[order], id_levels[order])
+
+        return self.__sorted
+
+    def __get_index(self):
+        """Get a map from id to level: a lookup table (an array indexed by id,
+        with -1 for missing ids) if the ids are dense, a dictionary otherwise.
+        """
+
+        if self.__index is None:
+
+            (levels, offsets, ids) = self.to_arrays()
+
+            if len(ids) == 0:
+                self.__index = {}
+            elif ids.max() <= 4*len(ids):
+                # levels are increasing, so an id in several levels gets the
+                # highest one (as in the dictionary)
+                dtype = np.int8 if self.num_levels <= 127 else np.int64
+                self.__index = np.full((int(ids.max()) + 1,), -1, dtype=dtype)
+                for (level, begin, end) in zip(levels.tolist(), offsets[:-1].tolist(), offsets[1:].tolist()):
+                    self.__index[ids[begin:end]] = level
+            else:
+                (ids, levels) = self.__get_sorted()
+                self.__index = dict(zip(ids.tolist(), levels.tolist()))
+
+        return self.__index
@@ -1,3 +1,87 @@
+import h5py
+import numpy as np
+
+
+class DataWindow(object):
+    """A lazy, rectangular window into an array-like (e.g., an HDF5 dataset).
+
+    No data is read when the window is created. Indexing the window reads
+    only the requested part of the underlying data, and `np.array(window)`
+    reads the whole window.
+    """
+
+    def __init__(self, data, begin, shape):
+
+        self.data = data
+        self.begin = tuple(int(b) for b in begin)
+        self.shape = tuple(int(s) for s in shape)
+        self.dtype = data.dtype
+
+    @property
+    def ndim(self):
+        return len(self.shape)
+
+    @property
+    def size(self):
+        return int(np.prod(self.shape))
+
+    def __len__(self):
+        return self.shape[0]
+
+    def __array__(self, dtype = None):
+
+        data = np.asarray(self.data[self.__translate(())])
+        if dtype is not None:
+            data = data.astype(dtype)
+        return data
+
+    def __getitem__(self, key):
+
+        return self.data[self.__translate(key)]
+
+    def __setitem__(self, key, value):
+
+        self.data[self.__translate(key)] = value
+
+    def __translate(self, key):
+        """Translate an index into this window into an index into the
+        underlying data. Supports integers, slices with positive steps,
+        Ellipsis, and integer arrays."""
+
+        if not isinstance(key, tuple):
+            key = (key,)
+
+        if Ellipsis in [ k for k in key if not isinstance(k, np.ndarray) ]:
+            e = [ k is Ellipsis for k in key ].index(True)
+            key = key[:e] + (slice(None),)*(self.ndim - len(key) + 1) + key[e+1:]
+        key = key + (slice(None),)*(self.ndim - len(key))
+
+        if len(key) > self.ndim:
+            raise IndexError("too many indices for window of shape " + str(self.shape))
+
+        translated = []
+        for (k, b, s) in zip(key, self.begin, self.shape):
+
+            if isinstance(k, slice):
+                (start, stop, step) = k.indices(s)
+                if step < 1:
+                    raise IndexError("only positive steps are supported")
+                stop = max(start, stop)
+                translated.append(slice(b + start, b + stop, step))
+
+            elif isinstance(k, (np.ndarray, list)):
+                k = np.asarray(k)
+                if k.size > 0 and (np.amin(k) < -s or np.amax(k) >= s):
+                    raise IndexError("index out of bounds for window of shape " + str(self.shape))
+                translated.append(b + np.where(k < 0, k + s, k))
+
+            else:
+                k = int(k)
+                if k < -s or k >= s:
+                    raise IndexError("index " + str(k) + " is out of bounds for window of shape " + str(self.shape))
+                translated.append(b + (k + s if k < 0 else k))
+
+        return tuple(translated)
 
 class Volume:
 
@@ -28,6 +112,102 @@ class Volume:
 
         raise IndexError("location " + str(location) + " does not lie inside volume")
 
+    def roi(self, offset, shape):
+        """Get a region of interest of this volume as a new volume, without 
+        reading any data. 
+
+        The offset is in world units (in the same frame as the offset of this 
+        volume), the shape is in world units as well. Both are rounded to the 
+        closest voxel. An IndexError exception is raised if the region is not 
+        contained in this volume.
+
+        The data of the returned volume is a view of the data of this volume 
+        (a numpy view or a DataWindow into an HDF5 dataset), which reads data 
+        only when accessed. Its offset is the offset of the region.
+        """
+
+        resolution = np.asarray(self.resolution, dtype=np.float64)
+        begin = np.round((np.asarray(offset, dtype=np.float64) - np.asarray(self.offset, dtype=np.float64))/resolution).astype(np.int64)
+        size = np.round(np.asarray(shape, dtype=np.float64)/resolution).astype(np.int64)
+
+        if (begin < 0).any() or (size < 0).any() or (begin + size > np.array(self.data.shape)).any():
+            raise IndexError("region of interest at " + str(tuple(offset)) + " with shape " + str(tuple(shape)) + " does not lie inside volume")
+
+        if isinstance(self.data, np.ndarray):
+            data = self.data[tuple(slice(b, b + s) for (b, s) in zip(begin, size))]
+        elif isinstance(self.data, DataWindow):
+            data = DataWindow(self.data.data, np.array(self.data.begin) + begin, size)
+        else:
+            data = DataWindow(self.data, begin, size)
+
+        return Volume(
+            data,
+            resolution = self.resolution,
+            offset = tuple(np.asarray(self.offset, dtype=np.float64) + begin*resolution),
+            comment = self.comment)
+
+    def lookup(self, locations):
+        """Get the closest values of this volume to an array of locations. 
+        This is a vectorized version of `__getitem__`: Locations are in world 
+        units, relative to the volumes offset. An IndexError exception is 
+        raised if any of the locations is not contained in this volume.
+
+        If the data is an HDF5 dataset, all values are read with a single 
+        point selection, sorted by their position in the dataset (and each 
+        voxel only once).
+
+        Parameters
+        ----------
+
+            locations: array-like, shape (n, dims)
+                The locations to look up.
+
+        Returns
+        -------
+
+            An array of shape (n,) with the values at the locations.
+        """
+
+        shape = self.data.shape
+        locations = np.asarray(locations, dtype=np.float64).reshape((-1, len(shape)))
+
+        if len(locations) == 0:
+            return np.zeros((0,), dtype=self.data.dtype)
+
+        # round half away from zero, like round()
+        scaled = locations/np.asarray(self.resolution, dtype=np.float64)
+        magnitude = np.abs(scaled)
+        rounded = np.floor(magnitude)
+        rounded += (magnitude - rounded) >= 0.5
+        indices = (np.sign(scaled)*rounded).astype(np.int64)
+
+        outside = np.logical_or(indices < 0, indices >= np.array(shape)).any(axis=1)
+        if outside.any():
+            location = tuple(locations[np.flatnonzero(outside)[0]])
+            raise IndexError("location " + str(location) + " does not lie inside volume")
+
+        data = self.data
+        if isinstance(data, DataWindow):
+            indices += np.array(data.begin)
+            data = data.data
+            shape = data.shape
+
+        if not isinstance(data, h5py.Dataset):
+            return np.asarray(data[tuple(indices.T)])
+
+        # read each voxel once, in the order of the dataset
+        flat = np.ravel_multi_index(tuple(indices.T), shape)
+        (flat, inverse) = np.unique(flat, return_inverse=True)
+        points = np.array(np.unravel_index(flat, shape)).T
+
+        file_space = data.id.get_space()
+        file_space.select_elements(points)
+        memory_space = h5py.h5s.create_simple((len(flat),))
+        values = np.zeros((len(flat),), dtype=data.dtype)
+        data.id.read(memory_space, file_space, values)
+
+        return values[inverse]
+
     def __setitem__(self, location, value):
         """Set the closest value of this volume to the given location. The 
         location is in world units, relative to the volumes offset.
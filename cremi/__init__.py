@@ -1,4 +1,5 @@
 from Annotations import *
+from Confidences import *
 from Volume import *
 from io import *
 from evaluation import *
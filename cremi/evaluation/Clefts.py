@@ -1,56 +1,391 @@
+import itertools
 import numpy as np
+from multiprocessing.pool import ThreadPool
 from scipy import ndimage
+from scipy.spatial import cKDTree
+from .. import instrumentation
+from border_mask import bounded_imap
+from cache import content_hash, data_key, cached_array
+from voi import block_slices
+
+def distance_transform_at(mask, sampling, at = None):
+    """Compute the Euclidean distance transform of a mask, like
+    `scipy.ndimage.distance_transform_edt`, but only at the voxels where `at`
+    is True.
+
+    Only the feature transform (one int32 per voxel and dimension) is
+    computed for the whole volume. The distances are then evaluated section
+    by section, with the same arithmetic as scipy (i.e., the results are
+    identical), which avoids the several full-volume float64 temporaries
+    scipy allocates.
+
+    Parameters
+    ----------
+
+        mask: np.ndarray
+            The input of the distance transform. Distances are computed to the
+            closest zero voxel.
+
+        sampling: tuple of float
+            The size of a voxel in each dimension.
+
+        at: np.ndarray of bool, optional
+            Where to evaluate the distance transform. If not given, the whole
+            distance transform is returned.
+
+    Returns
+    -------
+
+        The distances at the voxels in `at`, in the order of `mask[at]`, or
+        the whole distance transform if `at` is None.
+    """
+
+    feature_transform = ndimage.distance_transform_edt(
+        mask,
+        sampling=sampling,
+        return_distances=False,
+        return_indices=True)
+    sampling = np.asarray(sampling, dtype=np.float64)
+
+    if at is None:
+        distances = np.zeros(mask.shape, dtype=np.float64)
+    else:
+        distances = np.zeros((np.count_nonzero(at),), dtype=np.float64)
+
+    begin = 0
+    for z in xrange(mask.shape[0]):
+
+        if at is None:
+            coordinates = np.indices(mask.shape[1:], dtype=np.int32)
+            coordinates = [ c.ravel() for c in coordinates ]
+            features = [ f.ravel() for f in feature_transform[:, z] ]
+        else:
+            coordinates = [ c.astype(np.int32) for c in np.nonzero(at[z]) ]
+            if len(coordinates[0]) == 0:
+                continue
+            features = [ f[at[z]] for f in feature_transform[:, z] ]
+        coordinates = [ np.full(coordinates[0].shape, z, dtype=np.int32) ] + coordinates
+
+        # sum of squared scaled offsets to the closest feature, in the order
+        # of the dimensions (as in scipy)
+        squared = np.zeros(coordinates[0].shape, dtype=np.float64)
+        for d in range(mask.ndim):
+            offset = (features[d] - coordinates[d]).astype(np.float64)
+            offset *= sampling[d]
+            offset *= offset
+            squared += offset
+
+        if at is None:
+            distances[z] = np.sqrt(squared).reshape(mask.shape[1:])
+        else:
+            end = begin + len(squared)
+            distances[begin:end] = np.sqrt(squared)
+            begin = end
+
+    return distances
 
 class Clefts:
 
-    def __init__(self, test, truth):
+    def __init__(self, test, truth, cache_dir = None, block_shape = None, max_distance = 400, n_workers = 1, cache_key = None, hash_content = False):
+        """Create a new evaluation object for synaptic clefts.
+
+        Parameters
+        ----------
+
+            test, truth: Volume
+                The test and ground truth volumes of cleft labels.
+
+            cache_dir: None or string
+                If given, the distance transform of the ground truth is stored 
+                in this directory, keyed by the ground truth and its 
+                resolution, and reused by later evaluation objects for the 
+                same ground truth. Not used if `block_shape` is given.
+
+            block_shape: None or tuple of int
+                If given, the volumes are processed in blocks of this shape 
+                (in voxels, see `voi.block_slices`), each read separately and 
+                extended by a halo of `max_distance`. Memory then depends on 
+                the block size and the number of cleft voxels, not the volume 
+                size. Blocks should be much larger than the halo, which is 
+                computed once per block.
+
+            max_distance: float
+                The halo of the blocks, in world units. Distances up to 
+                `max_distance` are computed in the blocks. The few voxels 
+                farther away from any cleft get their exact distance in a 
+                second pass, from a KD-tree over the cleft voxels of the 
+                other volume. Counts and statistics are therefore the same 
+                as without blocks. Only used if `block_shape` is given.
+
+            n_workers: int
+                Number of threads to process blocks in parallel.
+
+            cache_key: None or string
+                The key of the ground truth distance transform in 
+                `cache_dir`, as returned by `Clefts.cache_key`. Computed if 
+                not given.
+
+            hash_content: bool
+                How the ground truth is identified in `cache_dir`: by its 
+                file, dataset, file size, and modification time (the 
+                default, which does not read it, but finds a stale entry if 
+                the file is rewritten with the same size within the 
+                resolution of the modification time), or by a hash of its 
+                content (if True). See `NeuronIds`.
+        """
 
         test_clefts = test
         truth_clefts = truth
 
-        self.truth_clefts_invalid = truth_clefts.data.value == 0xfffffffffffffffe
+        self.max_distance = None
+
+        if block_shape is not None:
+
+            self.max_distance = float(max_distance)
+            with instrumentation.stage("Clefts.blockwise"):
+                (self.false_positive_distances, self.false_negative_distances) = self.__blockwise_distances(
+                    test_clefts,
+                    truth_clefts,
+                    block_shape,
+                    n_workers)
+            return
+
+        # Only the distances at cleft voxels are needed: the distances of
+        # test cleft voxels to the ground truth (false positives) and of
+        # ground truth cleft voxels to the test clefts (false negatives). The
+        # distance transforms are therefore only evaluated there, one after
+        # the other.
+
+        # read data once (works for HDF5 datasets, numpy arrays, and lazy
+        # windows into either)
+        instrumentation.count_read(test_clefts.data, "clefts")
+        instrumentation.count_read(truth_clefts.data, "clefts")
+
+        with instrumentation.stage("Clefts.masks"):
+            (test_clefts_mask, truth_clefts_mask) = self.__masks(
+                np.asarray(test_clefts.data),
+                np.asarray(truth_clefts.data))
+
+        with instrumentation.stage("Clefts.false_positive_distances"):
+            if cache_dir is not None:
+                if cache_key is None:
+                    cache_key = Clefts.cache_key(truth_clefts, hash_content)
+                truth_clefts_edt = cached_array(
+                    cache_dir,
+                    cache_key,
+                    lambda mask = truth_clefts_mask: distance_transform_at(mask, truth_clefts.resolution))
+                self.false_positive_distances = truth_clefts_edt[np.invert(test_clefts_mask)]
+                del truth_clefts_edt
+            else:
+                self.false_positive_distances = distance_transform_at(
+                    truth_clefts_mask,
+                    truth_clefts.resolution,
+                    np.invert(test_clefts_mask))
+
+        # distances of ground truth cleft voxels to the closest test cleft
+        with instrumentation.stage("Clefts.false_negative_distances"):
+            self.false_negative_distances = distance_transform_at(
+                test_clefts_mask,
+                test_clefts.resolution,
+                np.invert(truth_clefts_mask))
+        del test_clefts_mask, truth_clefts_mask
+
+    @staticmethod
+    def cache_key(truth, hash_content = False):
+        """Get the key of the distance transform of a ground truth in the 
+        cache (see `cache_dir` and `hash_content`), e.g., to compute it once 
+        for many evaluations.
+        """
+
+        key = content_hash if hash_content else data_key
+
+        return key(truth.data, "clefts_edt", tuple(truth.resolution))
+
+    @staticmethod
+    def prepare_groundtruth(truth, cache_dir, cache_key = None, hash_content = False):
+        """Compute the distance transform of the ground truth clefts and store 
+        it in `cache_dir`, unless it is stored already. Evaluation objects 
+        with the same `cache_dir` then reuse it, e.g., when evaluating many 
+        submissions in parallel.
+
+        Returns
+        -------
+
+            The distance transform, as a read-only memory map.
+        """
+
+        if cache_key is None:
+            cache_key = Clefts.cache_key(truth, hash_content)
 
-        self.test_clefts_mask = np.logical_or(test_clefts.data.value == 0xffffffffffffffff, self.truth_clefts_invalid)
-        self.truth_clefts_mask = np.logical_or(truth_clefts.data.value == 0xffffffffffffffff, self.truth_clefts_invalid)
-	
-        self.test_clefts_edt = ndimage.distance_transform_edt(self.test_clefts_mask, sampling=test_clefts.resolution)
-        self.truth_clefts_edt = ndimage.distance_transform_edt(self.truth_clefts_mask, sampling=truth_clefts.resolution)
+        return cached_array(
+            cache_dir,
+            cache_key,
+            lambda: distance_transform_at(Clefts.__truth_mask(np.asarray(truth.data)), truth.resolution))
+
+    @staticmethod
+    def __truth_mask(truth_clefts_data):
+
+        return np.logical_or(
+            truth_clefts_data == 0xffffffffffffffff,
+            truth_clefts_data == 0xfffffffffffffffe)
+
+    def __masks(self, test_clefts_data, truth_clefts_data):
+        """Get the background masks (True where there is no cleft) of test 
+        and truth. Voxels marked as invalid in the truth are background in 
+        both."""
+
+        truth_clefts_mask = Clefts.__truth_mask(truth_clefts_data)
+        test_clefts_mask = np.logical_or(
+            test_clefts_data == 0xffffffffffffffff,
+            truth_clefts_data == 0xfffffffffffffffe)
+
+        return (test_clefts_mask, truth_clefts_mask)
+
+    def __blockwise_distances(self, test_clefts, truth_clefts, block_shape, n_workers):
+
+        shape = test_clefts.data.shape
+        if truth_clefts.data.shape != shape:
+            raise ValueError("test and truth clefts have different shapes")
+
+        resolution = np.asarray(truth_clefts.resolution, dtype=np.float64)
+
+        # every voxel closer than max_distance to a voxel in the block lies
+        # within the halo
+        halo = np.ceil(self.max_distance/resolution).astype(np.int64)
+
+        def block_distances(block):
+
+            padded = tuple(
+                slice(max(0, b.start - h), min(s, b.stop + h))
+                for (b, h, s) in zip(block, halo, shape))
+            inner = tuple(
+                slice(b.start - p.start, b.stop - p.start)
+                for (b, p) in zip(block, padded))
+
+            test_clefts_data = np.asarray(test_clefts.data[padded])
+            truth_clefts_data = np.asarray(truth_clefts.data[padded])
+            instrumentation.count_read(test_clefts.data, "clefts", test_clefts_data.nbytes)
+            instrumentation.count_read(truth_clefts.data, "clefts", truth_clefts_data.nbytes)
+
+            (test_clefts_mask, truth_clefts_mask) = self.__masks(test_clefts_data, truth_clefts_data)
+            del test_clefts_data, truth_clefts_data
+
+            distances = []
+            for (mask, target_mask) in [
+                    (truth_clefts_mask, test_clefts_mask),
+                    (test_clefts_mask, truth_clefts_mask)]:
+
+                # evaluate at the target clefts inside the block only
+                at = np.zeros(mask.shape, dtype=np.bool)
+                at[inner] = np.invert(target_mask[inner])
+
+                if mask.all():
+                    # no cleft in reach (the distance transform is not
+                    # defined without any zero)
+                    values = np.full((np.count_nonzero(at),), self.max_distance)
+                else:
+                    values = distance_transform_at(mask, resolution, at)
+                    np.minimum(values, self.max_distance, out=values)
+
+                # global positions of the target clefts, to find the exact
+                # distances of clipped values later
+                positions = np.nonzero(at)
+                positions = np.ravel_multi_index(
+                    tuple(c + p.start for (c, p) in zip(positions, padded)),
+                    shape)
+
+                distances.append((positions, values))
+
+            return distances
+
+        blocks = block_slices(shape, block_shape)
+
+        if n_workers > 1:
+            pool = ThreadPool(n_workers)
+            results = bounded_imap(pool, block_distances, blocks, 2*n_workers)
+        else:
+            pool = None
+            results = itertools.imap(block_distances, blocks)
+
+        try:
+            results = list(results)
+        finally:
+            if pool is not None:
+                pool.terminate()
+                pool.join()
+
+        # the statistics do not depend on the order of the voxels, so the
+        # distances of the blocks are simply concatenated
+        positions = []
+        distances = []
+        for i in range(2):
+            positions.append(np.concatenate([ np.zeros((0,), dtype=np.int64) ] + [ r[i][0] for r in results ]).astype(np.int64))
+            distances.append(np.concatenate([ np.zeros((0,)) ] + [ r[i][1] for r in results ]))
+        del results
+
+        # the test cleft voxels are the targets of the false positive
+        # distances and the sources of the false negative distances, and vice
+        # versa for the ground truth cleft voxels
+        with instrumentation.stage("Clefts.clipped_distances"):
+            self.__exact_clipped_distances(distances[0], positions[0], positions[1], resolution, shape)
+            self.__exact_clipped_distances(distances[1], positions[1], positions[0], resolution, shape)
+
+        return tuple(distances)
+
+    def __exact_clipped_distances(self, distances, positions, sources, resolution, shape):
+        """Replace the distances that were clipped at max_distance with the 
+        exact distances of their voxels (at positions) to the closest source 
+        voxel, found with a KD-tree over all source voxels. The distances are 
+        evaluated with the same arithmetic as `distance_transform_at`."""
+
+        clipped = np.flatnonzero(distances >= self.max_distance)
+        if len(clipped) == 0:
+            return
+
+        if len(sources) == 0:
+            # there is no cleft to measure the distance to
+            distances[clipped] = np.inf
+            return
+
+        source_coordinates = np.transpose(np.unravel_index(sources, shape))
+        coordinates = np.transpose(np.unravel_index(positions[clipped], shape))
+
+        tree = cKDTree(source_coordinates*resolution)
+        (_, closest) = tree.query(coordinates*resolution)
+        features = source_coordinates[closest]
+        del tree, source_coordinates
+
+        squared = np.zeros((len(clipped),), dtype=np.float64)
+        for d in range(len(shape)):
+            offset = (features[:, d] - coordinates[:, d]).astype(np.float64)
+            offset *= resolution[d]
+            offset *= offset
+            squared += offset
+
+        distances[clipped] = np.sqrt(squared)
 
     def count_false_positives(self, threshold = 200):
 
-        mask1 = np.invert(self.test_clefts_mask)
-        mask2 = self.truth_clefts_edt > threshold
-        false_positives = self.truth_clefts_edt[np.logical_and(mask1, mask2)]
-	return false_positives.size
+        return np.count_nonzero(self.false_positive_distances > threshold)
 
     def count_false_negatives(self, threshold = 200):
 
-        mask1 = np.invert(self.truth_clefts_mask)
-        mask2 = self.test_clefts_edt > threshold
-        false_negatives = self.test_clefts_edt[np.logical_and(mask1, mask2)]
-	return false_negatives.size
+        return np.count_nonzero(self.false_negative_distances > threshold)
 
     def acc_false_positives(self):
 
-        mask = np.invert(self.test_clefts_mask)
-        false_positives = self.truth_clefts_edt[mask]
-        stats = {
-            'mean': np.mean(false_positives),
-            'std': np.std(false_positives),
-            'max': np.amax(false_positives),
-            'count': false_positives.size,
-            'median': np.median(false_positives)}
-        return stats
+        return self.__stats(self.false_positive_distances)
 
     def acc_false_negatives(self):
 
-        mask = np.invert(self.truth_clefts_mask)
-        false_negatives = self.test_clefts_edt[mask]
+        return self.__stats(self.false_negative_distances)
+
+    def __stats(self, distances):
+
         stats = {
-            'mean': np.mean(false_negatives),
-            'std': np.std(false_negatives),
-            'max': np.amax(false_negatives),
-            'count': false_negatives.size,
-            'median': np.median(false_negatives)}
+            'mean': np.mean(distances),
+            'std': np.std(distances),
+            'max': np.amax(distances),
+            'count': distances.size,
+            'median': np.median(distances)}
         return stats
-
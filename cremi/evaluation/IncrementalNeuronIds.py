@@ -0,0 +1,185 @@
+import numpy as np
+from NeuronIds import NeuronIds
+from voi import pair_counts, xlogx
+
+class IncrementalNeuronIds:
+
+    def __init__(self, groundtruth, segmentation, border_threshold = None, n_workers = 1, cache_dir = None):
+        """Create an evaluation object for neuron ids that can be updated
+        incrementally, e.g., while a segmentation is proofread.
+
+        The contingency table of the segmentation and the ground truth is
+        computed once, and kept together with the sums VOI and RAND are
+        derived from. After a change of the segmentation in a region, `update`
+        corrects these in time proportional to the size of the region.
+
+        Parameters
+        ----------
+
+            groundtruth: Volume
+                The ground truth volume containing neuron ids.
+
+            segmentation: Volume
+                The initial segmentation. A copy of it is kept, to find the
+                previous labels of updated regions.
+
+            border_threshold, n_workers, cache_dir:
+                See `NeuronIds`.
+        """
+
+        assert list(segmentation.data.shape) == list(groundtruth.data.shape)
+        assert list(segmentation.resolution) == list(groundtruth.resolution)
+
+        self.gt = NeuronIds(groundtruth, border_threshold, n_workers, cache_dir).gt
+        self.segmentation = np.array(segmentation.data)
+
+        print "Computing contingency table..."
+
+        # background (label 0) in the prepared ground truth is ignored
+        gt = np.asarray(self.gt)
+        keep = gt != 0
+        (seg_labels, gt_labels, counts) = pair_counts(self.segmentation[keep], gt[keep])
+        gt_sizes = np.bincount(np.unique(gt_labels, return_inverse=True)[1], weights=counts).astype(np.int64)
+        del gt, keep
+
+        # counts of (segmentation, ground truth) label pairs, and of
+        # segmentation labels
+        self.__pairs = dict(zip(zip(seg_labels.tolist(), gt_labels.tolist()), counts.tolist()))
+        self.__sizes = {}
+        for (seg_label, count) in zip(seg_labels.tolist(), counts.tolist()):
+            self.__sizes[seg_label] = self.__sizes.get(seg_label, 0) + count
+
+        sizes = np.array(self.__sizes.values(), dtype=np.int64)
+        labelled = np.array(self.__sizes.keys(), dtype=np.uint64) != 0
+
+        # total number of voxels (for RAND), and voxels not ignored (for VOI)
+        self.__total = self.segmentation.size
+        self.__num_voxels = int(counts.sum())
+
+        # sums of n*log2(n) over pairs, segmentation, and ground truth labels
+        # (for VOI)
+        self.__xlogx_pairs = xlogx(counts.astype(np.float64)).sum()
+        self.__xlogx_seg = xlogx(sizes.astype(np.float64)).sum()
+        self.__xlogx_gt = xlogx(gt_sizes.astype(np.float64)).sum()
+
+        # sums of squared counts over pairs, segmentation, and ground truth
+        # labels, excluding segmentation label 0, and the number of voxels with
+        # segmentation label 0 (for RAND)
+        self.__squares_pairs = int((counts[seg_labels != 0]**2).sum())
+        self.__squares_seg = int((sizes[labelled]**2).sum())
+        self.__squares_gt = int((gt_sizes**2).sum())
+        self.__unlabelled = self.__sizes.get(0, 0)
+
+    def update(self, region, labels):
+        """Change the labels of the segmentation in a region, and update the
+        evaluation accordingly.
+
+        Parameters
+        ----------
+
+            region: tuple of slice
+                The region to change, in voxels (e.g., `np.s_[10:20, 0:100,
+                50:80]`).
+
+            labels: array-like of int
+                The new labels of the region (or a single label for all
+                voxels).
+        """
+
+        old = self.segmentation[region]
+        new = np.broadcast_to(np.asarray(labels, dtype=self.segmentation.dtype), old.shape)
+        gt = np.asarray(self.gt[region])
+
+        keep = gt != 0
+        gt = gt[keep]
+
+        # the net change of the count of each label pair
+        (seg_labels, gt_labels, deltas) = pair_counts(
+            np.concatenate([old[keep], new[keep]]),
+            np.concatenate([gt, gt]),
+            np.concatenate([-np.ones(len(gt), dtype=np.int64), np.ones(len(gt), dtype=np.int64)]))
+        changed = deltas != 0
+        seg_labels = seg_labels[changed].tolist()
+        gt_labels = gt_labels[changed].tolist()
+        deltas = deltas[changed].tolist()
+
+        self.segmentation[region] = new
+
+        if len(deltas) == 0:
+            return
+
+        pairs = zip(seg_labels, gt_labels)
+        old_counts = np.array([ self.__pairs.get(pair, 0) for pair in pairs ], dtype=np.int64)
+        new_counts = old_counts + np.array(deltas, dtype=np.int64)
+        for (pair, count) in zip(pairs, new_counts.tolist()):
+            if count == 0:
+                del self.__pairs[pair]
+            else:
+                self.__pairs[pair] = count
+
+        # pair_counts sorts by segmentation label first
+        (changed_labels, starts) = np.unique(np.array(seg_labels, dtype=np.uint64), return_index=True)
+        changed_labels = changed_labels.tolist()
+        size_deltas = np.add.reduceat(np.array(deltas, dtype=np.int64), starts)
+        old_sizes = np.array([ self.__sizes.get(label, 0) for label in changed_labels ], dtype=np.int64)
+        new_sizes = old_sizes + size_deltas
+        for (label, size) in zip(changed_labels, new_sizes.tolist()):
+            if size == 0:
+                del self.__sizes[label]
+            else:
+                self.__sizes[label] = size
+
+        self.__xlogx_pairs += (xlogx(new_counts.astype(np.float64)) - xlogx(old_counts.astype(np.float64))).sum()
+        self.__xlogx_seg += (xlogx(new_sizes.astype(np.float64)) - xlogx(old_sizes.astype(np.float64))).sum()
+
+        labelled = np.array(seg_labels, dtype=np.uint64) != 0
+        self.__squares_pairs += int((new_counts[labelled]**2 - old_counts[labelled]**2).sum())
+        labelled = np.array(changed_labels, dtype=np.uint64) != 0
+        self.__squares_seg += int((new_sizes[labelled]**2 - old_sizes[labelled]**2).sum())
+        self.__unlabelled = self.__sizes.get(0, 0)
+
+    def voi(self):
+        """Get the current VOI split and merge error.
+        """
+
+        n = float(self.__num_voxels)
+        split = (self.__xlogx_gt - self.__xlogx_pairs)/n
+        merge = (self.__xlogx_seg - self.__xlogx_pairs)/n
+
+        return (split, merge)
+
+    def adapted_rand(self, all_stats = False):
+        """Get the current adapted RAND error (and precision and recall, if
+        all_stats is True).
+        """
+
+        n = float(self.__total)
+        sumA = float(self.__squares_gt)
+        sumB = self.__squares_seg + self.__unlabelled/n
+        sumAB = self.__squares_pairs + self.__unlabelled/n
+
+        precision = sumAB/sumB
+        recall = sumAB/sumA
+
+        fScore = 2.0*precision*recall/(precision + recall)
+        are = 1.0 - fScore
+
+        if all_stats:
+            return (are, precision, recall)
+        else:
+            return are
+
+    def evaluate(self):
+        """Get the current VOI split and merge, adapted RAND error, precision,
+        and recall, as a dictionary like `NeuronIds.evaluate`.
+        """
+
+        (split, merge) = self.voi()
+        (are, precision, recall) = self.adapted_rand(all_stats = True)
+
+        return {
+            'voi_split': split,
+            'voi_merge': merge,
+            'adapted_rand': are,
+            'precision': precision,
+            'recall': recall}
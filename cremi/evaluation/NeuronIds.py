@@ -1,11 +1,13 @@
 import numpy as np
+from .. import instrumentation
 from border_mask import create_border_mask
-from voi import voi
-from rand import adapted_rand
+from cache import content_hash, data_key, cached_array
+from voi import voi, vi_tables, vi_report, contingency_table, contingency_table_blockwise
+from rand import adapted_rand, adapted_rand_from_table
 
 class NeuronIds:
 
-    def __init__(self, groundtruth, border_threshold = None):
+    def __init__(self, groundtruth, border_threshold = None, n_workers = 1, cache_dir = None, cache_key = None, hash_content = False):
         """Create a new evaluation object for neuron ids against the provided ground truth.
 
         Parameters
@@ -18,6 +20,33 @@ class NeuronIds:
                 Pixels within `border_threshold` to a label border in the
                 same section will be assigned to background and ignored during
                 the evaluation.
+
+            n_workers: int
+                Number of threads to use for the computation of the border
+                mask.
+
+            cache_dir: None or string
+                If given, the border-masked ground truth is stored in this
+                directory, keyed by the ground truth, `border_threshold`, and
+                the resolution. Later evaluation objects for the same ground
+                truth reuse it as a read-only memory map instead of
+                recomputing it.
+
+            cache_key: None or string
+                The key of the ground truth in `cache_dir`, as returned by 
+                `NeuronIds.cache_key`. Computed if not given.
+
+            hash_content: bool
+                How the ground truth is identified in `cache_dir`. By default,
+                by its file, dataset, file size, and time of the last
+                modification (see `cache.data_key`), which does not read the
+                ground truth. A ground truth that is rewritten with the same
+                size within the resolution of the modification time (one
+                second on some file systems) then finds the stale entry, and a
+                copy of the file in another place is prepared again. If True,
+                the ground truth is identified by a hash of its content (see
+                `cache.content_hash`), which reads all of it once per
+                evaluation object.
         """
 
         assert groundtruth.resolution[1] == groundtruth.resolution[2], \
@@ -27,31 +56,95 @@ class NeuronIds:
         self.groundtruth = groundtruth
         self.border_threshold = border_threshold
 
+        with instrumentation.stage("NeuronIds.prepare_groundtruth"):
+
+            if cache_dir is not None:
+
+                print "Looking up ground truth in cache..."
+
+                if cache_key is None:
+                    cache_key = NeuronIds.cache_key(groundtruth, border_threshold, hash_content)
+                self.gt = cached_array(cache_dir, cache_key, lambda: self.__prepare_groundtruth(n_workers))
+
+            else:
+
+                self.gt = self.__prepare_groundtruth(n_workers)
+
+
+    @staticmethod
+    def cache_key(groundtruth, border_threshold = None, hash_content = False):
+        """Get the key of a prepared ground truth in the cache (see 
+        `cache_dir` and `hash_content`), e.g., to compute it once for many 
+        evaluations.
+        """
+
+        key = content_hash if hash_content else data_key
+
+        return key(
+            groundtruth.data,
+            "neuron_ids",
+            border_threshold,
+            tuple(groundtruth.resolution))
+
+    def __prepare_groundtruth(self, n_workers):
+
+        instrumentation.count_read(self.groundtruth.data, "neuron_ids")
+
         if self.border_threshold:
 
             print "Computing border mask..."
 
-            self.gt = np.zeros(groundtruth.data.shape, dtype=np.uint64)
-            create_border_mask(
-                groundtruth.data,
-                self.gt,
-                float(border_threshold)/groundtruth.resolution[1],
-                np.uint64(-1))
+            with instrumentation.stage("border_mask"):
+                gt = np.zeros(self.groundtruth.data.shape, dtype=np.uint64)
+                create_border_mask(
+                    self.groundtruth.data,
+                    gt,
+                    float(self.border_threshold)/self.groundtruth.resolution[1],
+                    np.uint64(-1),
+                    n_workers = n_workers)
         else:
-            self.gt = np.array(self.groundtruth.data).copy()
+            gt = np.array(self.groundtruth.data).copy()
 
         # current voi and rand implementations don't work with np.uint64(-1) as
         # background label, so we make it 0 here and bump all other labels
-        self.gt += 1
+        gt += 1
+
+        return gt
+
+    def voi(self, segmentation, block_shape = None):
+        """Compute the VOI split and merge error of a segmentation.
+
+        Parameters
+        ----------
+
+            segmentation: Volume
+                The segmentation to evaluate.
 
-    def voi(self, segmentation):
+            block_shape: None or tuple of int, in voxels
+                If given, the segmentation is streamed block by block (e.g.,
+                z-slabs with `(10, None, None)`) instead of being read into
+                memory at once. Only the segmentation is streamed: the
+                prepared ground truth is a full uint64 array, kept in memory
+                for the lifetime of this object (unless it is a memory map
+                from `cache_dir`, of which only the pages of the current
+                block are read). Peak memory is then the size of the ground
+                truth plus that of a block, instead of several times the
+                volume size.
+        """
 
         assert list(segmentation.data.shape) == list(self.groundtruth.data.shape)
         assert list(segmentation.resolution) == list(self.groundtruth.resolution)
 
         print "Computing VOI..."
 
-        return voi(np.array(segmentation.data), self.gt, ignore_groundtruth = [0])
+        instrumentation.count_read(segmentation.data, "neuron_ids")
+
+        with instrumentation.stage("NeuronIds.voi"):
+
+            if block_shape is not None:
+                return voi(segmentation.data, self.gt, ignore_groundtruth = [0], block_shape = block_shape)
+
+            return voi(np.array(segmentation.data), self.gt, ignore_groundtruth = [0])
 
     def adapted_rand(self, segmentation):
 
@@ -60,4 +153,110 @@ class NeuronIds:
 
         print "Computing RAND..."
 
-        return adapted_rand(np.array(segmentation.data), self.gt)
+        instrumentation.count_read(segmentation.data, "neuron_ids")
+
+        with instrumentation.stage("NeuronIds.adapted_rand"):
+            return adapted_rand(np.array(segmentation.data), self.gt)
+
+    def evaluate(self, segmentation, block_shape = None, top_k = None):
+        """Compute VOI split and merge, adapted RAND error, precision, and
+        recall of a segmentation.
+
+        In contrast to calling `voi` and `adapted_rand` separately, the
+        segmentation is read only once and all measures are derived from a
+        single contingency table.
+
+        Parameters
+        ----------
+
+            segmentation: Volume
+                The segmentation to evaluate.
+
+            block_shape: None or tuple of int, in voxels
+                If given, the segmentation is streamed block by block, see
+                `voi`. This bounds the memory used for the segmentation (the
+                ground truth stays in memory), but is slower than reading the
+                whole segmentation at once.
+
+            top_k: None or int
+                If given, also report the `top_k` segments of the segmentation 
+                that contribute most to the VOI merge error, and the `top_k` 
+                ground truth segments that contribute most to the VOI split 
+                error, from the same contingency table (see `voi.vi_report`).
+
+        Returns
+        -------
+
+            A dictionary with keys 'voi_split', 'voi_merge', 'adapted_rand',
+            'precision', and 'recall'. If `top_k` is given, also 'merges' and 
+            'splits': lists of dictionaries with the 'label' of a segment, its 
+            'contribution' to the error, and its 'partners', a list of the 
+            overlapping labels of the other volume and the number of 
+            overlapping voxels, largest overlap first. Voxels ignored in the 
+            ground truth (background and borders) are not counted.
+        """
+
+        assert list(segmentation.data.shape) == list(self.groundtruth.data.shape)
+        assert list(segmentation.resolution) == list(self.groundtruth.resolution)
+
+        with instrumentation.stage("NeuronIds.evaluate"):
+
+            print "Computing contingency table..."
+
+            instrumentation.count_read(segmentation.data, "neuron_ids")
+
+            # row and column 0 of the table correspond to label 0 in the
+            # segmentation and ground truth
+            with instrumentation.stage("contingency_table"):
+                if block_shape is None:
+                    (cont, seg_labels, gt_labels) = contingency_table(
+                        np.asarray(segmentation.data),
+                        np.asarray(self.gt),
+                        ignore_seg = [],
+                        ignore_gt = [],
+                        norm = False,
+                        return_labels = True)
+                else:
+                    (cont, seg_labels, gt_labels) = contingency_table_blockwise(
+                        segmentation.data,
+                        self.gt,
+                        block_shape,
+                        ignore_seg = [],
+                        ignore_gt = [],
+                        norm = False,
+                        return_labels = True)
+
+            print "Computing VOI..."
+
+            # ignore background in ground truth
+            with instrumentation.stage("voi"):
+                tables = vi_tables(cont[:,1:])
+                (hxgy, hygx) = tables[3:5]
+                (merge, split) = (hygx.sum(), hxgy.sum())
+
+            print "Computing RAND..."
+
+            with instrumentation.stage("adapted_rand"):
+                (are, precision, recall) = adapted_rand_from_table(cont.T.tocsr(), all_stats = True)
+
+            scores = {
+                'voi_split': split,
+                'voi_merge': merge,
+                'adapted_rand': are,
+                'precision': precision,
+                'recall': recall}
+
+            if top_k is not None:
+
+                print "Ranking segments..."
+
+                # undo the label bump of the ground truth
+                with instrumentation.stage("report"):
+                    (merges, splits) = vi_report(cont[:,1:], seg_labels, gt_labels[1:] - 1, top_k, tables)
+                for segment in merges + splits:
+                    segment['label'] = int(segment['label'])
+                    segment['partners'] = [ (int(label), int(count)) for (label, count) in segment['partners'] ]
+                scores['merges'] = merges
+                scores['splits'] = splits
+
+            return scores
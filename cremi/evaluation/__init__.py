@@ -1,4 +1,6 @@
 from Clefts import *
 from NeuronIds import *
+from IncrementalNeuronIds import *
 from SynapticPartners import *
 from border_mask import *
+from batch import evaluate_batch, write_results
@@ -0,0 +1,327 @@
+import csv
+import json
+import multiprocessing
+import shutil
+import tempfile
+import time
+import traceback
+from ..io import CremiFile
+from NeuronIds import NeuronIds
+from Clefts import Clefts
+from SynapticPartners import SynapticPartners
+
+all_metrics = ["neuron_ids", "clefts", "synaptic_partners"]
+
+def evaluate_batch(submissions, groundtruths, metrics = all_metrics, n_workers = None, cache_dir = None, border_threshold = None, matching_threshold = 400, output = None, hash_content = False):
+    """Evaluate many submissions on a pool of processes.
+
+    Each metric of each submission is scheduled as a separate task. Before
+    that, the border-masked neuron ids and the distance transform of the
+    clefts of each ground truth are computed once and stored in `cache_dir`,
+    from where all tasks on the same sample read them as a memory map. The
+    rest of the work on the ground truth (e.g., relabelling its neuron ids for
+    the contingency table, or reading the neuron ids for the synaptic
+    partners) is done by each task.
+
+    Parameters
+    ----------
+
+        submissions: list of string
+            The CREMI files to evaluate.
+
+        groundtruths: string or list of string
+            The ground truth file for all submissions, or one per submission.
+
+        metrics: list of string
+            Which of "neuron_ids", "clefts", and "synaptic_partners" to
+            evaluate.
+
+        n_workers: None or int
+            The number of processes to use, defaults to the number of CPUs.
+
+        cache_dir: None or string
+            The directory to store the prepared ground truth in. If not
+            given, a temporary directory is used for the duration of this
+            call.
+
+        border_threshold: None or float
+            See `NeuronIds`.
+
+        matching_threshold: float
+            See `SynapticPartners`.
+
+        output: None or string
+            If given, the results are written to this file with
+            `write_results`.
+
+        hash_content: bool
+            Identify the ground truth in `cache_dir` by a hash of its content
+            instead of its file and modification time, see `NeuronIds`. The
+            hash is computed once per ground truth, not per task.
+
+    Returns
+    -------
+
+        A list of dictionaries, one per submission and metric, in the order of
+        `submissions` and `metrics`. Each contains the submission and ground
+        truth file names, the metric, the time the evaluation took, and the
+        scores (see `evaluate_task`). If the evaluation failed, the scores are
+        replaced by an "error" entry.
+    """
+
+    if isinstance(groundtruths, basestring):
+        groundtruths = [groundtruths]*len(submissions)
+    if len(groundtruths) != len(submissions):
+        raise ValueError("need one ground truth file per submission, or a single one for all")
+    for metric in metrics:
+        if metric not in all_metrics:
+            raise ValueError("unknown metric " + str(metric))
+
+    temporary_cache_dir = None
+    if cache_dir is None:
+        cache_dir = temporary_cache_dir = tempfile.mkdtemp(prefix="cremi_cache_")
+
+    options = {
+        "cache_dir": cache_dir,
+        "border_threshold": border_threshold,
+        "matching_threshold": matching_threshold,
+        "cache_keys": cache_keys(sorted(set(groundtruths)), metrics, border_threshold, hash_content)
+    }
+
+    # the ground truth only needs preparing for metrics that use the cache
+    preparations = [
+        (None, groundtruth, metric, options)
+        for groundtruth in sorted(set(groundtruths))
+        for metric in metrics
+        if metric != "synaptic_partners"
+    ]
+    tasks = [
+        (submission, groundtruth, metric, options)
+        for (submission, groundtruth) in zip(submissions, groundtruths)
+        for metric in metrics
+    ]
+
+    pool = multiprocessing.Pool(n_workers)
+    try:
+
+        print "Preparing " + str(len(preparations)) + " ground truths..."
+        pool.map(evaluate_task, preparations, chunksize=1)
+
+        print "Evaluating " + str(len(tasks)) + " tasks..."
+        results = []
+        for result in pool.imap(evaluate_task, tasks, chunksize=1):
+            print "\t" + result["submission"] + ", " + result["metric"] + ": " + ("failed" if "error" in result else "%.1fs"%result["time"])
+            results.append(result)
+
+        pool.close()
+        pool.join()
+
+    finally:
+
+        pool.terminate()
+        if temporary_cache_dir is not None:
+            shutil.rmtree(temporary_cache_dir, ignore_errors=True)
+
+    if output is not None:
+        write_results(results, output)
+
+    return results
+
+def cache_keys(groundtruths, metrics, border_threshold = None, hash_content = False):
+    """Get the cache keys of the prepared ground truths, such that tasks do
+    not have to compute them. Returns a dictionary from ground truth file
+    to a dictionary from metric to key.
+    """
+
+    keys = {}
+
+    for groundtruth in groundtruths:
+
+        keys[groundtruth] = {}
+
+        try:
+            truth = CremiFile(groundtruth, "r")
+            try:
+                if "neuron_ids" in metrics:
+                    keys[groundtruth]["neuron_ids"] = NeuronIds.cache_key(truth.read_neuron_ids(memmap=None), border_threshold, hash_content)
+                if "clefts" in metrics:
+                    keys[groundtruth]["clefts"] = Clefts.cache_key(truth.read_clefts(memmap=None), hash_content)
+            finally:
+                truth.close()
+        except Exception:
+            # the error is reported by the tasks of this ground truth
+            pass
+
+    return keys
+
+def evaluate_task(task):
+    """Evaluate one metric of one submission.
+
+    Parameters
+    ----------
+
+        task: tuple
+            (submission, groundtruth, metric, options), where options is a
+            dictionary with "cache_dir", "border_threshold",
+            "matching_threshold", and optionally "cache_keys" (see
+            `cache_keys`). If submission is None, only the ground truth is
+            prepared (and stored in the cache directory).
+
+    Returns
+    -------
+
+        A dictionary with the file names, the metric, the time in seconds, and
+        the scores: "voi_split", "voi_merge", "adapted_rand", "precision", and
+        "recall" for neuron ids; the counts and distance statistics of false
+        positives and negatives for clefts (e.g., "false_positive_count" and
+        "false_positive_mean", and the number of test and ground truth cleft
+        voxels as "false_positive_voxels" and "false_negative_voxels");
+        "fscore" for synaptic partners.
+    """
+
+    (submission, groundtruth, metric, options) = task
+
+    result = {
+        "submission": submission,
+        "groundtruth": groundtruth,
+        "metric": metric
+    }
+
+    start = time.time()
+
+    try:
+
+        # volumes written with the "contiguous" layout are memory-mapped
+        # (memmap=None), such that the processes share the page cache
+        truth = CremiFile(groundtruth, "r")
+        test = CremiFile(submission, "r") if submission is not None else None
+        cache_key = options.get("cache_keys", {}).get(groundtruth, {}).get(metric)
+
+        try:
+
+            if metric == "neuron_ids":
+
+                evaluation = NeuronIds(
+                    truth.read_neuron_ids(memmap=None),
+                    border_threshold=options["border_threshold"],
+                    cache_dir=options["cache_dir"],
+                    cache_key=cache_key)
+                if test is not None:
+                    result.update(evaluation.evaluate(test.read_neuron_ids(memmap=None)))
+
+            elif metric == "clefts":
+
+                if test is None:
+
+                    # only the distance transform of the ground truth is
+                    # cached
+                    Clefts.prepare_groundtruth(
+                        truth.read_clefts(memmap=None),
+                        options["cache_dir"],
+                        cache_key)
+
+                else:
+
+                    evaluation = Clefts(
+                        test.read_clefts(memmap=None),
+                        truth.read_clefts(memmap=None),
+                        cache_dir=options["cache_dir"],
+                        cache_key=cache_key)
+                    result["false_positive_count"] = evaluation.count_false_positives()
+                    result["false_negative_count"] = evaluation.count_false_negatives()
+                    for (name, stats) in [
+                            ("false_positive", evaluation.acc_false_positives()),
+                            ("false_negative", evaluation.acc_false_negatives())]:
+                        for stat in sorted(stats.keys()):
+                            # not to be confused with the count of false
+                            # positives or negatives
+                            if stat == "count":
+                                result[name + "_voxels"] = stats[stat]
+                            else:
+                                result[name + "_" + stat] = stats[stat]
+
+            elif metric == "synaptic_partners":
+
+                if test is not None:
+                    evaluation = SynapticPartners(options["matching_threshold"])
+                    result["fscore"] = evaluation.fscore(
+                        test.read_annotations(),
+                        truth.read_annotations(),
+                        truth.read_neuron_ids(memmap=None))
+
+            else:
+
+                raise ValueError("unknown metric " + str(metric))
+
+        finally:
+
+            truth.close()
+            if test is not None:
+                test.close()
+
+    except Exception:
+
+        result["error"] = traceback.format_exc()
+
+    result["time"] = time.time() - start
+
+    # make numpy scalars serializable
+    for (key, value) in result.items():
+        if hasattr(value, "item"):
+            result[key] = value.item()
+
+    return result
+
+def write_results(results, filename):
+    """Write the results of `evaluate_batch` to a JSON file, or to a CSV file
+    if the filename ends with ".csv". In a CSV file, each result is a row,
+    with one column per score (empty if a score does not apply to a metric).
+    """
+
+    if filename.endswith(".csv"):
+
+        first = ["submission", "groundtruth", "metric", "time"]
+        columns = first + sorted(set(key for result in results for key in result.keys()) - set(first))
+
+        with open(filename, "wb") as f:
+            writer = csv.DictWriter(f, columns)
+            writer.writeheader()
+            for result in results:
+                writer.writerow(result)
+
+    else:
+
+        with open(filename, "w") as f:
+            json.dump(results, f, indent=2, sort_keys=True)
+
+def main(args = None):
+    """Command line interface for `evaluate_batch`."""
+
+    import argparse
+
+    parser = argparse.ArgumentParser(description="Evaluate CREMI submissions in parallel.")
+    parser.add_argument("submissions", nargs="+", help="the CREMI files to evaluate")
+    parser.add_argument("-g", "--groundtruth", required=True, action="append", help="the ground truth file, once for all submissions or once per submission")
+    parser.add_argument("-o", "--output", default="results.json", help="the JSON or CSV (*.csv) file to write the results to (default: %(default)s)")
+    parser.add_argument("-m", "--metric", action="append", choices=all_metrics, help="the metrics to evaluate (default: all)")
+    parser.add_argument("-j", "--workers", type=int, default=None, help="the number of processes (default: number of CPUs)")
+    parser.add_argument("-c", "--cache-dir", default=None, help="keep the prepared ground truth in this directory")
+    parser.add_argument("--border-threshold", type=float, default=None, help="ignore neuron id voxels within this distance (in nm) to a border")
+    parser.add_argument("--matching-threshold", type=float, default=400, help="the synaptic partner matching threshold in nm (default: %(default)s)")
+    parser.add_argument("--hash-content", action="store_true", help="identify the prepared ground truth by its content, not its file and modification time")
+    args = parser.parse_args(args)
+
+    groundtruths = args.groundtruth
+    if len(groundtruths) == 1:
+        groundtruths = groundtruths[0]
+
+    evaluate_batch(
+        args.submissions,
+        groundtruths,
+        metrics=args.metric or all_metrics,
+        n_workers=args.workers,
+        cache_dir=args.cache_dir,
+        border_threshold=args.border_threshold,
+        matching_threshold=args.matching_threshold,
+        output=args.output,
+        hash_content=args.hash_content)
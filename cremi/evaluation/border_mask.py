@@ -1,8 +1,12 @@
+import collections
+import itertools
 import h5py
 import numpy as np
 import scipy
+import scipy.ndimage
+from multiprocessing.pool import ThreadPool
 
-def create_border_mask(input_data, target, max_dist, background_label,axis=0):
+def create_border_mask(input_data, target, max_dist, background_label,axis=0, n_workers=1):
     """
     Overlay a border mask with background_label onto input data.
     A pixel is part of a border if one of its 4-neighbors has different label.
@@ -14,17 +18,54 @@ def create_border_mask(input_data, target, max_dist, background_label,axis=0):
     max_dist : int or float - Maximum distance from border for pixels to be included into the mask.
     background_label : int - Border mask will be overlayed using this label.
     axis : int - Axis of iteration (perpendicular to 2d images for which mask will be generated)
+    n_workers : int - Number of threads to process slices in parallel. Slices are written into target in order, at most
+                2*n_workers slices are processed ahead of the slice being written.
     """
-    sl = [slice(None) for d in xrange(len(target.shape))]
-
-    for z in xrange(target.shape[axis]):
+    def section(z):
+        sl = [slice(None) for d in xrange(len(target.shape))]
         sl[ axis ] = z
-        border = create_border_mask_2d(input_data[tuple(sl)], max_dist)
-        target_slice = input_data[tuple(sl)] if isinstance(input_data,h5py.Dataset) else np.copy(input_data[tuple(sl)]) 
+        return tuple(sl)
+
+    def mask_section(z):
+        image = input_data[section(z)]
+        border = create_border_mask_2d(image, max_dist)
+        target_slice = image if isinstance(input_data,h5py.Dataset) else np.copy(image)
         target_slice[border] = background_label
-        target[tuple(sl)] = target_slice
+        return target_slice
+
+    sections = xrange(target.shape[axis])
+
+    if n_workers > 1:
+        pool = ThreadPool(n_workers)
+        masked_sections = bounded_imap(pool, mask_section, sections, 2*n_workers)
+    else:
+        pool = None
+        masked_sections = itertools.imap(mask_section, sections)
+
+    try:
+        for (z, target_slice) in itertools.izip(sections, masked_sections):
+            target[section(z)] = target_slice
+    finally:
+        if pool is not None:
+            pool.terminate()
+            pool.join()
+
+def bounded_imap(pool, function, items, max_pending):
+    """
+    Like pool.imap, but submit at most max_pending items ahead of the result that is consumed, such that results do not
+    pile up in memory if the consumer is slower than the workers (pool.imap submits all items at once).
+    """
+    pending = collections.deque()
 
-def create_and_write_masked_neuron_ids(in_file, out_file, max_dist, background_label, overwrite=False):
+    for item in items:
+        if len(pending) == max_pending:
+            yield pending.popleft().get()
+        pending.append(pool.apply_async(function, (item,)))
+
+    while pending:
+        yield pending.popleft().get()
+
+def create_and_write_masked_neuron_ids(in_file, out_file, max_dist, background_label, overwrite=False, n_workers=1):
     """
     Overlay a border mask with background_label onto input data loaded from in_file and write into out_file.
     A pixel is part of a border if one of its 4-neighbors has different label.
@@ -36,6 +77,7 @@ def create_and_write_masked_neuron_ids(in_file, out_file, max_dist, background_l
     max_dist : int or float - Maximum distance from border for pixels to be included into the mask.
     background_label : int - Border mask will be overlayed using this label.
     overwrite : bool - Overwrite existing data in out_file (True) or do nothing if data is present in out_file (False).
+    n_workers : int - Number of threads to process slices in parallel.
     """
     if ( not in_file.has_neuron_ids() ) or ( (not overwrite) and out_file.has_neuron_ids() ):
         return
@@ -58,9 +100,9 @@ def create_and_write_masked_neuron_ids(in_file, out_file, max_dist, background_l
     if offset != (0.0, 0.0, 0.0):
         target.attrs["offset"] = offset
 	
-    create_border_mask(neuron_ids, target, max_dist, background_label)
+    create_border_mask(neuron_ids, target, max_dist, background_label, n_workers=n_workers)
 
-def create_border_mask_2d(image, max_dist):
+def create_border_mask_2d(image, max_dist, method='auto'):
     """
     Create binary border mask for image.
     A pixel is part of a border if one of its 4-neighbors has different label.
@@ -69,6 +111,9 @@ def create_border_mask_2d(image, max_dist):
     ----------
     image : numpy.ndarray - Image containing integer labels.
     max_dist : int or float - Maximum distance from border for pixels to be included into the mask.
+    method : string - 'edt' to threshold a full Euclidean distance transform, 'dilation' to dilate the border pixels
+             with a disk of radius max_dist (same result, faster for small max_dist), or 'auto' to use 'dilation' for
+             max_dist up to MAX_DILATION_DIST.
 
     Returns
     -------
@@ -83,6 +128,14 @@ def create_border_mask_2d(image, max_dist):
         np.logical_and( image == padded[1:-1, :-2], image == padded[1:-1, 2:] )
         )
 
+    if method == 'auto':
+        method = 'dilation' if max_dist <= MAX_DILATION_DIST else 'edt'
+
+    # without any border, the EDT does not measure distances to a border, so
+    # the dilation would not give the same result
+    if method == 'dilation' and not border_pixels.all():
+        return dilate_with_disk(np.logical_not(border_pixels), max_dist)
+
     distances = scipy.ndimage.distance_transform_edt(
         border_pixels,
         return_distances=True,
@@ -90,4 +143,55 @@ def create_border_mask_2d(image, max_dist):
         )
 
     return distances <= max_dist
-    
+
+# largest max_dist (in pixels) for which create_border_mask_2d uses a dilation
+# instead of an EDT by default (see benchmarks/bench_border_mask.py)
+MAX_DILATION_DIST = 64
+
+def dilate_with_disk(mask, radius):
+    """
+    Dilate a binary 2D mask with a disk of the given radius, i.e., find all pixels whose Euclidean distance to a pixel
+    in mask is at most radius. Distances are evaluated exactly as in scipy.ndimage.distance_transform_edt, such that
+    the result is identical to thresholding the EDT of the inverted mask.
+
+    The disk is decomposed into horizontal runs: the mask is dilated horizontally with increasing widths, and each
+    width is shifted vertically to all rows of the disk that have this width. This needs O(radius) vectorized boolean
+    operations on the image.
+
+    Parameters
+    ----------
+    mask : numpy.ndarray - Binary 2D mask.
+    radius : int or float - Radius of the disk.
+
+    Returns
+    -------
+    dilated : numpy.ndarray - Dilated binary mask. Same shape as mask.
+    """
+    r = int(np.floor(radius))
+    offsets = np.arange(r + 1)
+
+    # half width of the disk in each row dy
+    widths = [
+        np.count_nonzero(np.sqrt(float(dy*dy) + (offsets*offsets).astype(np.float64)) <= radius) - 1
+        for dy in offsets ]
+
+    dilated = np.zeros(mask.shape, dtype=np.bool)
+    horizontal = mask.copy()
+
+    for w in xrange(widths[0] + 1):
+
+        if w > 0:
+            horizontal[:, w:] |= mask[:, :-w]
+            horizontal[:, :-w] |= mask[:, w:]
+
+        for dy in offsets:
+            if widths[dy] != w:
+                continue
+            if dy == 0:
+                dilated |= horizontal
+            else:
+                dilated[dy:, :] |= horizontal[:-dy, :]
+                dilated[:-dy, :] |= horizontal[dy:, :]
+
+    return dilated
+
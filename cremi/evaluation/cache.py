@@ -0,0 +1,154 @@
+import hashlib
+import mmap
+import os
+import h5py
+import numpy as np
+from ..Volume import DataWindow
+
+def content_hash(data, *args):
+    """Compute a hash of the content of an array or h5py dataset.
+
+    The data is read section by section (along the first axis), such that
+    h5py datasets do not have to fit into memory.
+
+    Parameters
+    ----------
+
+        data: np.ndarray or h5py.Dataset
+            The data to hash.
+
+        args: optional
+            Additional values to include in the hash (e.g., parameters of a
+            computation on `data`). Their string representations are hashed.
+
+    Returns
+    -------
+
+        A hex string.
+    """
+
+    h = hashlib.sha1()
+    h.update(str(np.dtype(data.dtype)))
+    h.update(str(tuple(data.shape)))
+    for arg in args:
+        h.update(str(arg))
+
+    if len(data.shape) == 0:
+        h.update(np.ascontiguousarray(data[()]).tobytes())
+    else:
+        for z in xrange(data.shape[0]):
+            h.update(np.ascontiguousarray(data[z]).tobytes())
+
+    return h.hexdigest()
+
+def data_key(data, *args):
+    """Compute a key identifying an array or h5py dataset, without reading
+    it (if possible).
+
+    h5py datasets and memory maps are identified by their file (path, size,
+    and time of the last modification) and their location in it, windows
+    into them by their region. Only arrays in memory are identified by their
+    content (see `content_hash`).
+
+    Parameters
+    ----------
+
+        data: np.ndarray, np.memmap, h5py.Dataset, or DataWindow
+            The data to identify.
+
+        args: optional
+            Additional values to include in the key (e.g., parameters of a
+            computation on `data`).
+
+    Returns
+    -------
+
+        A hex string.
+    """
+
+    h = hashlib.sha1()
+    h.update(str(np.dtype(data.dtype)))
+    h.update(str(tuple(data.shape)))
+    for arg in args:
+        h.update(str(arg))
+
+    location = file_location(data)
+    if location is None:
+        h.update(content_hash(data))
+    else:
+        h.update(str(location))
+
+    return h.hexdigest()
+
+def file_location(data):
+    """Get the file and the location in it of an h5py dataset, memory map, or
+    a window into either. Returns None for other data, e.g., arrays in
+    memory.
+    """
+
+    if isinstance(data, DataWindow):
+        location = file_location(data.data)
+        return None if location is None else (location, data.begin, data.shape)
+
+    if isinstance(data, h5py.Dataset):
+        (filename, name) = (data.file.filename, data.name)
+    elif isinstance(data, np.memmap) and isinstance(data.base, mmap.mmap):
+        # views of a memory map have a memory map as base
+        (filename, name) = (data.filename, data.offset)
+    else:
+        return None
+
+    filename = os.path.realpath(filename)
+    stat = os.stat(filename)
+
+    return (filename, name, stat.st_size, repr(stat.st_mtime))
+
+def cached_array(cache_dir, key, compute):
+    """Get an array from an on-disk cache, or compute and store it.
+
+    Arrays are stored as .npy files in `cache_dir` and returned as read-only
+    memory maps, such that repeated requests (also from other processes) are
+    served without reading the whole array.
+
+    Parameters
+    ----------
+
+        cache_dir: string
+            The directory to store the cached arrays in. Will be created if it
+            does not exist.
+
+        key: string
+            A key identifying the array, e.g., from `data_key`.
+
+        compute: callable
+            A function without arguments returning the array. Only called if
+            the array is not cached yet.
+
+    Returns
+    -------
+
+        A read-only np.memmap of the array.
+    """
+
+    if not os.path.isdir(cache_dir):
+        try:
+            os.makedirs(cache_dir)
+        except OSError:
+            # created concurrently
+            if not os.path.isdir(cache_dir):
+                raise
+
+    filename = os.path.join(cache_dir, key + ".npy")
+
+    if not os.path.exists(filename):
+
+        array = compute()
+
+        # write to a temporary file first, such that concurrent readers never
+        # see a partially written array
+        tmp_filename = filename + ".%d.tmp"%os.getpid()
+        with open(tmp_filename, "wb") as f:
+            np.save(f, array)
+        os.rename(tmp_filename, filename)
+
+    return np.load(filename, mmap_mode='r')
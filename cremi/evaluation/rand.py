@@ -2,6 +2,7 @@
 
 import numpy as np
 import scipy.sparse as sparse
+from relabel import relabel
 
 # Evaluation code courtesy of Juan Nunez-Iglesias, taken from
 # https://github.com/janelia-flyem/gala/blob/master/gala/evaluate.py
@@ -37,17 +38,41 @@ def adapted_rand(seg, gt, all_stats=False):
     [1]: http://brainiac2.mit.edu/SNEMI3D/evaluation
     """
     # segA is truth, segB is query
-    segA = np.ravel(gt)
-    segB = np.ravel(seg)
+    # compact labels, such that the size of the contingency table does not
+    # depend on the largest label (label 0 stays 0)
+    (segA, labels_A) = relabel(np.ravel(gt))
+    (segB, labels_B) = relabel(np.ravel(seg))
     n = segA.size
 
-    n_labels_A = np.amax(segA) + 1
-    n_labels_B = np.amax(segB) + 1
+    n_labels_A = len(labels_A)
+    n_labels_B = len(labels_B)
 
     ones_data = np.ones(n)
 
     p_ij = sparse.csr_matrix((ones_data, (segA[:], segB[:])), shape=(n_labels_A, n_labels_B))
 
+    return adapted_rand_from_table(p_ij, all_stats)
+
+def adapted_rand_from_table(p_ij, all_stats=False):
+    """Compute Adapted Rand error from a contingency table.
+
+    Parameters
+    ----------
+    p_ij : scipy.sparse.csr_matrix
+        The (not normalized) contingency table, where `p_ij[i, j]` is the
+        number of points labelled `i` in the groundtruth and `j` in the
+        segmentation. Row and column 0 have to correspond to label 0 in the
+        groundtruth and segmentation, respectively (they can be empty).
+    all_stats : boolean, optional
+        whether to also return precision and recall as a 3-tuple with rand_error
+
+    Returns
+    -------
+    See `adapted_rand`.
+    """
+    (n_labels_A, n_labels_B) = p_ij.shape
+    n = p_ij.sum()
+
     a = p_ij[1:n_labels_A,:]
     b = p_ij[1:n_labels_A,1:n_labels_B]
     c = p_ij[1:n_labels_A,0].todense()
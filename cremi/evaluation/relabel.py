@@ -0,0 +1,50 @@
+import numpy as np
+
+def relabel(labels):
+    """Map the labels of an array to a dense range, such that memory and
+    running time of subsequent operations depend on the number of distinct
+    labels, not on the value of the largest label.
+
+    Label 0 is always mapped to 0 (even if it does not appear in `labels`),
+    the remaining labels are mapped to 1, 2, ... in increasing order.
+
+    Parameters
+    ----------
+    labels : np.ndarray, non-negative int type, arbitrary shape
+        The labels to compact.
+
+    Returns
+    -------
+    (relabelled, original) : np.ndarray
+        The compacted labels (same shape as `labels`), and the original label
+        of each compacted label, i.e., `original[relabelled] == labels`.
+    """
+    labels = np.asarray(labels)
+    shape = labels.shape
+    labels = labels.ravel()
+
+    if labels.size == 0:
+        return (np.zeros(shape, dtype=np.intp), np.zeros((1,), dtype=labels.dtype))
+
+    max_label = np.amax(labels)
+
+    if max_label <= labels.size:
+
+        # labels are dense enough to use a lookup table, which is linear in
+        # the number of elements (in contrast to the sort in np.unique)
+        present = np.zeros((int(max_label) + 1,), dtype=np.bool)
+        present[labels] = True
+        present[0] = True
+
+        original = np.flatnonzero(present).astype(labels.dtype)
+        mapping = np.cumsum(present, dtype=np.intp) - 1
+        relabelled = mapping[labels]
+
+    else:
+
+        (original, relabelled) = np.unique(
+            np.append(np.zeros((1,), dtype=labels.dtype), labels),
+            return_inverse=True)
+        relabelled = relabelled[1:]
+
+    return (relabelled.reshape(shape), original)
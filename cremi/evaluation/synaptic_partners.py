@@ -1,6 +1,10 @@
 # coding=utf-8
 from scipy.optimize import linear_sum_assignment
+from scipy.sparse.csgraph import connected_components
+from scipy.spatial import cKDTree
+import scipy.sparse as sparse
 import numpy as np
+from .. import instrumentation
 
 def synaptic_partners_fscore(rec_annotations, gt_annotations, gt_segmentation, matching_threshold = 400, all_stats = False):
     """Compute the f-score of the found synaptic partners.
@@ -35,15 +39,14 @@ def synaptic_partners_fscore(rec_annotations, gt_annotations, gt_segmentation, m
         The indices of the matches with matching costs.
     """
 
-    # get cost matrix
-    costs = cost_matrix(rec_annotations, gt_annotations, gt_segmentation, matching_threshold)
+    # get costs of potential matches
+    with instrumentation.stage("SynapticPartners.matching_costs"):
+        (rec_indices, gt_indices, costs) = matching_costs(rec_annotations, gt_annotations, gt_segmentation, matching_threshold)
 
     # match using Hungarian method
     print "Finding cost-minimal matches..."
-    matches = linear_sum_assignment(costs - np.amax(costs) - 1)
-    matches = zip(matches[0], matches[1])  # scipy returns matches as numpy arrays
-
-    filtered_matches = [ (i,j, costs[i][j]) for (i,j) in matches if costs[i][j] <= matching_threshold ]
+    with instrumentation.stage("SynapticPartners.cost_minimal_matches"):
+        filtered_matches = cost_minimal_matches(rec_indices, gt_indices, costs, matching_threshold)
     print str(len(filtered_matches)) + " matches found"
 
     # unmatched in rec = FP
@@ -64,8 +67,94 @@ def synaptic_partners_fscore(rec_annotations, gt_annotations, gt_segmentation, m
     else:
         return fscore
 
+def cost_minimal_matches(rec_indices, gt_indices, costs, matching_threshold):
+    """Find the cost-minimal one-to-one matching between rec and gt partners,
+    given the costs of their potential matches (see `matching_costs`).
+
+    This gives the same matches as the Hungarian method on the full (padded)
+    cost matrix, where all other pairs have a cost of `2*matching_threshold`:
+    Minimizing the total cost is equivalent to a maximum weight matching on
+    the bipartite graph of potential matches, which decomposes into its
+    connected components. Each component is solved independently on a small
+    dense cost matrix.
+
+    Returns
+    -------
+
+    matches: list of tuples
+        The indices of the matches with matching costs, sorted by rec index.
+    """
+
+    if len(costs) == 0:
+        return []
+
+    max_cost = 2*matching_threshold
+
+    # bipartite graph of potential matches, nodes are the involved rec
+    # annotations followed by the involved gt annotations
+    (rec_nodes, rec_local) = np.unique(rec_indices, return_inverse=True)
+    (gt_nodes, gt_local) = np.unique(gt_indices, return_inverse=True)
+    num_nodes = len(rec_nodes) + len(gt_nodes)
+    graph = sparse.coo_matrix(
+        (np.ones(len(costs)), (rec_local, len(rec_nodes) + gt_local)),
+        shape=(num_nodes, num_nodes))
+    (_, components) = connected_components(graph, directed=False)
+
+    # group edges by component
+    edge_components = components[rec_local]
+    order = np.argsort(edge_components, kind='mergesort')
+    splits = np.flatnonzero(np.diff(edge_components[order])) + 1
+
+    matches = []
+    for edges in np.split(order, splits):
+
+        if len(edges) == 1:
+            e = edges[0]
+            matches.append((rec_indices[e], gt_indices[e], costs[e]))
+            continue
+
+        (rows, local_rows) = np.unique(rec_indices[edges], return_inverse=True)
+        (cols, local_cols) = np.unique(gt_indices[edges], return_inverse=True)
+
+        size = max(len(rows), len(cols))
+        component_costs = np.zeros((size, size), dtype=np.float)
+        component_costs[:] = max_cost
+        component_costs[local_rows, local_cols] = costs[edges]
+
+        component_matches = linear_sum_assignment(component_costs - np.amax(component_costs) - 1)
+
+        for (i, j) in zip(component_matches[0], component_matches[1]):
+            if component_costs[i][j] <= matching_threshold:
+                matches.append((rows[i], cols[j], component_costs[i][j]))
+
+    matches.sort()
+
+    return matches
+
 def cost_matrix(rec, gt, gt_segmentation, matching_threshold):
 
+    (rec_indices, gt_indices, candidate_costs) = matching_costs(rec, gt, gt_segmentation, matching_threshold)
+
+    size = max(len(rec.pre_post_partners), len(gt.pre_post_partners))
+    costs = np.zeros((size, size), dtype=np.float)
+    costs[:] = 2*matching_threshold
+    costs[rec_indices, gt_indices] = candidate_costs
+
+    return costs
+
+def matching_costs(rec, gt, gt_segmentation, matching_threshold):
+    """Sparse alternative to `cost_matrix`: Get the costs of all potential
+    matches, i.e., of the pairs whose cost is at most `matching_threshold`.
+    All other pairs have a cost of `2*matching_threshold`.
+
+    Returns
+    -------
+
+    (rec_indices, gt_indices, costs): tuple of np.ndarray
+        The indices of the potential matches in `rec.pre_post_partners` and
+        `gt.pre_post_partners`, and their costs.
+    """
+
     print "Computing matching costs..."
 
     rec_locations = pre_post_locations(rec, gt_segmentation)
@@ -74,20 +163,76 @@ def cost_matrix(rec, gt, gt_segmentation, matching_threshold):
     rec_labels = pre_post_labels(rec_locations, gt_segmentation)
     gt_labels = pre_post_labels(gt_locations, gt_segmentation)
 
-    size = max(len(rec_locations), len(gt_locations))
-    costs = np.zeros((size, size), dtype=np.float)
-    costs[:] = 2*matching_threshold
-    num_potential_matches = 0
-    for i in range(len(rec_locations)):
-        for j in range(len(gt_locations)):
-            c = cost(rec_locations[i], gt_locations[j], rec_labels[i], gt_labels[j], matching_threshold)
-            costs[i,j] = c
-            if c <= matching_threshold:
-                num_potential_matches += 1
+    # (n, 2, 3) arrays of pre- and post-synaptic locations, and (n, 2) arrays
+    # of pre- and post-synaptic labels
+    candidates = potential_matches(
+        np.array(rec_locations, dtype=np.float64).reshape((-1, 2, 3)),
+        np.array(gt_locations, dtype=np.float64).reshape((-1, 2, 3)),
+        np.array(rec_labels).reshape((-1, 2)),
+        np.array(gt_labels).reshape((-1, 2)),
+        matching_threshold)
+
+    # the exact costs of the candidates are computed with the scalar cost
+    # function, to get exactly the same result (the rounding of
+    # np.linalg.norm differs from a vectorized computation)
+    costs = np.array([
+        cost(rec_locations[i], gt_locations[j], rec_labels[i], gt_labels[j], matching_threshold)
+        for (i, j) in zip(*candidates) ], dtype=np.float)
+    costs = costs.reshape((-1,))
+
+    potential = costs <= matching_threshold
+    print str(np.count_nonzero(potential)) + " potential matches found"
+
+    return (candidates[0][potential], candidates[1][potential], costs[potential])
+
+def potential_matches(pre_post_locations1, pre_post_locations2, labels1, labels2, matching_threshold):
+    """Find all pairs of two sets of pre/post locations that can have a cost
+    of at most `matching_threshold`, i.e., that link the same segments and
+    whose pre- and post-synaptic sites are close enough.
+
+    Candidate pairs are found with a spatial index over the pre-synaptic
+    locations, such that only pairs with close pre-synaptic sites are
+    considered. Since distances are subject to different rounding than in
+    `cost`, a small tolerance is added: the returned pairs are a superset of
+    the pairs with cost at most `matching_threshold`.
+
+    Parameters
+    ----------
 
-    print str(num_potential_matches) + " potential matches found"
+    pre_post_locations1, pre_post_locations2: np.ndarray, shape (n, 2, 3) and (m, 2, 3)
+        The pre- and post-synaptic locations.
 
-    return costs
+    labels1, labels2: np.ndarray, shape (n, 2) and (m, 2)
+        The pre- and post-synaptic labels.
+
+    matching_threshold: float, world units
+
+    Returns
+    -------
+
+    (i, j): tuple of np.ndarray
+        The indices of the potential matches in the first and second set.
+    """
+
+    if len(pre_post_locations1) == 0 or len(pre_post_locations2) == 0:
+        return (np.zeros((0,), dtype=np.int), np.zeros((0,), dtype=np.int))
+
+    max_dist = matching_threshold*(1.0 + 1e-9)
+
+    pre_tree1 = cKDTree(pre_post_locations1[:,0])
+    pre_tree2 = cKDTree(pre_post_locations2[:,0])
+    pairs = pre_tree1.sparse_distance_matrix(pre_tree2, max_dist, output_type='ndarray')
+    (i, j) = (pairs['i'].astype(np.int), pairs['j'].astype(np.int))
+
+    # pairs have to link the same segments
+    keep = np.logical_and(
+        labels1[i,0] == labels2[j,0],
+        labels1[i,1] == labels2[j,1])
+
+    post_diff = pre_post_locations1[i,1] - pre_post_locations2[j,1]
+    keep &= np.sqrt(np.einsum('ij,ij->i', post_diff, post_diff)) <= max_dist
+
+    return (i[keep], j[keep])
 
 def pre_post_locations(annotations, gt_segmentation):
     """Get the locations of the annotations relative to the ground truth offset."""
@@ -101,7 +246,10 @@ def pre_post_locations(annotations, gt_segmentation):
 
 def pre_post_labels(locations, segmentation):
 
-    return [ (segmentation[pre], segmentation[post]) for (pre, post) in locations ]
+    # look up all pre- and post-synaptic locations at once
+    labels = segmentation.lookup(np.array(locations, dtype=np.float64).reshape((-1, 3)))
+
+    return [ (pre, post) for (pre, post) in labels.reshape((-1, 2)) ]
 
 
 def cost(pre_post_location1, pre_post_location2, labels1, labels2, matching_threshold):
@@ -3,10 +3,12 @@
 # Evaluation code courtesy of Juan Nunez-Iglesias, taken from
 # https://github.com/janelia-flyem/gala/blob/master/gala/evaluate.py
 
+import itertools
 import numpy as np
 import scipy.sparse as sparse
+from relabel import relabel
 
-def voi(reconstruction, groundtruth, ignore_reconstruction=[], ignore_groundtruth=[0]):
+def voi(reconstruction, groundtruth, ignore_reconstruction=[], ignore_groundtruth=[0], block_shape=None):
     """Return the conditional entropies of the variation of information metric. [1]
 
     Let X be a reconstruction, and Y a ground truth labelling. The variation of 
@@ -27,6 +29,11 @@ def voi(reconstruction, groundtruth, ignore_reconstruction=[], ignore_groundtrut
     ignore_seg, ignore_gt : list of int, optional
         Any points having a label in this list are ignored in the evaluation.
         By default, only the label 0 in the ground truth will be ignored.
+    block_shape : tuple of int, optional
+        If given, `seg` and `gt` are read block by block (e.g., z-slabs with
+        `(10, None, None)`) and the contingency table is accumulated
+        incrementally, see `contingency_table_blockwise`. This allows `seg`
+        and `gt` to be h5py datasets larger than memory.
 
     Returns
     -------
@@ -38,7 +45,11 @@ def voi(reconstruction, groundtruth, ignore_reconstruction=[], ignore_groundtrut
     [1] Meila, M. (2007). Comparing clusterings - an information based 
     distance. Journal of Multivariate Analysis 98, 873-895.
     """
-    (hyxg, hxgy) = split_vi(reconstruction, groundtruth, ignore_reconstruction, ignore_groundtruth)
+    if block_shape is None:
+        (hyxg, hxgy) = split_vi(reconstruction, groundtruth, ignore_reconstruction, ignore_groundtruth)
+    else:
+        cont = contingency_table_blockwise(reconstruction, groundtruth, block_shape, ignore_reconstruction, ignore_groundtruth)
+        (hyxg, hxgy) = split_vi(cont)
     return (hxgy, hyxg)
 
 def split_vi(x, y=None, ignore_x=[0], ignore_y=[0]):
@@ -131,7 +142,66 @@ def vi_tables(x, y=None, ignore_x=[0], ignore_y=[0]):
 
     return [pxy] + list(map(np.asarray, [px, py, hxgy, hygx, lpygx, lpxgy]))
 
-def contingency_table(seg, gt, ignore_seg=[0], ignore_gt=[0], norm=True):
+def vi_report(cont, seg_labels, gt_labels, top_k=10, tables=None):
+    """Rank segments by their contribution to the VI split and merge error.
+
+    The merge error H(Y|X) is the sum of the per-segment terms `hygx` over
+    the segments of the candidate segmentation X, and the split error H(X|Y)
+    the sum of `hxgy` over the segments of the ground truth Y (see
+    `vi_tables`). This returns the segments with the largest terms, together
+    with the segments they overlap with.
+
+    Parameters
+    ----------
+    cont : scipy.sparse.csc_matrix
+        The contingency table, with the candidate segmentation as rows and the
+        ground truth as columns (normalized or not).
+    seg_labels, gt_labels : np.ndarray
+        The label of each row and column of `cont`.
+    top_k : int, optional
+        How many segments to report for each error.
+    tables : list, optional
+        The result of `vi_tables(cont)`, if already computed.
+
+    Returns
+    -------
+    (merges, splits) : list of dict
+        The `top_k` segments of the candidate segmentation with the largest
+        merge contribution, and of the ground truth with the largest split
+        contribution, in decreasing order. Each entry has the keys 'label',
+        'contribution' (the segment's term of the error), and 'partners' (a
+        list of the overlapping labels of the other segmentation and their
+        overlap as given in `cont`, in decreasing order of the overlap).
+    """
+    if tables is None:
+        tables = vi_tables(cont)
+    _, _, _, hxgy, hygx, _, _ = tables
+
+    cont = sparse.csc_matrix(cont)
+    rows = cont.tocsr()
+
+    def ranked(contributions, labels, table, partner_labels):
+        order = np.argsort(-contributions, kind='mergesort')[:top_k]
+        report = []
+        for i in order:
+            if contributions[i] <= 0:
+                break
+            begin, end = table.indptr[i], table.indptr[i + 1]
+            partners = table.indices[begin:end]
+            counts = table.data[begin:end]
+            overlap = np.argsort(-counts, kind='mergesort')
+            report.append({
+                'label': labels[i],
+                'contribution': contributions[i],
+                'partners': [ (partner_labels[partners[j]], counts[j]) for j in overlap ]})
+        return report
+
+    merges = ranked(hygx, seg_labels, rows, gt_labels)
+    splits = ranked(hxgy, gt_labels, cont, seg_labels)
+
+    return (merges, splits)
+
+def contingency_table(seg, gt, ignore_seg=[0], ignore_gt=[0], norm=True, return_labels=False):
     """Return the contingency table for all regions in matched segmentations.
 
     Parameters
@@ -148,13 +218,21 @@ def contingency_table(seg, gt, ignore_seg=[0], ignore_gt=[0], norm=True):
         will not contribute to the contingency table. (default: [0])
     norm : bool, optional
         Whether to normalize the table so that it sums to 1.
+    return_labels : bool, optional
+        Whether to also return the labels of the rows and columns.
 
     Returns
     -------
     cont : scipy.sparse.csc_matrix
         A contingency table. `cont[i, j]` will equal the number of voxels
-        labeled `i` in `seg` and `j` in `gt`. (Or the proportion of such voxels
-        if `norm=True`.)
+        labeled `seg_labels[i]` in `seg` and `gt_labels[j]` in `gt`. (Or the
+        proportion of such voxels if `norm=True`.) The labels are compacted
+        (see `relabel`), such that the size of the table depends on the
+        number of distinct labels, not their values. Row and column 0
+        correspond to label 0.
+    seg_labels, gt_labels : np.ndarray, optional
+        The label of each row and column of `cont`. (Only returned when
+        `return_labels` is ``True``.)
     """
     segr = seg.ravel() 
     gtr = gt.ravel()
@@ -165,11 +243,142 @@ def contingency_table(seg, gt, ignore_seg=[0], ignore_gt=[0], norm=True):
     for j in ignore_gt:
         ignored[gtr == j] = True
     data[ignored] = 0
-    cont = sparse.coo_matrix((data, (segr, gtr))).tocsc()
+    (segr, seg_labels) = relabel(segr)
+    (gtr, gt_labels) = relabel(gtr)
+    cont = sparse.coo_matrix(
+        (data, (segr, gtr)),
+        shape=(len(seg_labels), len(gt_labels))).tocsc()
+    if norm:
+        cont /= float(cont.sum())
+    if return_labels:
+        return (cont, seg_labels, gt_labels)
+    return cont
+
+def contingency_table_blockwise(seg, gt, block_shape, ignore_seg=[0], ignore_gt=[0], norm=True, return_labels=False):
+    """Return a compact contingency table, accumulated block by block.
+
+    Only one block of `seg` and `gt` is held in memory at a time, such that
+    both can be h5py datasets larger than the available memory. The table is
+    kept as a list of distinct label pairs with their counts, and converted
+    into a sparse matrix only at the end. Rows and columns of the returned
+    matrix correspond to the sorted distinct labels of `seg` and `gt`,
+    respectively (i.e., the labels are compacted, see `relabel`). Row and
+    column 0 always correspond to label 0, even if it does not appear in `seg`
+    or `gt`.
+
+    Parameters
+    ----------
+    seg : np.ndarray or h5py.Dataset, int type, arbitrary shape
+        A candidate segmentation.
+    gt : np.ndarray or h5py.Dataset, int type, same shape as `seg`
+        The ground truth segmentation.
+    block_shape : tuple of int or None
+        The shape of the blocks to process at a time. `None` entries span the
+        whole extent of the respective dimension, e.g., `(10, None, None)`
+        processes z-slabs of 10 sections.
+    ignore_seg, ignore_gt : list of int, optional
+        Values to ignore in `seg` and `gt`, see `contingency_table`.
+    norm : bool, optional
+        Whether to normalize the table so that it sums to 1.
+    return_labels : bool, optional
+        Whether to also return the labels of the rows and columns.
+
+    Returns
+    -------
+    cont : scipy.sparse.csc_matrix
+        The compacted contingency table.
+    seg_labels, gt_labels : np.ndarray, optional
+        The label of each row and column of `cont`. (Only returned when
+        `return_labels` is ``True``.)
+    """
+    seg_labels = np.zeros((0,), dtype=np.uint64)
+    gt_labels = np.zeros((0,), dtype=np.uint64)
+    counts = np.zeros((0,), dtype=np.int64)
+
+    for block in block_slices(seg.shape, block_shape):
+
+        segr = np.asarray(seg[block]).ravel()
+        gtr = np.asarray(gt[block]).ravel()
+
+        ignored = np.zeros(segr.shape, np.bool)
+        for i in ignore_seg:
+            ignored[segr == i] = True
+        for j in ignore_gt:
+            ignored[gtr == j] = True
+        keep = np.logical_not(ignored)
+
+        (block_seg, block_gt, block_counts) = pair_counts(segr[keep], gtr[keep])
+
+        (seg_labels, gt_labels, counts) = pair_counts(
+            np.concatenate([seg_labels, block_seg.astype(np.uint64)]),
+            np.concatenate([gt_labels, block_gt.astype(np.uint64)]),
+            np.concatenate([counts, block_counts]))
+
+    (rows, seg_labels) = relabel(seg_labels)
+    (cols, gt_labels) = relabel(gt_labels)
+    cont = sparse.coo_matrix(
+        (counts.astype(np.double), (rows, cols)),
+        shape=(len(seg_labels), len(gt_labels))).tocsc()
     if norm:
         cont /= float(cont.sum())
+    if return_labels:
+        return (cont, seg_labels, gt_labels)
     return cont
 
+def pair_counts(a, b, weights=None):
+    """Find the distinct pairs of labels in two equal-length label arrays.
+
+    Parameters
+    ----------
+    a, b : np.ndarray, int type, 1D
+        The label arrays. Element `k` of `a` and `b` form a pair.
+    weights : np.ndarray, int type, 1D, optional
+        The count of each pair. Defaults to one for each pair.
+
+    Returns
+    -------
+    (a, b, counts) : np.ndarray
+        The distinct pairs, sorted by `a` and then by `b`, and the sum of the
+        weights of each pair.
+    """
+    if weights is None:
+        weights = np.ones(len(a), dtype=np.int64)
+    if len(a) == 0:
+        return (a, b, weights)
+
+    order = np.lexsort((b, a))
+    a = a[order]
+    b = b[order]
+
+    first = np.ones(len(a), dtype=np.bool)
+    first[1:] = np.logical_or(a[1:] != a[:-1], b[1:] != b[:-1])
+    starts = np.flatnonzero(first)
+
+    return (a[starts], b[starts], np.add.reduceat(weights[order], starts))
+
+def block_slices(shape, block_shape):
+    """Iterate over the blocks of an array of the given shape.
+
+    Parameters
+    ----------
+    shape : tuple of int
+        The shape of the array.
+    block_shape : tuple of int or None
+        The shape of the blocks. `None` entries (or missing trailing entries)
+        span the whole extent of the respective dimension. Blocks at the upper
+        boundary of the array are cropped.
+
+    Returns
+    -------
+    An iterator over tuples of slices, one for each block.
+    """
+    block_shape = list(block_shape) + [None]*(len(shape) - len(block_shape))
+    block_shape = [ s if b is None else int(b) for (s, b) in zip(shape, block_shape) ]
+
+    starts = [ range(0, s, b) for (s, b) in zip(shape, block_shape) ]
+    for begin in itertools.product(*starts):
+        yield tuple([ slice(b, min(b + bs, s)) for (b, bs, s) in zip(begin, block_shape, shape) ])
+
 def divide_columns(matrix, row, in_place=False):
     """Divide each column of `matrix` by the corresponding element in `row`.
 
@@ -0,0 +1,373 @@
+"""Optional instrumentation of the evaluation and I/O code.
+
+When enabled, the stages of the evaluation classes and of `CremiFile` are
+timed, the bytes read from and written to files are counted, and the memory
+of each stage is recorded: the peak of the resident memory during the stage
+(sampled by a background thread, see `enable`) and at its end, both relative
+to the start of the stage. The results are collected in a `Report`, and each
+event is also passed to the registered sinks (e.g., to log them). When
+disabled (the default), each instrumented stage costs a single check.
+
+Example:
+
+    from cremi import instrumentation
+
+    instrumentation.enable(sink=instrumentation.logging_sink())
+    neuron_ids_evaluation.evaluate(test.read_neuron_ids())
+    report = instrumentation.disable()
+    print report
+"""
+
+import logging
+import resource
+import sys
+import threading
+import time
+import numpy as np
+from Volume import DataWindow
+
+class Report(object):
+
+    def __init__(self):
+
+        # name -> { "calls", "time", "peak_increase_mb", "rss_increase_mb" },
+        # in the order the stages were first entered; memory increases are
+        # the largest over all calls, None if the resident memory is not
+        # available
+        self.stages = {}
+        self.stage_order = []
+        self.bytes_read = 0
+        self.bytes_written = 0
+
+        # the high-water mark of the whole process, not of a stage
+        self.peak_rss_mb = 0.0
+
+    def to_dict(self):
+        """Get the report as a dictionary (e.g., to store it as JSON)."""
+
+        return {
+            "stages": [ dict(name=name, **self.stages[name]) for name in self.stage_order ],
+            "bytes_read": self.bytes_read,
+            "bytes_written": self.bytes_written,
+            "peak_rss_mb": self.peak_rss_mb
+        }
+
+    def __str__(self):
+
+        lines = [ "%-50s %6s %10s %16s %16s"%("stage", "calls", "time (s)", "peak +(MB)", "at end +(MB)") ]
+        for name in self.stage_order:
+            stage = self.stages[name]
+            lines.append("%-50s %6d %10.3f %16s %16s"%(
+                name,
+                stage["calls"],
+                stage["time"],
+                _format_mb(stage["peak_increase_mb"]),
+                _format_mb(stage["rss_increase_mb"])))
+        lines.append("")
+        lines.append("read   : %.1f MB"%(self.bytes_read/1e6))
+        lines.append("written: %.1f MB"%(self.bytes_written/1e6))
+        lines.append("peak   : %.1f MB (whole process)"%self.peak_rss_mb)
+
+        return "\n".join(lines)
+
+def _format_mb(mb):
+
+    return "%.1f"%mb if mb is not None else "-"
+
+# the report of the current run, None if disabled
+_report = None
+_sinks = []
+_lock = threading.Lock()
+_local = threading.local()
+
+# the stages that are running (in any thread), and the thread that samples
+# their resident memory
+_active_stages = set()
+_sampler = None
+
+def enable(sink = None, sample_interval = 0.005):
+    """Start collecting a new report.
+
+    Parameters
+    ----------
+
+        sink: callable, optional
+            A function that is called with a dictionary for each event: the
+            end of a stage ("event": "stage", with "name", "time",
+            "peak_increase_mb", and "rss_increase_mb"), or bytes read or
+            written ("event": "read" or "write", with "name" and "bytes").
+
+        sample_interval: float
+            How often (in seconds) a background thread samples the resident
+            memory of the process while stages are running. Temporaries that
+            live shorter than this might be missed in the peak of a stage.
+    """
+
+    global _report, _sinks, _sampler
+
+    disable()
+
+    _report = Report()
+    _sinks = [ sink ] if sink is not None else []
+
+    if rss_mb() is not None:
+        _sampler = _Sampler(sample_interval)
+        _sampler.start()
+
+def disable():
+    """Stop collecting, and return the report of the run."""
+
+    global _report, _sinks, _sampler
+
+    if _sampler is not None:
+        _sampler.stop()
+        _sampler = None
+
+    report = _report
+    _report = None
+    _sinks = []
+
+    return report
+
+def is_enabled():
+
+    return _report is not None
+
+def report():
+    """Get the report of the current run (None if disabled)."""
+
+    return _report
+
+def logging_sink(logger = None, level = logging.INFO):
+    """Create a sink that logs each event."""
+
+    if logger is None:
+        logger = logging.getLogger("cremi")
+
+    def sink(event):
+        if event["event"] == "stage":
+            logger.log(level, "%s took %.3fs (peak memory +%s MB)", event["name"], event["time"], _format_mb(event["peak_increase_mb"]))
+        else:
+            logger.log(level, "%s %d bytes (%s)", event["event"], event["bytes"], event["name"])
+
+    return sink
+
+def peak_rss_mb():
+    """Get the peak resident memory of this process so far, in MB. This only
+    ever increases."""
+
+    # ru_maxrss is in kilobytes on Linux, in bytes on OS X
+    peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    return peak/(1024.0*1024.0) if sys.platform == "darwin" else peak/1024.0
+
+def rss_mb():
+    """Get the current resident memory of this process in MB, or None if it
+    is not available (only on Linux)."""
+
+    try:
+        with open("/proc/self/statm") as f:
+            pages = int(f.read().split()[1])
+    except (IOError, IndexError, ValueError):
+        return None
+
+    return pages*resource.getpagesize()/(1024.0*1024.0)
+
+class _Sampler(threading.Thread):
+    """Samples the resident memory of the process, and records the largest
+    value seen during each running stage."""
+
+    def __init__(self, interval):
+
+        super(_Sampler, self).__init__(name="cremi.instrumentation")
+        self.daemon = True
+        self.interval = interval
+        self.stopped = threading.Event()
+
+    def run(self):
+
+        while not self.stopped.wait(self.interval):
+            _sample()
+
+    def stop(self):
+
+        self.stopped.set()
+        self.join()
+
+def _sample():
+
+    rss = rss_mb()
+    if rss is None:
+        return
+    with _lock:
+        for stage in _active_stages:
+            stage.max_rss = max(stage.max_rss, rss)
+
+class _Stage(object):
+
+    def __init__(self, name):
+
+        self.name = name
+
+    def __enter__(self):
+
+        stack = getattr(_local, "stack", None)
+        if stack is None:
+            stack = _local.stack = []
+        stack.append(self.name)
+        self.path = "/".join(stack)
+
+        # register on entry, such that stages are listed before their
+        # sub-stages
+        report = _report
+        if report is not None:
+            with _lock:
+                if self.path not in report.stages:
+                    report.stages[self.path] = _new_stage()
+                    report.stage_order.append(self.path)
+
+        self.start_rss = rss_mb()
+        if self.start_rss is not None:
+            self.max_rss = self.start_rss
+            with _lock:
+                _active_stages.add(self)
+        self.start = time.time()
+
+        return self
+
+    def __exit__(self, *args):
+
+        elapsed = time.time() - self.start
+        rss = rss_mb()
+        _local.stack.pop()
+
+        # the largest increase of the resident memory over the start of the
+        # stage (at any time during the stage), and the increase at its end
+        peak_increase = None
+        rss_increase = None
+        if self.start_rss is not None:
+            with _lock:
+                _active_stages.discard(self)
+        if self.start_rss is not None and rss is not None:
+            peak_increase = max(self.max_rss, rss) - self.start_rss
+            rss_increase = rss - self.start_rss
+
+        report = _report
+        if report is None:
+            return
+
+        with _lock:
+            if self.path not in report.stages:
+                # instrumentation was enabled within this stage
+                report.stages[self.path] = _new_stage()
+                report.stage_order.append(self.path)
+            stage = report.stages[self.path]
+            stage["calls"] += 1
+            stage["time"] += elapsed
+            for (key, increase) in [("peak_increase_mb", peak_increase), ("rss_increase_mb", rss_increase)]:
+                if increase is not None:
+                    stage[key] = max(stage[key], increase) if stage[key] is not None else increase
+            report.peak_rss_mb = max(report.peak_rss_mb, peak_rss_mb())
+
+        _emit({
+            "event": "stage",
+            "name": self.path,
+            "time": elapsed,
+            "peak_increase_mb": peak_increase,
+            "rss_increase_mb": rss_increase })
+
+def _new_stage():
+
+    return { "calls": 0, "time": 0.0, "peak_increase_mb": None, "rss_increase_mb": None }
+
+class _NoStage(object):
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *args):
+        pass
+
+_no_stage = _NoStage()
+
+def stage(name):
+    """A context manager to time a stage. Nested stages are reported with
+    their full path, e.g., "NeuronIds.evaluate/contingency_table".
+    """
+
+    if _report is None:
+        return _no_stage
+
+    return _Stage(name)
+
+def count_read(data, name = "", nbytes = None):
+    """Count bytes read from a file.
+
+    Parameters
+    ----------
+
+        data: int or array-like
+            The number of bytes, or the data that is read from (e.g., an HDF5
+            dataset, a memory map, or a `DataWindow` into either). NumPy
+            arrays (and windows into them) are in memory already and not
+            counted.
+
+        name: string, optional
+            What is read, passed on to the sinks.
+
+        nbytes: int, optional
+            How many bytes of data are read, if not all of it (e.g., a block).
+    """
+
+    if _report is None or _in_memory(data):
+        return
+
+    if nbytes is None:
+        nbytes = _nbytes(data)
+    with _lock:
+        _report.bytes_read += nbytes
+
+    _emit({ "event": "read", "name": name, "bytes": nbytes })
+
+def count_written(data, name = ""):
+    """Count bytes written to a file.
+
+    Parameters
+    ----------
+
+        data: int or array-like
+            The number of bytes, or the data that is written.
+
+        name: string, optional
+            What is written, passed on to the sinks.
+    """
+
+    if _report is None:
+        return
+
+    nbytes = _nbytes(data)
+    with _lock:
+        _report.bytes_written += nbytes
+
+    _emit({ "event": "write", "name": name, "bytes": nbytes })
+
+def _in_memory(data):
+
+    if isinstance(data, DataWindow):
+        return _in_memory(data.data)
+
+    return isinstance(data, np.ndarray) and not isinstance(data, np.memmap)
+
+def _nbytes(data):
+
+    if isinstance(data, (int, long)):
+        return int(data)
+
+    if not hasattr(data, "dtype"):
+        data = np.asarray(data)
+
+    return int(np.prod(np.shape(data), dtype=np.int64))*np.dtype(data.dtype).itemsize
+
+def _emit(event):
+
+    for sink in _sinks:
+        sink(event)
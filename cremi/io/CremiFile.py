@@ -1,7 +1,48 @@
 import h5py
 import numpy as np
 from .. import Annotations
+from .. import instrumentation
+from .. import Confidences
 from .. import Volume
+from downsample import downsample
+
+# Presets for the HDF5 layout of volumes written with CremiFile.write_volume,
+# tuned for different access patterns. Each preset gives the chunk shape
+# (True for h5py's automatic chunking), the compression filter ("gzip",
+# "lzf", or None), its options (the gzip level), and whether to apply the
+# shuffle filter (which helps compressing multi-byte labels).
+volume_layouts = {
+    # h5py's automatic chunking and default gzip compression
+    "default": {
+        "chunks": True,
+        "compression": "gzip",
+        "compression_opts": None,
+        "shuffle": False
+    },
+    # readers access whole sections
+    "slice-wise": {
+        "chunks": (1, 512, 512),
+        "compression": "gzip",
+        "compression_opts": 4,
+        "shuffle": True
+    },
+    # readers access small 3D blocks (chunks are roughly isotropic in world
+    # units for 40x4x4 nm voxels)
+    "block-wise": {
+        "chunks": (8, 64, 64),
+        "compression": "gzip",
+        "compression_opts": 4,
+        "shuffle": True
+    },
+    # uncompressed and not chunked, such that read_volume can memory-map
+    # the dataset
+    "contiguous": {
+        "chunks": None,
+        "compression": None,
+        "compression_opts": None,
+        "shuffle": False
+    },
+}
 
 class CremiFile(object):
 
@@ -22,10 +63,13 @@ class CremiFile(object):
             except ValueError:
                 pass
 
-    def __create_dataset(self, path, data, dtype, compression = None):
+    def __create_dataset(self, path, data, dtype, compression = None, compression_opts = None, shuffle = False, chunks = None, shape = None):
         """Wrapper around h5py's create_dataset. Creates the group, if not 
-        existing. Deletes a previous dataset, if existing and not compatible. 
-        Otherwise, replaces the dataset.
+        existing. Deletes a previous dataset, if existing and not compatible 
+        (or if it has a different layout). Otherwise, replaces the dataset.
+
+        If data is None, an empty dataset of the given shape is created (and 
+        a previous dataset is always deleted).
         """
 
         group = "/".join(path.split("/")[:-1])
@@ -33,30 +77,359 @@ class CremiFile(object):
 
         self.__create_group(group)
 
+        if data is not None:
+            shape = np.shape(data)
+        shape = tuple(shape)
+        if compression is None:
+            compression_opts = None
+        if isinstance(chunks, tuple):
+            chunks = self.__fit_chunks(chunks, shape)
+
+        if data is not None:
+            instrumentation.count_written(data, path)
+
         if ds_name in self.h5file[group]:
 
             ds = self.h5file[path]
-            if ds.dtype == dtype and ds.shape == np.array(data).shape:
+            same_layout = (
+                ds.compression == compression and
+                ds.shuffle == shuffle and
+                (ds.chunks is None) == (chunks is None) and
+                (not isinstance(chunks, tuple) or ds.chunks == chunks))
+            if data is not None and ds.dtype == dtype and ds.shape == shape and same_layout:
                 print "overwriting existing dataset"
                 self.h5file[path][:] = data[:]
                 return
 
             del self.h5file[path]
 
-        self.h5file.create_dataset(path, data=data, dtype=dtype, compression=compression)
+        self.h5file.create_dataset(
+            path,
+            shape=shape,
+            data=data,
+            dtype=dtype,
+            compression=compression,
+            compression_opts=compression_opts,
+            shuffle=shuffle,
+            chunks=chunks)
+
+    def __fit_chunks(self, chunks, shape):
+        """Crop a chunk shape to the shape of a dataset. Returns True (i.e., 
+        automatic chunking) if the chunk shape does not fit the 
+        dimensionality."""
+
+        if len(chunks) != len(shape) or 0 in shape:
+            return True
+        return tuple(min(c, s) for (c, s) in zip(chunks, shape))
+
+    def __layout_options(self, layout, options):
+        """Get the dataset options of a layout preset, overwritten by the given 
+        options."""
+
+        if layout not in volume_layouts:
+            raise ValueError("unknown layout " + str(layout) + ", use one of " + str(volume_layouts.keys()))
+        for option in options:
+            if option not in volume_layouts[layout]:
+                raise TypeError("unknown layout option " + str(option))
+
+        layout_options = dict(volume_layouts[layout])
+
+        # the level of the preset only applies to its compression filter
+        if "compression" in options and "compression_opts" not in options:
+            if options["compression"] != layout_options["compression"]:
+                layout_options["compression_opts"] = None
+
+        layout_options.update(options)
+
+        return layout_options
+
+    def write_volume(self, volume, ds_name, dtype, layout = "default", **layout_options):
+        """Write a volume to a dataset.
+
+        Parameters
+        ----------
+
+            volume: Volume
+                The volume to write.
+
+            ds_name: string
+                The path of the dataset in the file.
+
+            dtype: numpy.dtype
+                The data type of the dataset.
+
+            layout: string
+                A preset for the chunking and compression of the dataset, one 
+                of the keys of `volume_layouts`: "default", "slice-wise", 
+                "block-wise", or "contiguous" (uncompressed, to be 
+                memory-mapped by `read_volume`).
+
+            layout_options:
+                Override options of the preset: `chunks` (a tuple, cropped to 
+                the shape of the volume, or True for automatic chunking), 
+                `compression` ("gzip", "lzf", or None), `compression_opts` 
+                (the gzip level, dropped if only the compression filter of 
+                the preset is replaced), and `shuffle` (bool).
+        """
+
+        options = self.__layout_options(layout, layout_options)
+
+        with instrumentation.stage("CremiFile.write_volume"):
+            self.__create_dataset(ds_name, data=volume.data, dtype=dtype, **options)
+        self.__write_volume_attributes(ds_name, volume.resolution, volume.offset, volume.comment)
+        self.__delete_pyramid(ds_name)
+
+    def __write_volume_attributes(self, ds_name, resolution, offset, comment):
+
+        self.h5file[ds_name].attrs["resolution"] = resolution
+        if comment is not None:
+            self.h5file[ds_name].attrs["comment"] = str(comment)
+        if tuple(offset) != (0.0, 0.0, 0.0):
+            self.h5file[ds_name].attrs["offset"] = offset
+
+    def create_volume(self, ds_name, shape, dtype, resolution = (1.0, 1.0, 1.0), offset = (0.0, 0.0, 0.0), comment = "", layout = "default", **layout_options):
+        """Create an empty volume, to be filled block by block with 
+        `write_volume_block` or `write_volume_blocks`. This way, volumes 
+        larger than the available memory can be written. An existing dataset 
+        of the same name is replaced.
+
+        Parameters
+        ----------
+
+            ds_name: string
+                The path of the dataset in the file.
+
+            shape: tuple of int
+                The shape of the volume in voxels.
+
+            dtype: numpy.dtype
+                The data type of the dataset.
+
+            resolution, offset, comment:
+                The meta-information of the volume, as in `Volume`. They are 
+                stored the same way as by `write_volume`.
+
+            layout, layout_options:
+                The chunking and compression of the dataset, see 
+                `write_volume`. For best performance, write blocks that are 
+                aligned with the chunks.
+
+        Returns
+        -------
+
+            The new volume, as returned by `read_volume`.
+        """
+
+        options = self.__layout_options(layout, layout_options)
+
+        self.__create_dataset(ds_name, data=None, dtype=dtype, shape=shape, **options)
+        self.__write_volume_attributes(ds_name, resolution, offset, comment)
+        self.__delete_pyramid(ds_name)
+
+        return self.read_volume(ds_name)
+
+    def write_volume_block(self, ds_name, block, voxel_offset = None):
+        """Write a block into an existing volume, e.g., one created with 
+        `create_volume`.
+
+        Parameters
+        ----------
+
+            ds_name: string
+                The path of the dataset in the file.
+
+            block: Volume or array-like
+                The block to write. If a `Volume` is given, its offset (in 
+                world units) is used to find the position of the block in the 
+                volume, and its resolution has to match the volume's.
+
+            voxel_offset: tuple of int, optional
+                The position of the block in the volume, in voxels from the 
+                beginning of the dataset. Needed if block is not a `Volume`, 
+                overrides the offset of the block otherwise.
+        """
+
+        ds = self.h5file[ds_name]
+
+        if isinstance(block, Volume):
+            data = block.data
+            if voxel_offset is None:
+                resolution = np.asarray(ds.attrs["resolution"], dtype=np.float64)
+                if not np.allclose(np.asarray(block.resolution, dtype=np.float64), resolution):
+                    raise ValueError("resolution of block " + str(tuple(block.resolution)) + " does not match resolution of " + ds_name + " " + str(tuple(resolution)))
+                volume_offset = np.asarray(ds.attrs["offset"] if "offset" in ds.attrs else (0.0,)*ds.ndim, dtype=np.float64)
+                voxel_offset = np.round((np.asarray(block.offset, dtype=np.float64) - volume_offset)/resolution).astype(np.int64)
+        else:
+            data = block
+            if voxel_offset is None:
+                raise ValueError("a voxel offset is needed to write a block that is not a Volume")
+
+        shape = np.shape(data)
+        voxel_offset = tuple(int(o) for o in voxel_offset)
+        if len(voxel_offset) != ds.ndim or len(shape) != ds.ndim:
+            raise ValueError("block does not have the dimensions of " + ds_name)
+        if min(voxel_offset) < 0 or any(o + s > d for (o, s, d) in zip(voxel_offset, shape, ds.shape)):
+            raise IndexError("block of shape " + str(shape) + " at " + str(voxel_offset) + " does not lie inside " + ds_name + " of shape " + str(ds.shape))
+
+        data = np.asarray(data, dtype=ds.dtype)
+        instrumentation.count_written(data, ds_name)
+        ds[tuple(slice(o, o + s) for (o, s) in zip(voxel_offset, shape))] = data
+
+    def write_volume_blocks(self, ds_name, blocks):
+        """Write several blocks into an existing volume, see 
+        `write_volume_block`. Blocks are taken one at a time from blocks, 
+        which can be a generator, such that only one block has to be kept in 
+        memory.
+
+        Parameters
+        ----------
+
+            ds_name: string
+                The path of the dataset in the file.
+
+            blocks: iterable
+                `Volume`s, or pairs (voxel_offset, data).
+        """
+
+        with instrumentation.stage("CremiFile.write_volume_blocks"):
+            for block in blocks:
+                if isinstance(block, Volume):
+                    self.write_volume_block(ds_name, block)
+                else:
+                    (voxel_offset, data) = block
+                    self.write_volume_block(ds_name, data, voxel_offset)
+
+    def write_pyramid(self, ds_name, factors = [(1, 2, 2), (1, 2, 2), (1, 2, 2)], method = None, layout = "default", **layout_options):
+        """Create a multi-resolution pyramid of a volume, to read coarse 
+        versions of it with `read_volume(ds_name, level=...)`.
+
+        The levels are stored in the group `<ds_name>_pyramid`, each with its 
+        own resolution and offset. A previous pyramid of the volume is 
+        replaced. The pyramid is deleted when the volume is written again 
+        with `write_volume` or `create_volume`, but not by 
+        `write_volume_block`: call `write_pyramid` again after changing the 
+        volume block by block.
+
+        Parameters
+        ----------
+
+            ds_name: string
+                The path of the volume in the file.
+
+            factors: list of tuple of int
+                The downsampling factor of each level (starting with level 1), 
+                relative to the previous level. By default, x and y are halved 
+                three times (the z resolution of CREMI volumes is ten times 
+                lower already).
+
+            method: string, optional
+                How to downsample, see `downsample`: "mean" (for intensities), 
+                "mode" (for labels), or "stride". Defaults to "mean" for the 
+                raw volume and "mode" for all other volumes.
+
+            layout, layout_options:
+                The chunking and compression of the levels, see 
+                `write_volume`.
+        """
+
+        if method is None:
+            method = "mean" if ds_name == "/volumes/raw" else "mode"
+
+        with instrumentation.stage("CremiFile.write_pyramid"):
+
+            self.__delete_pyramid(ds_name)
+
+            source = self.read_volume(ds_name, memmap = False)
+            resolution = np.asarray(source.resolution, dtype=np.float64)
+            offset = np.asarray(source.offset, dtype=np.float64)
+
+            for (level, factor) in enumerate(factors, 1):
+
+                factor = np.asarray(factor, dtype=np.int64)
+                shape = tuple(-(-np.asarray(source.data.shape)//factor))
+
+                # the center of a window is the center of the downsampled
+                # voxel, the offset of a strided level does not change
+                if method != "stride":
+                    offset = offset + (factor - 1)/2.0*resolution
+                resolution = resolution*factor
+
+                level_name = self.__pyramid_level_name(ds_name, level)
+                self.create_volume(level_name, shape, source.data.dtype, tuple(resolution), tuple(offset), source.comment, layout, **layout_options)
+
+                # downsample slabs of about 128MB of the previous level, whose
+                # thickness is a multiple of the z factor
+                section_bytes = int(np.prod(source.data.shape[1:]))*source.data.dtype.itemsize
+                thickness = factor[0]*max(1, 2**27//(section_bytes*factor[0]))
+                for z in range(0, source.data.shape[0], thickness):
+                    block = downsample(source.data[z:z + thickness], factor, method)
+                    self.write_volume_block(level_name, block, (z//factor[0], 0, 0))
 
-    def write_volume(self, volume, ds_name, dtype):
+                source = self.read_volume(level_name, memmap = False)
 
-        self.__create_dataset(ds_name, data=volume.data, dtype=dtype, compression="gzip")
-        self.h5file[ds_name].attrs["resolution"] = volume.resolution
-        if volume.comment is not None:
-            self.h5file[ds_name].attrs["comment"] = str(volume.comment)
-        if tuple(volume.offset) != (0.0, 0.0, 0.0):
-            self.h5file[ds_name].attrs["offset"] = volume.offset
+    def __pyramid_level_name(self, ds_name, level):
 
-    def read_volume(self, ds_name):
+        return ds_name + "_pyramid/s" + str(level)
 
-        volume = Volume(self.h5file[ds_name])
+    def __delete_pyramid(self, ds_name):
+
+        if ds_name + "_pyramid" in self.h5file:
+            del self.h5file[ds_name + "_pyramid"]
+
+    def pyramid_levels(self, ds_name):
+        """Get the number of resolution levels of a volume, including the 
+        volume itself (level 0). See `write_pyramid`.
+        """
+
+        level = 1
+        while self.__pyramid_level_name(ds_name, level) in self.h5file:
+            level += 1
+
+        return level
+
+    def read_volume(self, ds_name, memmap = False, level = 0):
+        """Read a volume.
+
+        Parameters
+        ----------
+
+            ds_name: string
+                The path of the dataset in the file.
+
+            memmap: bool or None, optional
+                Whether the data of the volume should be a read-only 
+                `numpy.memmap` onto the dataset in the file, instead of the 
+                HDF5 dataset (the default). Slices of a memory map are read 
+                without copying and share the page cache with other processes 
+                reading the same file. Only possible for contiguous, 
+                uncompressed datasets (see the "contiguous" layout of 
+                `write_volume`). If True, a ValueError is raised if the 
+                dataset can not be memory-mapped. If None, datasets are 
+                memory-mapped if possible and the file was opened read-only. 
+                Note that a memory map stays valid (and keeps the file open) 
+                after this file is closed, and does not see later changes of 
+                the dataset's layout.
+
+            level: int, optional
+                The resolution level to read, 0 for the volume itself, 1 or 
+                higher for a level of its pyramid (see `write_pyramid`).
+        """
+
+        if level != 0:
+            if level < 0 or level >= self.pyramid_levels(ds_name):
+                raise ValueError(ds_name + " has no pyramid level " + str(level))
+            ds_name = self.__pyramid_level_name(ds_name, level)
+
+        data = self.h5file[ds_name]
+
+        if memmap or (memmap is None and self.h5file.mode == "r"):
+            mapped = self.__memmap(data)
+            if mapped is not None:
+                data = mapped
+            elif memmap:
+                raise ValueError(ds_name + " can not be memory-mapped, it has to be written uncompressed with layout 'contiguous'")
+
+        volume = Volume(data)
 
         volume.resolution = self.h5file[ds_name].attrs["resolution"]
         if "offset" in self.h5file[ds_name].attrs:
@@ -66,49 +439,122 @@ class CremiFile(object):
 
         return volume
 
+    def __memmap(self, ds):
+        """Memory-map a dataset, if it is stored contiguously and without 
+        filters in the file. Returns None otherwise."""
+
+        if ds.chunks is not None or ds.compression is not None or ds.dtype.hasobject:
+            return None
+        if self.h5file.driver not in ["sec2", "stdio"] or ds.external:
+            return None
+
+        # None if no storage has been allocated yet (i.e., nothing written)
+        offset = ds.id.get_offset()
+        if offset is None:
+            return None
+
+        return np.memmap(self.h5file.filename, mode="r", dtype=ds.dtype, shape=ds.shape, offset=offset)
+
     def __has_volume(self, ds_name):
 
         return ds_name in self.h5file
 
-    def write_raw(self, raw):
-        """Write a raw volume.
+    def write_raw(self, raw, layout = "default", **layout_options):
+        """Write a raw volume. See `write_volume` for the layout options.
         """
 
-        self.write_volume(raw, "/volumes/raw", np.uint8)
+        self.write_volume(raw, "/volumes/raw", np.uint8, layout, **layout_options)
 
-    def write_neuron_ids(self, neuron_ids):
-        """Write a volume of segmented neurons.
+    def write_neuron_ids(self, neuron_ids, layout = "default", **layout_options):
+        """Write a volume of segmented neurons. See `write_volume` for the layout options.
         """
 
-        self.write_volume(neuron_ids, "/volumes/labels/neuron_ids", np.uint64)
+        self.write_volume(neuron_ids, "/volumes/labels/neuron_ids", np.uint64, layout, **layout_options)
 
-    def write_clefts(self, clefts):
-        """Write a volume of segmented synaptic clefts.
+    def write_clefts(self, clefts, layout = "default", **layout_options):
+        """Write a volume of segmented synaptic clefts. See `write_volume` for the layout options.
         """
 
-        self.write_volume(clefts, "/volumes/labels/clefts", np.uint64)
+        self.write_volume(clefts, "/volumes/labels/clefts", np.uint64, layout, **layout_options)
 
     def write_annotations(self, annotations):
         """Write pre- and post-synaptic site annotations.
         """
 
-        if len(annotations.ids()) == 0:
+        (ids, types, locations, pre_post_partners) = annotations.to_arrays()
+
+        if len(ids) == 0:
             return
 
         self.__create_group("/annotations")
         if tuple(annotations.offset) != (0.0, 0.0, 0.0):
             self.h5file["/annotations"].attrs["offset"] = annotations.offset
 
-        self.__create_dataset("/annotations/ids", data=annotations.ids(), dtype=np.uint64)
-        self.__create_dataset("/annotations/types", data=annotations.types(), dtype=h5py.special_dtype(vlen=unicode), compression="gzip")
-        self.__create_dataset("/annotations/locations", data=annotations.locations(), dtype=np.double)
+        # each dataset is written at once from an array
+        self.__create_dataset("/annotations/ids", data=ids, dtype=np.uint64)
+        self.__create_dataset("/annotations/types", data=types, dtype=h5py.special_dtype(vlen=unicode), compression="gzip")
+        self.__create_dataset("/annotations/locations", data=locations, dtype=np.double)
 
         if len(annotations.comments) > 0:
-            self.__create_dataset("/annotations/comments/target_ids", data=annotations.comments.keys(), dtype=np.uint64)
-            self.__create_dataset("/annotations/comments/comments", data=annotations.comments.values(), dtype=h5py.special_dtype(vlen=unicode))
+            target_ids = np.array(annotations.comments.keys(), dtype=np.uint64)
+            comments = np.array(annotations.comments.values(), dtype=object)
+            self.__create_dataset("/annotations/comments/target_ids", data=target_ids, dtype=np.uint64)
+            self.__create_dataset("/annotations/comments/comments", data=comments, dtype=h5py.special_dtype(vlen=unicode))
+
+        if len(pre_post_partners) > 0:
+            self.__create_dataset("/annotations/presynaptic_site/partners", data=pre_post_partners, dtype=np.uint64)
+
+    def write_neuron_ids_confidence(self, confidences, layout = "rle"):
+        """Write confidence information about neuron ids.
+
+        Parameters
+        ----------
+
+            confidences: Confidences
+                The confidence levels of the neuron ids.
+
+            layout: string
+                "rle" (the default) to store a single dataset with, for each 
+                level, the level, the number of ids, and the ids. "csr" to 
+                store a group with datasets "levels", "offsets", and "ids", 
+                where the ids of levels[i] are ids[offsets[i]:offsets[i + 1]]. 
+                Both are read by `read_neuron_ids_confidence`.
+        """
 
-        if len(annotations.pre_post_partners) > 0:
-            self.__create_dataset("/annotations/presynaptic_site/partners", data=annotations.pre_post_partners, dtype=np.uint64)
+        path = "/volumes/labels/neuron_ids_confidence"
+        (levels, offsets, ids) = confidences.to_arrays()
+
+        # the layouts differ in type (dataset or group), replace in any case
+        if path in self.h5file:
+            del self.h5file[path]
+
+        if layout == "rle":
+
+            sizes = np.diff(offsets)
+            data = np.zeros((len(ids) + 2*len(levels),), dtype=np.uint64)
+
+            # position of the header of each level
+            headers = offsets[:-1] + 2*np.arange(len(levels), dtype=np.uint64)
+            data[headers] = levels
+            data[headers + 1] = sizes
+            is_id = np.ones(data.shape, dtype=np.bool)
+            is_id[headers] = False
+            is_id[headers + 1] = False
+            data[is_id] = ids
+
+            self.__create_dataset(path, data=data, dtype=np.uint64, compression="gzip")
+
+        elif layout == "csr":
+
+            self.__create_dataset(path + "/levels", data=levels, dtype=np.uint64)
+            self.__create_dataset(path + "/offsets", data=offsets, dtype=np.uint64)
+            self.__create_dataset(path + "/ids", data=ids, dtype=np.uint64, compression="gzip")
+
+        else:
+
+            raise ValueError("unknown layout " + str(layout) + ", use 'rle' or 'csr'")
+
+        self.h5file[path].attrs["num_levels"] = confidences.num_levels
 
     def has_raw(self):
         """Check if this file contains a raw volume.
@@ -140,78 +586,114 @@ class CremiFile(object):
         """
         return "/annotations" in self.h5file
 
-    def read_raw(self):
-        """Read the raw volume.
+    def read_raw(self, level = 0, memmap = False):
+        """Read the raw volume, or a level of its pyramid (see 
+        `write_pyramid`). See `read_volume` for `memmap`.
         Returns a Volume.
         """
 
-        return self.read_volume("/volumes/raw")
+        return self.read_volume("/volumes/raw", memmap = memmap, level = level)
 
-    def read_neuron_ids(self):
-        """Read the volume of segmented neurons.
+    def read_neuron_ids(self, level = 0, memmap = False):
+        """Read the volume of segmented neurons, or a level of its pyramid 
+        (see `write_pyramid`). See `read_volume` for `memmap`.
         Returns a Volume.
         """
 
-        return self.read_volume("/volumes/labels/neuron_ids")
+        return self.read_volume("/volumes/labels/neuron_ids", memmap = memmap, level = level)
 
     def read_neuron_ids_confidence(self):
         """Read confidence information about neuron ids.
         Returns Confidences.
         """
 
-        confidences = Confidences(num_levels=2)
         if not self.has_neuron_ids_confidence():
-            return confidences
-
-        data = self.h5file["/volumes/labels/neuron_ids_confidence"]
-        i = 0
-        while i < len(data):
-            level = data[i]
-            i += 1
-            num_ids = data[i]
-            i += 1
-            confidences.add_all(level, data[i:i+num_ids])
-            i += num_ids
-
-        return confidences
-
-    def read_clefts(self):
-        """Read the volume of segmented synaptic clefts.
+            return Confidences(num_levels=2)
+
+        stored = self.h5file["/volumes/labels/neuron_ids_confidence"]
+
+        if isinstance(stored, h5py.Group):
+
+            for name in ["levels", "offsets", "ids"]:
+                instrumentation.count_read(stored[name], stored[name].name)
+            levels = stored["levels"][:]
+            offsets = stored["offsets"][:]
+            ids = stored["ids"][:]
+
+        else:
+
+            # read the whole run-length encoding at once, and only walk the
+            # headers of the levels
+            instrumentation.count_read(stored, stored.name)
+            data = stored[:]
+            levels = []
+            offsets = [0]
+            begins = []
+            i = 0
+            while i < len(data):
+                if i + 2 > len(data):
+                    raise ValueError(
+                        "neuron_ids_confidence is truncated: the level header at position %d is incomplete (dataset length %d)"%(i, len(data)))
+                count = int(data[i + 1])
+                if i + 2 + count > len(data):
+                    raise ValueError(
+                        "neuron_ids_confidence is truncated: level %d at position %d has %d ids, but only %d values follow"%(data[i], i, count, len(data) - i - 2))
+                levels.append(data[i])
+                begins.append(i + 2)
+                i += 2 + count
+                offsets.append(offsets[-1] + count)
+            ids = np.concatenate([ np.zeros((0,), dtype=np.uint64) ] + [
+                data[begin:begin + (end - start)]
+                for (begin, start, end) in zip(begins, offsets[:-1], offsets[1:]) ])
+
+        if "num_levels" in stored.attrs:
+            num_levels = int(stored.attrs["num_levels"])
+        else:
+            num_levels = max([2] + [ int(level) + 1 for level in levels ])
+
+        return Confidences.from_arrays(levels, offsets, ids, num_levels)
+
+    def read_clefts(self, level = 0, memmap = False):
+        """Read the volume of segmented synaptic clefts, or a level of its 
+        pyramid (see `write_pyramid`). See `read_volume` for `memmap`.
         Returns a Volume.
         """
 
-        return self.read_volume("/volumes/labels/clefts")
+        return self.read_volume("/volumes/labels/clefts", memmap = memmap, level = level)
 
     def read_annotations(self):
         """Read pre- and post-synaptic site annotations.
         """
 
-        annotations = Annotations()
-
         if not "/annotations" in self.h5file:
-            return annotations
-
-        offset = (0.0, 0.0, 0.0)
-        if "offset" in self.h5file["/annotations"].attrs:
-            offset = self.h5file["/annotations"].attrs["offset"]
-        annotations.offset = offset
-
-        ids = self.h5file["/annotations/ids"]
-        types = self.h5file["/annotations/types"]
-        locations = self.h5file["/annotations/locations"]
-        for i in range(len(ids)):
-            annotations.add_annotation(ids[i], types[i], locations[i])
-
-        if "comments" in self.h5file["/annotations"]:
-            ids = self.h5file["/annotations/comments/target_ids"]
-            comments = self.h5file["/annotations/comments/comments"]
-            for (id, comment) in zip(ids, comments):
-                annotations.add_comment(id, comment)
-
-        if "presynaptic_site/partners" in self.h5file["/annotations"]:
-            pre_post = self.h5file["/annotations/presynaptic_site/partners"]
-            for (pre, post) in pre_post:
-                annotations.set_pre_post_partners(pre, post)
+            return Annotations()
+
+        with instrumentation.stage("CremiFile.read_annotations"):
+
+            offset = (0.0, 0.0, 0.0)
+            if "offset" in self.h5file["/annotations"].attrs:
+                offset = self.h5file["/annotations"].attrs["offset"]
+
+            if instrumentation.is_enabled():
+                self.h5file["/annotations"].visititems(
+                    lambda name, item: instrumentation.count_read(item, item.name) if isinstance(item, h5py.Dataset) else None)
+
+            # read each dataset at once, instead of element by element
+            ids = self.h5file["/annotations/ids"][:]
+            types = self.h5file["/annotations/types"][:]
+            locations = self.h5file["/annotations/locations"][:]
+
+            pre_post = None
+            if "presynaptic_site/partners" in self.h5file["/annotations"]:
+                pre_post = self.h5file["/annotations/presynaptic_site/partners"][:]
+
+            annotations = Annotations.from_arrays(ids, types, locations, pre_post, offset)
+
+            if "comments" in self.h5file["/annotations"]:
+                ids = self.h5file["/annotations/comments/target_ids"][:]
+                comments = self.h5file["/annotations/comments/comments"][:]
+                for (id, comment) in zip(ids, comments):
+                    annotations.add_comment(id, comment)
 
         return annotations
 
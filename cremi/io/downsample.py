@@ -0,0 +1,68 @@
+import numpy as np
+
+def downsample(data, factor, method):
+    """Downsample an array by an integer factor per dimension.
+
+    Parameters
+    ----------
+
+        data: np.ndarray
+
+        factor: tuple of int
+            The downsampling factor of each dimension.
+
+        method: string
+            "mean" to average each window of `factor` voxels (for raw data),
+            "mode" to take the most frequent value of each window (for
+            labels, ties are broken in favour of the smallest value), or
+            "stride" to take the first voxel of each window.
+
+    Returns
+    -------
+
+        An array of the same type, of shape `ceil(data.shape/factor)`. For
+        "mean" and "mode", windows at the upper borders that are cut off by
+        the array are filled by repeating the last voxel.
+    """
+
+    data = np.asarray(data)
+    factor = tuple(int(f) for f in factor)
+
+    if len(factor) != data.ndim or min(factor) < 1:
+        raise ValueError("invalid downsampling factor " + str(factor) + " for data of shape " + str(data.shape))
+
+    if method == "stride":
+        return data[tuple(slice(None, None, f) for f in factor)].copy()
+    if method not in ["mean", "mode"]:
+        raise ValueError("unknown downsampling method " + str(method) + ", use 'mean', 'mode', or 'stride'")
+
+    shape = tuple(-(-s//f) for (s, f) in zip(data.shape, factor))
+    padding = [ (0, s*f - d) for (s, f, d) in zip(shape, factor, data.shape) ]
+    if any(p[1] > 0 for p in padding):
+        data = np.pad(data, padding, mode='edge')
+
+    # move the voxels of each window into the last dimension
+    windows = data.reshape(sum([ [s, f] for (s, f) in zip(shape, factor) ], []))
+    windows = windows.transpose(range(0, 2*len(shape), 2) + range(1, 2*len(shape), 2))
+    windows = windows.reshape(shape + (-1,))
+
+    if method == "mean":
+
+        mean = windows.mean(axis=-1)
+        if np.issubdtype(data.dtype, np.integer):
+            mean = np.round(mean)
+
+        return mean.astype(data.dtype)
+
+    # count how often each value occurs in its window (windows are small),
+    # the first of the most frequent values in the sorted windows is the
+    # smallest
+    windows = np.sort(windows, axis=-1)
+    counts = np.zeros(windows.shape, dtype=np.int32)
+    for i in range(windows.shape[-1]):
+        counts += windows == windows[...,i:i+1]
+    most_frequent = np.argmax(counts, axis=-1)
+
+    windows = windows.reshape((-1, windows.shape[-1]))
+
+    return windows[np.arange(len(windows)), most_frequent.reshape((-1,))].reshape(shape)
@@ -10,4 +10,5 @@ setup(
     author_email='jfunke@iri.upc.edu',
     url='http://github.com/funkey/cremi_python',
     packages=['cremi', 'cremi.io', 'cremi.evaluation'],
+    scripts=['bin/cremi-evaluate'],
 )
@@ -0,0 +1,2 @@
+# test_border.py is an interactive script (it opens a viewer), not a test
+collect_ignore = ["test_border.py"]
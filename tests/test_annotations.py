@@ -0,0 +1,162 @@
+import h5py
+import numpy as np
+import pytest
+from cremi import Annotations
+from cremi.io import CremiFile
+
+def random_arrays(num_annotations, seed):
+
+    random = np.random.RandomState(seed)
+    ids = random.permutation(10*num_annotations)[:num_annotations].astype(np.uint64)
+    types = np.array([ "presynaptic_site", "postsynaptic_site" ]*(num_annotations//2), dtype=object)
+    locations = random.uniform(0, 1000, (num_annotations, 3))
+    partners = ids.reshape((-1, 2))
+
+    return (ids, types, locations, partners)
+
+def write_old_format(filename, ids, types, locations, partners, comments):
+    """Write annotations the way CremiFile did before the bulk writes."""
+
+    with h5py.File(filename, "w") as f:
+        f.create_dataset("/annotations/ids", data=ids, dtype=np.uint64)
+        f.create_dataset("/annotations/types", data=list(types), dtype=h5py.special_dtype(vlen=unicode), compression="gzip")
+        f.create_dataset("/annotations/locations", data=locations, dtype=np.double)
+        f.create_dataset("/annotations/comments/target_ids", data=comments.keys(), dtype=np.uint64)
+        f.create_dataset("/annotations/comments/comments", data=np.array(comments.values(), dtype=object), dtype=h5py.special_dtype(vlen=unicode))
+        f.create_dataset("/annotations/presynaptic_site/partners", data=partners, dtype=np.uint64)
+        f["/annotations"].attrs["offset"] = (40.0, 4.0, 8.0)
+
+def read_old_format(filename):
+    """Read annotations element by element, the way CremiFile did before the
+    bulk reads."""
+
+    annotations = {}
+    with h5py.File(filename, "r") as f:
+        ids = f["/annotations/ids"]
+        types = f["/annotations/types"]
+        locations = f["/annotations/locations"]
+        for i in range(len(ids)):
+            annotations[ids[i]] = (types[i], tuple(locations[i]))
+        comments = dict(zip(f["/annotations/comments/target_ids"], f["/annotations/comments/comments"]))
+        partners = [ (pre, post) for (pre, post) in f["/annotations/presynaptic_site/partners"] ]
+        offset = tuple(f["/annotations"].attrs["offset"])
+
+    return (annotations, comments, partners, offset)
+
+def assert_annotations_equal(annotations, ids, types, locations, partners):
+
+    assert len(annotations.ids()) == len(ids)
+    for (i, t, l) in zip(ids, types, locations):
+        assert annotations.get_annotation(i) == (t, tuple(l))
+    assert np.array_equal(annotations.pre_post_partners, partners)
+
+def test_from_arrays_to_arrays():
+
+    (ids, types, locations, partners) = random_arrays(1000, 0)
+
+    annotations = Annotations.from_arrays(ids, types, locations, partners, offset=(1.0, 2.0, 3.0))
+    assert_annotations_equal(annotations, ids, types, locations, partners)
+    assert annotations.offset == (1.0, 2.0, 3.0)
+
+    (ids2, types2, locations2, partners2) = annotations.to_arrays()
+    assert np.array_equal(ids2, ids)
+    assert list(types2) == list(types)
+    assert np.array_equal(locations2, locations)
+    assert np.array_equal(partners2, partners)
+
+    with pytest.raises(ValueError):
+        Annotations.from_arrays([1, 1], ["a", "b"], np.zeros((2, 3)))
+    with pytest.raises(ValueError):
+        Annotations.from_arrays([-1], ["a"], np.zeros((1, 3)))
+    with pytest.raises(KeyError):
+        Annotations.from_arrays([1, 2], ["a", "b"], np.zeros((2, 3)), [[1, 3]])
+
+def test_add_annotation_get_annotation():
+
+    random = np.random.RandomState(1)
+    annotations = Annotations()
+    expected = {}
+
+    # more than 256 types, and ids added again replace their annotation
+    for i in range(2000):
+        id = random.randint(0, 1000)
+        type = "type_" + str(random.randint(0, 300))
+        location = tuple(random.uniform(0, 1000, 3))
+        annotations.add_annotation(id, type, location)
+        expected[id] = (type, location)
+
+    assert sorted(annotations.ids()) == sorted(expected.keys())
+    for (id, annotation) in expected.items():
+        assert annotations.get_annotation(id) == annotation
+    assert dict(zip(annotations.ids(), zip(annotations.types(), map(tuple, annotations.locations())))) == expected
+
+    with pytest.raises(KeyError):
+        annotations.get_annotation(1000)
+    with pytest.raises(ValueError):
+        annotations.add_annotation(-1, "type_0", (0, 0, 0))
+
+def test_pre_post_partners():
+
+    annotations = Annotations()
+    for id in range(6):
+        annotations.add_annotation(id, "presynaptic_site" if id%2 == 0 else "postsynaptic_site", (id, id, id))
+
+    annotations.set_pre_post_partners(0, 1)
+    annotations.set_all_pre_post_partners([[2, 3], [4, 5]])
+    partners = annotations.pre_post_partners
+    assert partners.tolist() == [[0, 1], [2, 3], [4, 5]]
+
+    with pytest.raises(ValueError):
+        partners[0, 0] = 4
+    with pytest.raises(ValueError):
+        annotations.ids()[0] = 4
+    with pytest.raises(KeyError):
+        annotations.set_pre_post_partners(0, 7)
+
+    # assigning replaces all pairs, arrays returned before do not change
+    annotations.pre_post_partners = [(4, 1)]
+    assert annotations.pre_post_partners.tolist() == [[4, 1]]
+    assert partners.tolist() == [[0, 1], [2, 3], [4, 5]]
+
+    # invalid pairs keep the previous ones
+    with pytest.raises(KeyError):
+        annotations.pre_post_partners = [(0, 1), (0, 7)]
+    with pytest.raises(ValueError):
+        annotations.pre_post_partners = [(0, -1)]
+    assert annotations.pre_post_partners.tolist() == [[4, 1]]
+
+    annotations.pre_post_partners = []
+    assert annotations.pre_post_partners.shape == (0, 2)
+
+def test_read_old_format(tmpdir):
+
+    filename = str(tmpdir.join("old.hdf"))
+    (ids, types, locations, partners) = random_arrays(200, 2)
+    comments = { ids[3]: u"unsure", ids[7]: u"checked \u2713" }
+    write_old_format(filename, ids, types, locations, partners, comments)
+
+    f = CremiFile(filename, "r")
+    annotations = f.read_annotations()
+    f.close()
+
+    assert_annotations_equal(annotations, ids, types, locations, partners)
+    assert tuple(annotations.offset) == (40.0, 4.0, 8.0)
+    assert annotations.comments == dict((id, comment.encode('utf8')) for (id, comment) in comments.items())
+
+def test_write_old_format(tmpdir):
+
+    filename = str(tmpdir.join("new.hdf"))
+    (ids, types, locations, partners) = random_arrays(200, 3)
+    annotations = Annotations.from_arrays(ids, types, locations, partners, offset=(40.0, 4.0, 8.0))
+    annotations.add_comment(ids[5], u"unsure")
+
+    f = CremiFile(filename, "w")
+    f.write_annotations(annotations)
+    f.close()
+
+    (read, comments, read_partners, offset) = read_old_format(filename)
+
+    assert read == dict((i, (t, tuple(l))) for (i, t, l) in zip(ids, types, locations))
+    assert comments == { ids[5]: u"unsure" }
+    assert read_partners == [ tuple(p) for p in partners ]
+    assert offset == (40.0, 4.0, 8.0)
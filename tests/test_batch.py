@@ -0,0 +1,126 @@
+import csv
+import json
+import numpy as np
+from cremi import Annotations, Volume
+from cremi.io import CremiFile
+from cremi.evaluation import NeuronIds, Clefts, SynapticPartners, evaluate_batch
+
+shape = (6, 40, 50)
+resolution = (40.0, 4.0, 4.0)
+
+def random_sample(filename, seed):
+    """Write a CREMI file with blocky neuron ids, a few clefts, and synaptic
+    partners. Samples with a seed other than 0 are perturbed versions of the
+    sample with seed 0, such that some synaptic partners match."""
+
+    truth = np.random.RandomState(0)
+    random = np.random.RandomState(seed)
+
+    neuron_ids = truth.randint(0, 5, (shape[0], shape[1]//10, shape[2]//10)).astype(np.uint64)
+    neuron_ids = neuron_ids.repeat(10, axis=1).repeat(10, axis=2)
+    if seed != 0:
+        neuron_ids[random.randint(0, shape[0])] += 1
+
+    clefts = np.full(shape, 0xffffffffffffffff, dtype=np.uint64)
+    for i in range(4):
+        begin = [ random.randint(0, s - 2) for s in shape ]
+        clefts[tuple(slice(b, b + 2) for b in begin)] = i + 1
+
+    extent = (np.array(shape) - 1)*np.array(resolution)
+    locations = truth.uniform(0, 1, (10, 3))*extent
+    if seed != 0:
+        locations = np.clip(locations + random.normal(0, 5.0, locations.shape), 0, extent)
+    ids = np.arange(10)
+    annotations = Annotations.from_arrays(
+        ids,
+        [ "presynaptic_site", "postsynaptic_site" ]*5,
+        locations,
+        ids.reshape((-1, 2)))
+
+    f = CremiFile(filename, "w")
+    f.write_neuron_ids(Volume(neuron_ids, resolution=resolution))
+    f.write_clefts(Volume(clefts, resolution=resolution))
+    f.write_annotations(annotations)
+    f.close()
+
+def direct_scores(submission, groundtruth):
+
+    test = CremiFile(submission, "r")
+    truth = CremiFile(groundtruth, "r")
+
+    scores = {}
+    scores["neuron_ids"] = NeuronIds(truth.read_neuron_ids(), border_threshold=8).evaluate(test.read_neuron_ids())
+    clefts = Clefts(test.read_clefts(), truth.read_clefts())
+    scores["clefts"] = {
+        "false_positive_count": clefts.count_false_positives(),
+        "false_negative_count": clefts.count_false_negatives(),
+        "false_positive_mean": clefts.acc_false_positives()["mean"],
+        "false_negative_mean": clefts.acc_false_negatives()["mean"] }
+    scores["synaptic_partners"] = {
+        "fscore": SynapticPartners().fscore(test.read_annotations(), truth.read_annotations(), truth.read_neuron_ids()) }
+
+    test.close()
+    truth.close()
+
+    return scores
+
+def test_evaluate_batch(tmpdir):
+
+    groundtruth = str(tmpdir.join("groundtruth.hdf"))
+    submissions = [ str(tmpdir.join("submission_%d.hdf"%i)) for i in range(2) ]
+    random_sample(groundtruth, 0)
+    for (i, submission) in enumerate(submissions):
+        random_sample(submission, i + 1)
+
+    json_output = str(tmpdir.join("results.json"))
+    results = evaluate_batch(
+        submissions,
+        groundtruth,
+        n_workers=2,
+        cache_dir=str(tmpdir.join("cache")),
+        border_threshold=8,
+        output=json_output)
+
+    # in the order of submissions and metrics
+    assert [ (r["submission"], r["metric"]) for r in results ] == [
+        (submission, metric)
+        for submission in submissions
+        for metric in ["neuron_ids", "clefts", "synaptic_partners"] ]
+
+    for submission in submissions:
+        expected = direct_scores(submission, groundtruth)
+        for result in results:
+            if result["submission"] != submission:
+                continue
+            assert "error" not in result, result.get("error")
+            for (name, value) in expected[result["metric"]].items():
+                assert np.isclose(result[name], value), name
+
+    with open(json_output) as f:
+        assert json.load(f) == json.loads(json.dumps(results))
+
+    # the same with a CSV file, reusing the prepared ground truth in the cache
+    csv_output = str(tmpdir.join("results.csv"))
+    csv_results = evaluate_batch(
+        submissions,
+        groundtruth,
+        n_workers=2,
+        cache_dir=str(tmpdir.join("cache")),
+        border_threshold=8,
+        output=csv_output)
+
+    for (result, expected) in zip(csv_results, results):
+        assert dict(result, time=0) == dict(expected, time=0)
+
+    with open(csv_output, "rb") as f:
+        rows = list(csv.DictReader(f))
+
+    assert len(rows) == len(csv_results)
+    for (row, result) in zip(rows, csv_results):
+        assert row["submission"] == result["submission"]
+        assert row["metric"] == result["metric"]
+        if result["metric"] == "synaptic_partners":
+            assert np.isclose(float(row["fscore"]), result["fscore"])
+            assert row["voi_split"] == ""
+        elif result["metric"] == "neuron_ids":
+            assert np.isclose(float(row["voi_split"]), result["voi_split"])
@@ -0,0 +1,60 @@
+import numpy as np
+import scipy.ndimage
+from cremi.evaluation.border_mask import create_border_mask, create_border_mask_2d, dilate_with_disk
+
+def random_label_image(shape, num_cells, seed):
+    """Voronoi-like cells of random labels."""
+
+    random = np.random.RandomState(seed)
+    seeds = np.zeros(shape, dtype=np.bool)
+    seeds[random.randint(0, shape[0], num_cells), random.randint(0, shape[1], num_cells)] = True
+    (_, (y, x)) = scipy.ndimage.distance_transform_edt(np.logical_not(seeds), return_indices=True)
+    labels = random.randint(1, 1000, shape).astype(np.uint64)
+
+    return labels[y, x]
+
+radii = [0, 0.5, 1, 1.5, 2, 2.9, 3, 4.2, 7, 12.5, 25]
+
+def test_dilate_with_disk():
+
+    random = np.random.RandomState(0)
+
+    for radius in radii:
+
+        mask = random.uniform(0, 1, (64, 80)) > 0.995
+        distances = scipy.ndimage.distance_transform_edt(np.logical_not(mask))
+
+        assert np.array_equal(dilate_with_disk(mask, radius), distances <= radius)
+
+def test_border_mask_2d_dilation_equals_edt():
+
+    for seed in range(3):
+
+        image = random_label_image((100, 120), 20, seed)
+
+        for max_dist in radii:
+            assert np.array_equal(
+                create_border_mask_2d(image, max_dist, method='dilation'),
+                create_border_mask_2d(image, max_dist, method='edt'))
+
+    # a single label has no border
+    image = np.ones((10, 10), dtype=np.uint64)
+    assert np.array_equal(
+        create_border_mask_2d(image, 3, method='dilation'),
+        create_border_mask_2d(image, 3, method='edt'))
+
+def test_create_border_mask_workers():
+
+    volume = np.array([ random_label_image((60, 70), 10, seed) for seed in range(7) ])
+
+    expected = np.zeros(volume.shape, dtype=np.uint64)
+    create_border_mask(volume, expected, 2.5, np.uint64(-1))
+
+    for z in range(len(volume)):
+        masked = volume[z].copy()
+        masked[create_border_mask_2d(volume[z], 2.5, method='edt')] = np.uint64(-1)
+        assert np.array_equal(expected[z], masked)
+
+    target = np.zeros(volume.shape, dtype=np.uint64)
+    create_border_mask(volume, target, 2.5, np.uint64(-1), n_workers=3)
+    assert np.array_equal(target, expected)
@@ -0,0 +1,59 @@
+import os
+import shutil
+import numpy as np
+from cremi import Volume
+from cremi.io import CremiFile
+from cremi.evaluation import NeuronIds
+
+def write_groundtruth(filename, labels):
+
+    f = CremiFile(filename, "w")
+    f.write_neuron_ids(Volume(labels, resolution=(40.0, 4.0, 4.0)))
+    f.close()
+
+def cached_groundtruth(filename, cache_dir, hash_content):
+
+    f = CremiFile(filename, "r")
+    gt = np.array(NeuronIds(f.read_neuron_ids(), border_threshold=8, cache_dir=cache_dir, hash_content=hash_content).gt)
+    f.close()
+
+    return gt
+
+def test_cache(tmpdir):
+
+    random = np.random.RandomState(0)
+    labels = random.randint(0, 5, (4, 20, 20)).astype(np.uint64)
+    changed = labels.copy()
+    changed[1, 2, 3] += 1
+
+    filename = str(tmpdir.join("groundtruth.hdf"))
+    copy = str(tmpdir.join("copy.hdf"))
+    write_groundtruth(filename, labels)
+    shutil.copy(filename, copy)
+
+    expected = NeuronIds(Volume(labels, resolution=(40.0, 4.0, 4.0)), border_threshold=8).gt
+    changed_expected = NeuronIds(Volume(changed, resolution=(40.0, 4.0, 4.0)), border_threshold=8).gt
+
+    for hash_content in [False, True]:
+
+        cache_dir = str(tmpdir.join("cache_" + str(hash_content)))
+
+        assert np.array_equal(cached_groundtruth(filename, cache_dir, hash_content), expected)
+        assert np.array_equal(cached_groundtruth(filename, cache_dir, hash_content), expected)
+        assert len(os.listdir(cache_dir)) == 1
+
+        # a copy is found by its content only
+        assert np.array_equal(cached_groundtruth(copy, cache_dir, hash_content), expected)
+        assert len(os.listdir(cache_dir)) == (1 if hash_content else 2)
+
+        # rewriting the file with the same size and modification time is only
+        # noticed by its content
+        stat = os.stat(filename)
+        write_groundtruth(filename, changed)
+        os.utime(filename, (stat.st_atime, stat.st_mtime))
+        assert os.stat(filename).st_size == stat.st_size
+
+        gt = cached_groundtruth(filename, cache_dir, hash_content)
+        assert np.array_equal(gt, changed_expected if hash_content else expected)
+
+        write_groundtruth(filename, labels)
@@ -0,0 +1,60 @@
+import numpy as np
+from cremi import Volume
+from cremi.evaluation import Clefts
+
+def random_clefts(shape, num_clefts, seed):
+    """Background (0xffffffffffffffff) with a few small box-shaped clefts."""
+
+    random = np.random.RandomState(seed)
+    clefts = np.full(shape, 0xffffffffffffffff, dtype=np.uint64)
+    for i in range(num_clefts):
+        begin = [ random.randint(0, s - 2) for s in shape ]
+        clefts[tuple(slice(b, b + random.randint(1, 4)) for b in begin)] = i + 1
+
+    return clefts
+
+def check_blockwise(test, truth, block_shape, max_distance, n_workers = 1):
+
+    expected = Clefts(test, truth)
+    blockwise = Clefts(test, truth, block_shape=block_shape, max_distance=max_distance, n_workers=n_workers)
+
+    for threshold in [0, 50, 200, 1000]:
+        assert blockwise.count_false_positives(threshold) == expected.count_false_positives(threshold)
+        assert blockwise.count_false_negatives(threshold) == expected.count_false_negatives(threshold)
+
+    for (stats, expected_stats) in [
+            (blockwise.acc_false_positives(), expected.acc_false_positives()),
+            (blockwise.acc_false_negatives(), expected.acc_false_negatives())]:
+        assert stats['count'] == expected_stats['count']
+        for stat in ['mean', 'std', 'max', 'median']:
+            assert np.isclose(stats[stat], expected_stats[stat], rtol=1e-12, atol=0), stat
+
+def test_blockwise():
+
+    shape = (12, 60, 70)
+    resolution = (40.0, 4.0, 4.0)
+
+    for seed in range(3):
+
+        test = Volume(random_clefts(shape, 8, 2*seed), resolution=resolution)
+        truth_data = random_clefts(shape, 6, 2*seed + 1)
+        # voxels marked as invalid in the ground truth
+        truth_data[:2, :10, :10] = 0xfffffffffffffffe
+        truth = Volume(truth_data, resolution=resolution)
+
+        # a small halo clips many distances, which are then computed exactly
+        for max_distance in [40, 100, 400]:
+            check_blockwise(test, truth, (4, 16, 32), max_distance)
+        check_blockwise(test, truth, (5, 25, 25), 100, n_workers=3)
+
+def test_blockwise_without_truth_clefts():
+
+    shape = (4, 20, 20)
+    test = Volume(random_clefts(shape, 3, 0), resolution=(40.0, 4.0, 4.0))
+    truth = Volume(np.full(shape, 0xffffffffffffffff, dtype=np.uint64), resolution=(40.0, 4.0, 4.0))
+
+    blockwise = Clefts(test, truth, block_shape=(2, 10, 10), max_distance=50)
+
+    assert blockwise.count_false_positives() == np.count_nonzero(test.data != 0xffffffffffffffff)
+    assert blockwise.acc_false_positives()['max'] == np.inf
+    assert blockwise.count_false_negatives() == 0
@@ -0,0 +1,102 @@
+import h5py
+import numpy as np
+import pytest
+from cremi import Confidences
+from cremi.io import CremiFile
+
+def random_confidences(num_levels, num_ids, max_id, seed):
+    """Confidences with unique random ids, spread over the levels in several
+    chunks each. The last level is left empty."""
+
+    random = np.random.RandomState(seed)
+    ids = np.unique(random.randint(0, max_id, 2*num_ids, dtype=np.uint64))
+    ids = random.permutation(ids)[:num_ids]
+    levels = random.randint(0, num_levels - 1, num_ids)
+
+    confidences = Confidences(num_levels)
+    for chunk in np.array_split(np.arange(num_ids), 5):
+        for level in range(num_levels - 1):
+            confidences.add_all(level, ids[chunk][levels[chunk] == level])
+
+    return (confidences, dict(zip(ids.tolist(), levels.tolist())))
+
+def write_and_read(confidences, filename, layout):
+
+    f = CremiFile(filename, "w")
+    f.write_neuron_ids_confidence(confidences, layout)
+    f.close()
+
+    f = CremiFile(filename, "r")
+    read = f.read_neuron_ids_confidence()
+    f.close()
+
+    return read
+
+def assert_confidences_equal(read, confidences):
+
+    assert read.num_levels == confidences.num_levels
+    for level in range(confidences.num_levels):
+        assert np.array_equal(read.get_ids(level), confidences.get_ids(level))
+
+def test_round_trip(tmpdir):
+
+    # dense ids are looked up in a table, sparse ids in a dictionary
+    for (max_id, seed) in [(2000, 0), (2**60, 1)]:
+
+        (confidences, expected) = random_confidences(5, 1000, max_id, seed)
+
+        for layout in ["rle", "csr"]:
+
+            read = write_and_read(confidences, str(tmpdir.join(layout + ".hdf")), layout)
+            assert_confidences_equal(read, confidences)
+            assert len(read.get_ids(4)) == 0
+
+            ids = np.array(sorted(expected.keys()) + [max_id + 1], dtype=np.uint64)
+            levels = np.array([ expected[i] for i in sorted(expected.keys()) ] + [-1])
+            assert np.array_equal(read.levels_of(ids), levels)
+            for i in expected.keys()[:20]:
+                assert read.level_of(i) == expected[i]
+
+def test_empty_round_trip(tmpdir):
+
+    for layout in ["rle", "csr"]:
+
+        read = write_and_read(Confidences(3), str(tmpdir.join(layout + ".hdf")), layout)
+
+        assert_confidences_equal(read, Confidences(3))
+        assert np.array_equal(read.levels_of([0, 1, 2**40]), [-1, -1, -1])
+        assert read.levels_of(np.zeros((0,))).shape == (0,)
+
+def test_read_rle(tmpdir):
+    """The run-length encoding as written by earlier versions: for each level,
+    the level, the number of ids, and the ids."""
+
+    filename = str(tmpdir.join("rle.hdf"))
+    with h5py.File(filename, "w") as f:
+        f.create_dataset("/volumes/labels/neuron_ids_confidence", data=np.array([0, 2, 5, 3, 1, 0, 3, 1, 17], dtype=np.uint64))
+
+    f = CremiFile(filename, "r")
+    read = f.read_neuron_ids_confidence()
+    f.close()
+
+    assert read.num_levels == 4
+    assert [ list(read.get_ids(level)) for level in range(4) ] == [[5, 3], [], [], [17]]
+
+def test_read_truncated_rle(tmpdir):
+
+    filename = str(tmpdir.join("rle.hdf"))
+
+    for data in [
+            [0, 5, 1, 2],       # fewer ids than the header says
+            [0, 2, 5, 3, 1],    # the header of the last level is incomplete
+            [0, 2, 5]]:
+
+        with h5py.File(filename, "w") as f:
+            f.create_dataset("/volumes/labels/neuron_ids_confidence", data=np.array(data, dtype=np.uint64))
+
+        f = CremiFile(filename, "r")
+        with pytest.raises(ValueError) as error:
+            f.read_neuron_ids_confidence()
+        f.close()
+
+        assert "truncated" in str(error.value)
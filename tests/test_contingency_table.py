@@ -0,0 +1,63 @@
+import collections
+import numpy as np
+from cremi.evaluation.relabel import relabel
+from cremi.evaluation.voi import contingency_table, contingency_table_blockwise
+
+def random_labels(shape, num_labels, seed, sparse = False):
+
+    random = np.random.RandomState(seed)
+    labels = random.randint(0, num_labels, shape).astype(np.uint64)
+    if sparse:
+        # large, non-contiguous label values
+        values = np.concatenate([[0], random.randint(1, 2**62, num_labels - 1)]).astype(np.uint64)
+        labels = values[labels]
+
+    return labels
+
+def naive_contingency_table(seg, gt, ignore_seg, ignore_gt):
+
+    counts = collections.Counter()
+    for (s, g) in zip(seg.ravel().tolist(), gt.ravel().tolist()):
+        if s not in ignore_seg and g not in ignore_gt:
+            counts[(s, g)] += 1
+
+    return counts
+
+def table_counts(cont, seg_labels, gt_labels):
+
+    cont = cont.tocoo()
+
+    return collections.Counter(dict(
+        ((int(seg_labels[i]), int(gt_labels[j])), int(round(v)))
+        for (i, j, v) in zip(cont.row, cont.col, cont.data) if v != 0))
+
+def test_relabel():
+
+    for sparse in [False, True]:
+
+        labels = random_labels((4, 20, 30), 50, 0, sparse)
+        (relabelled, original) = relabel(labels)
+
+        assert np.array_equal(original[relabelled], labels)
+        assert original[0] == 0
+        assert np.all(np.diff(original.astype(np.float64)) > 0)
+
+    # label 0 is always mapped to 0
+    (relabelled, original) = relabel(np.array([5, 7, 5], dtype=np.uint64))
+    assert np.array_equal(original, [0, 5, 7])
+    assert np.array_equal(relabelled, [1, 2, 1])
+
+def test_contingency_table():
+
+    for sparse in [False, True]:
+        for (ignore_seg, ignore_gt) in [([], []), ([0], [0])]:
+
+            seg = random_labels((4, 20, 30), 30, 1, sparse)
+            gt = random_labels((4, 20, 30), 20, 2, sparse)
+            expected = naive_contingency_table(seg, gt, ignore_seg, ignore_gt)
+
+            (cont, seg_labels, gt_labels) = contingency_table(seg, gt, ignore_seg, ignore_gt, norm=False, return_labels=True)
+            assert table_counts(cont, seg_labels, gt_labels) == expected
+
+            (cont, seg_labels, gt_labels) = contingency_table_blockwise(seg, gt, (3, 7, None), ignore_seg, ignore_gt, norm=False, return_labels=True)
+            assert table_counts(cont, seg_labels, gt_labels) == expected
@@ -0,0 +1,161 @@
+import h5py
+import numpy as np
+import pytest
+from cremi import Volume
+from cremi.io import CremiFile, volume_layouts
+
+shape = (6, 40, 50)
+resolution = (40.0, 4.0, 4.0)
+
+def random_volume(seed = 0, offset = (0.0, 0.0, 0.0)):
+
+    random = np.random.RandomState(seed)
+    data = random.randint(0, 10, shape).astype(np.uint64)
+
+    return Volume(data, resolution=resolution, offset=offset, comment="random")
+
+def test_layouts(tmpdir):
+
+    volume = random_volume()
+    filename = str(tmpdir.join("layouts.hdf"))
+
+    for (layout, expected_chunks) in [
+            ("default", None),
+            ("slice-wise", (1, 40, 50)),
+            ("block-wise", (6, 40, 50)),
+            ("contiguous", None)]:
+
+        f = CremiFile(filename, "w")
+        f.write_neuron_ids(volume, layout)
+        f.close()
+
+        f = CremiFile(filename, "r")
+        ds = f.h5file["/volumes/labels/neuron_ids"]
+        preset = volume_layouts[layout]
+
+        assert ds.compression == preset["compression"]
+        assert ds.shuffle == preset["shuffle"]
+        if preset["compression_opts"] is not None:
+            assert ds.compression_opts == preset["compression_opts"]
+        if preset["chunks"] is None:
+            assert ds.chunks is None
+        elif preset["chunks"] is True:
+            assert ds.chunks is not None
+        else:
+            # cropped to the shape of the volume
+            assert ds.chunks == expected_chunks
+        assert np.array_equal(ds[:], volume.data)
+        f.close()
+
+    # options of a preset can be overwritten
+    f = CremiFile(filename, "w")
+    f.write_neuron_ids(volume, "block-wise", chunks=(2, 16, 16), compression="lzf")
+    ds = f.h5file["/volumes/labels/neuron_ids"]
+    assert ds.chunks == (2, 16, 16)
+    assert ds.compression == "lzf"
+    assert ds.compression_opts is None
+    assert ds.shuffle
+    assert np.array_equal(ds[:], volume.data)
+
+    with pytest.raises(ValueError):
+        f.write_neuron_ids(volume, "unknown")
+    with pytest.raises(TypeError):
+        f.write_neuron_ids(volume, "default", unknown_option=1)
+    f.close()
+
+def read_attributes(filename):
+
+    with h5py.File(filename, "r") as f:
+        ds = f["/volumes/labels/neuron_ids"]
+        return (ds[:], dict((key, np.asarray(value).tolist()) for (key, value) in ds.attrs.items()))
+
+def test_block_writes(tmpdir):
+
+    volume = random_volume(1, offset=(80.0, 8.0, 12.0))
+    whole = str(tmpdir.join("whole.hdf"))
+    blocks = str(tmpdir.join("blocks.hdf"))
+
+    f = CremiFile(whole, "w")
+    f.write_neuron_ids(volume, "block-wise")
+    f.close()
+
+    def volume_blocks():
+        # Volume blocks placed by their offset in world units
+        for z in range(0, shape[0], 4):
+            for y in range(0, shape[1], 16):
+                yield Volume(
+                    volume.data[z:z + 4, y:y + 16, :25],
+                    resolution=resolution,
+                    offset=tuple(np.array(volume.offset) + np.array((z, y, 0))*np.array(resolution)))
+
+    def voxel_blocks():
+        # pairs of voxel offset and data
+        for z in range(0, shape[0], 4):
+            yield ((z, 0, 25), volume.data[z:z + 4, :, 25:])
+
+    f = CremiFile(blocks, "w")
+    created = f.create_volume(
+        "/volumes/labels/neuron_ids",
+        shape,
+        np.uint64,
+        resolution=volume.resolution,
+        offset=volume.offset,
+        comment=volume.comment,
+        layout="block-wise")
+    assert created.data.shape == shape
+    assert tuple(created.offset) == tuple(volume.offset)
+    f.write_volume_blocks("/volumes/labels/neuron_ids", volume_blocks())
+    f.write_volume_blocks("/volumes/labels/neuron_ids", voxel_blocks())
+
+    with pytest.raises(IndexError):
+        f.write_volume_block("/volumes/labels/neuron_ids", volume.data[:2], (5, 0, 0))
+    with pytest.raises(ValueError):
+        f.write_volume_block("/volumes/labels/neuron_ids", volume.data[:2])
+    with pytest.raises(ValueError):
+        f.write_volume_block("/volumes/labels/neuron_ids", Volume(volume.data[:2], resolution=(40.0, 8.0, 8.0), offset=volume.offset))
+    f.close()
+
+    (whole_data, whole_attributes) = read_attributes(whole)
+    (blocks_data, blocks_attributes) = read_attributes(blocks)
+    assert np.array_equal(blocks_data, whole_data)
+    assert blocks_attributes == whole_attributes
+
+def test_memmap(tmpdir):
+
+    volume = random_volume(2)
+    contiguous = str(tmpdir.join("contiguous.hdf"))
+    compressed = str(tmpdir.join("compressed.hdf"))
+
+    for (filename, layout) in [(contiguous, "contiguous"), (compressed, "default")]:
+        f = CremiFile(filename, "w")
+        f.write_neuron_ids(volume, layout)
+        f.close()
+
+    f = CremiFile(contiguous, "r")
+
+    # the HDF5 dataset by default
+    assert isinstance(f.read_neuron_ids().data, h5py.Dataset)
+
+    for memmap in [True, None]:
+        mapped = f.read_neuron_ids(memmap=memmap)
+        assert isinstance(mapped.data, np.memmap)
+        assert not mapped.data.flags.writeable
+        assert np.array_equal(mapped.data, volume.data)
+        assert np.array_equal(mapped.data[2:4, 5:30, 7], f.read_neuron_ids().data[2:4, 5:30, 7])
+        assert tuple(mapped.resolution) == resolution
+    f.close()
+
+    # the memory map stays valid after closing the file
+    assert np.array_equal(mapped.data, volume.data)
+
+    f = CremiFile(compressed, "r")
+    assert isinstance(f.read_neuron_ids(memmap=None).data, h5py.Dataset)
+    with pytest.raises(ValueError):
+        f.read_neuron_ids(memmap=True)
+    f.close()
+
+    # files opened for writing are only mapped on request
+    f = CremiFile(contiguous, "a")
+    assert isinstance(f.read_neuron_ids(memmap=None).data, h5py.Dataset)
+    assert isinstance(f.read_neuron_ids(memmap=True).data, np.memmap)
+    f.close()
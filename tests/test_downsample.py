@@ -0,0 +1,102 @@
+import collections
+import itertools
+import numpy as np
+from cremi import Volume
+from cremi.io import CremiFile
+from cremi.io.downsample import downsample
+
+def naive_windows(data, factor):
+    """Yield the index of each downsampled voxel and its window, where windows
+    cut off by the array repeat the last voxel."""
+
+    shape = tuple(-(-s//f) for (s, f) in zip(data.shape, factor))
+
+    for index in itertools.product(*[ range(s) for s in shape ]):
+        coordinates = [
+            [ min(i*f + o, s - 1) for o in range(f) ]
+            for (i, f, s) in zip(index, factor, data.shape) ]
+        yield (index, data[np.ix_(*coordinates)].ravel())
+
+def naive_downsample(data, factor, method):
+
+    shape = tuple(-(-s//f) for (s, f) in zip(data.shape, factor))
+    result = np.zeros(shape, dtype=data.dtype)
+
+    for (index, window) in naive_windows(data, factor):
+        if method == "mode":
+            counts = collections.Counter(window.tolist())
+            most = max(counts.values())
+            result[index] = min(value for (value, count) in counts.items() if count == most)
+        else:
+            mean = np.mean(window.astype(np.float64))
+            result[index] = np.round(mean) if np.issubdtype(data.dtype, np.integer) else mean
+
+    return result
+
+shapes_and_factors = [
+    ((8, 8, 8), (2, 2, 2)),
+    ((5, 9, 7), (1, 2, 2)),
+    ((7, 10, 11), (2, 3, 4)),
+    ((3, 4, 5), (4, 5, 6)),
+    ((6, 6), (3, 2))]
+
+def test_mode():
+
+    random = np.random.RandomState(0)
+
+    for (shape, factor) in shapes_and_factors:
+        # few labels, such that ties are frequent
+        for (num_labels, dtype) in [(3, np.uint64), (50, np.uint64), (4, np.int32)]:
+            data = random.randint(0, num_labels, shape).astype(dtype)
+            result = downsample(data, factor, "mode")
+            assert result.dtype == data.dtype
+            assert np.array_equal(result, naive_downsample(data, factor, "mode"))
+
+    # large labels
+    data = np.array([[2**63 + 5, 2**63 + 5], [2**63 + 1, 7]], dtype=np.uint64)
+    assert downsample(data, (2, 2), "mode")[0, 0] == 2**63 + 5
+
+def test_mean():
+
+    random = np.random.RandomState(1)
+
+    for (shape, factor) in shapes_and_factors:
+        for dtype in [np.uint8, np.float32]:
+            data = (random.uniform(0, 255, shape)).astype(dtype)
+            result = downsample(data, factor, "mean")
+            assert result.dtype == data.dtype
+            if dtype == np.uint8:
+                assert np.array_equal(result, naive_downsample(data, factor, "mean"))
+            else:
+                assert np.allclose(result, naive_downsample(data, factor, "mean"), rtol=1e-6)
+
+def test_stride():
+
+    data = np.arange(7*10*11).reshape((7, 10, 11))
+    assert np.array_equal(downsample(data, (2, 3, 4), "stride"), data[::2, ::3, ::4])
+
+def test_pyramid(tmpdir):
+
+    random = np.random.RandomState(2)
+    labels = random.randint(0, 4, (6, 20, 18)).astype(np.uint64)
+    filename = str(tmpdir.join("pyramid.hdf"))
+
+    f = CremiFile(filename, "w")
+    f.write_neuron_ids(Volume(labels, resolution=(40.0, 4.0, 4.0), offset=(80.0, 8.0, 4.0)))
+    f.write_pyramid("/volumes/labels/neuron_ids", factors=[(1, 2, 2), (2, 3, 3)])
+    f.close()
+
+    f = CremiFile(filename, "r")
+    assert f.pyramid_levels("/volumes/labels/neuron_ids") == 3
+
+    level1 = f.read_neuron_ids(level=1)
+    expected1 = naive_downsample(labels, (1, 2, 2), "mode")
+    assert np.array_equal(level1.data[:], expected1)
+    assert tuple(level1.resolution) == (40.0, 8.0, 8.0)
+    assert tuple(level1.offset) == (80.0, 10.0, 6.0)
+
+    level2 = f.read_neuron_ids(level=2)
+    assert np.array_equal(level2.data[:], naive_downsample(expected1, (2, 3, 3), "mode"))
+    assert tuple(level2.resolution) == (80.0, 24.0, 24.0)
+    assert tuple(level2.offset) == (100.0, 18.0, 14.0)
+    f.close()
@@ -0,0 +1,58 @@
+import numpy as np
+from cremi import Volume
+from cremi.evaluation import IncrementalNeuronIds, NeuronIds
+
+def random_segmentation(shape, num_labels, seed):
+    """Random labels (including background 0) in blocks of 2x4x4 voxels, such
+    that segments overlap several ground truth segments."""
+
+    random = np.random.RandomState(seed)
+    blocks = random.randint(0, num_labels, (shape[0]//2, shape[1]//4, shape[2]//4)).astype(np.uint64)
+
+    return blocks.repeat(2, axis=0).repeat(4, axis=1).repeat(4, axis=2)
+
+def assert_scores_equal(scores, expected):
+
+    assert sorted(scores.keys()) == sorted(expected.keys())
+    for key in expected.keys():
+        assert abs(scores[key] - expected[key]) < 1e-12, key
+
+def check_updates(border_threshold):
+
+    shape = (8, 32, 40)
+    resolution = (40.0, 4.0, 4.0)
+    random = np.random.RandomState(0)
+
+    groundtruth = Volume(random_segmentation(shape, 6, 1), resolution=resolution)
+    segmentation = random_segmentation(shape, 10, 2)
+
+    incremental = IncrementalNeuronIds(groundtruth, Volume(segmentation.copy(), resolution=resolution), border_threshold)
+    evaluation = NeuronIds(groundtruth, border_threshold)
+
+    assert_scores_equal(incremental.evaluate(), evaluation.evaluate(Volume(segmentation, resolution=resolution)))
+
+    for (region, labels) in [
+            # relabel with existing labels
+            (np.s_[0:3, 5:20, 7:30], random.randint(0, 10, (3, 15, 23))),
+            # merge into a single (new) segment
+            (np.s_[:, 10:12, :], np.full((8, 2, 40), 42)),
+            # erase to background
+            (np.s_[4:8, 0:32, 20:40], np.zeros((4, 32, 20))),
+            # a single voxel
+            (np.s_[5:6, 3:4, 3:4], np.full((1, 1, 1), 3)),
+            # everything
+            (np.s_[:, :, :], random_segmentation(shape, 4, 3))]:
+
+        labels = np.asarray(labels, dtype=np.uint64)
+        incremental.update(region, labels)
+        segmentation[region] = labels
+
+        assert_scores_equal(incremental.evaluate(), evaluation.evaluate(Volume(segmentation, resolution=resolution)))
+
+def test_incremental_neuron_ids():
+
+    check_updates(None)
+
+def test_incremental_neuron_ids_border_threshold():
+
+    check_updates(8)
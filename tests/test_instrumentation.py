@@ -0,0 +1,116 @@
+import time
+import numpy as np
+from cremi import Volume, instrumentation
+from cremi.Volume import DataWindow
+from cremi.evaluation import Clefts
+
+def allocate(mb, seconds = 0.1):
+    """Allocate and touch a temporary of mb MB, keep it for a while, and
+    free it."""
+
+    temporary = np.ones((int(mb*1024*1024),), dtype=np.uint8)
+    time.sleep(seconds)
+    del temporary
+
+def test_stages():
+
+    events = []
+    instrumentation.enable(sink=events.append)
+    try:
+
+        # raise the peak of the process above what the stages allocate
+        allocate(300, 0)
+
+        for i in range(2):
+            with instrumentation.stage("outer"):
+                with instrumentation.stage("temporary"):
+                    allocate(100)
+                with instrumentation.stage("kept"):
+                    kept = np.ones((50*1024*1024,), dtype=np.uint8)
+
+    finally:
+        report = instrumentation.disable()
+
+    assert report.stage_order == ["outer", "outer/temporary", "outer/kept"]
+    assert [ e["name"] for e in events ] == ["outer/temporary", "outer/kept", "outer"]*2
+    for name in report.stage_order:
+        assert report.stages[name]["calls"] == 2
+
+    # the temporary was freed, but is part of the peak of its stage
+    temporary = report.stages["outer/temporary"]
+    assert temporary["peak_increase_mb"] > 90
+    assert temporary["rss_increase_mb"] < 10
+
+    kept = report.stages["outer/kept"]
+    assert kept["peak_increase_mb"] > 45
+    assert kept["rss_increase_mb"] > 45
+
+    assert report.stages["outer"]["peak_increase_mb"] > 90
+    assert report.peak_rss_mb > 300
+
+    text = str(report)
+    for name in report.stage_order:
+        assert name in text
+    assert report.to_dict()["stages"][1]["name"] == "outer/temporary"
+
+    # disabled stages do nothing
+    with instrumentation.stage("disabled"):
+        pass
+    assert instrumentation.report() is None
+
+def test_counters(tmpdir):
+
+    events = []
+    in_memory = np.zeros((10, 10), dtype=np.uint64)
+    filename = str(tmpdir.join("memmap.raw"))
+    memmap = np.memmap(filename, dtype=np.uint64, mode="w+", shape=(10, 10))
+
+    instrumentation.enable(sink=events.append)
+    try:
+
+        # data in memory is not counted, data from files is
+        instrumentation.count_read(in_memory, "in_memory")
+        instrumentation.count_read(DataWindow(in_memory, (0, 0), (5, 5)), "in_memory_window")
+        instrumentation.count_read(memmap, "memmap")
+        instrumentation.count_read(DataWindow(memmap, (0, 0), (5, 5)), "memmap_window")
+        instrumentation.count_read(memmap, "memmap_block", 80)
+        instrumentation.count_read(in_memory, "in_memory_block", 80)
+        instrumentation.count_read(123, "bytes")
+        instrumentation.count_written(in_memory, "written")
+
+    finally:
+        report = instrumentation.disable()
+
+    assert [ (e["event"], e["name"], e["bytes"]) for e in events ] == [
+        ("read", "memmap", 800),
+        ("read", "memmap_window", 200),
+        ("read", "memmap_block", 80),
+        ("read", "bytes", 123),
+        ("write", "written", 800)]
+    assert report.bytes_read == 800 + 200 + 80 + 123
+    assert report.bytes_written == 800
+
+def test_clefts_blockwise_reads(tmpdir):
+    """Block-wise reads from memory maps are counted like whole reads."""
+
+    shape = (4, 16, 16)
+    clefts = np.full(shape, 0xffffffffffffffff, dtype=np.uint64)
+    clefts[1:3, 4:8, 4:8] = 1
+
+    def volume(name):
+        data = np.memmap(str(tmpdir.join(name)), dtype=np.uint64, mode="w+", shape=shape)
+        data[:] = clefts
+        return Volume(data, resolution=(40.0, 4.0, 4.0))
+
+    (test, truth) = (volume("test.raw"), volume("truth.raw"))
+
+    for block_shape in [None, (2, 8, 8)]:
+
+        instrumentation.enable()
+        try:
+            Clefts(test, truth, block_shape=block_shape, max_distance=8)
+        finally:
+            report = instrumentation.disable()
+
+        # two volumes, blocks are read with their halos
+        assert report.bytes_read >= 2*clefts.nbytes
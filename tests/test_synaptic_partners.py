@@ -0,0 +1,161 @@
+import numpy as np
+from scipy.optimize import linear_sum_assignment
+from cremi import Annotations, Volume
+from cremi.evaluation.synaptic_partners import cost, cost_minimal_matches, matching_costs, synaptic_partners_fscore
+
+def naive_cost_matrix(rec, gt, gt_segmentation, matching_threshold):
+    """The costs of all pairs, computed one by one as before the KD-tree
+    candidate search. Returns the padded cost matrix."""
+
+    def locations(annotations):
+        shift = np.array(annotations.offset) - np.array(gt_segmentation.offset)
+        return [
+            (tuple(annotations.get_annotation(pre)[1] + shift), tuple(annotations.get_annotation(post)[1] + shift))
+            for (pre, post) in annotations.pre_post_partners ]
+
+    def label(location):
+        return gt_segmentation.data[tuple(int(round(l/r)) for (l, r) in zip(location, gt_segmentation.resolution))]
+
+    rec_locations = locations(rec)
+    gt_locations = locations(gt)
+    rec_labels = [ (label(pre), label(post)) for (pre, post) in rec_locations ]
+    gt_labels = [ (label(pre), label(post)) for (pre, post) in gt_locations ]
+
+    size = max(len(rec_locations), len(gt_locations))
+    costs = np.full((size, size), 2.0*matching_threshold)
+    for i in range(len(rec_locations)):
+        for j in range(len(gt_locations)):
+            costs[i, j] = cost(rec_locations[i], gt_locations[j], rec_labels[i], gt_labels[j], matching_threshold)
+
+    return costs
+
+def dense_matches(costs, matching_threshold):
+    """The Hungarian method on the full cost matrix, as it was computed
+    before the matching was split into connected components."""
+
+    matches = linear_sum_assignment(costs - np.amax(costs) - 1)
+
+    return sorted(
+        (i, j, costs[i][j])
+        for (i, j) in zip(matches[0], matches[1])
+        if costs[i][j] <= matching_threshold)
+
+def random_annotations(num_partners, shape, resolution, random, jitter = None, base = None):
+
+    # locations are looked up at the closest voxel center
+    extent = (np.array(shape) - 1)*np.array(resolution)
+    if base is None:
+        locations = random.uniform(0, 1, (num_partners, 2, 3))*extent
+    else:
+        locations = np.clip(base + random.normal(0, jitter, (num_partners, 2, 3)), 0, extent)
+
+    ids = np.arange(2*num_partners)
+    types = [ "presynaptic_site", "postsynaptic_site" ]*num_partners
+
+    return (
+        Annotations.from_arrays(ids, types, locations.reshape((-1, 3)), ids.reshape((-1, 2))),
+        locations)
+
+def test_cost_minimal_matches():
+
+    random = np.random.RandomState(0)
+    matching_threshold = 400
+
+    for (num_rec, num_gt, num_edges) in [(1, 1, 1), (10, 8, 12), (50, 60, 100), (200, 150, 600)]:
+
+        edges = set(zip(random.randint(0, num_rec, num_edges), random.randint(0, num_gt, num_edges)))
+        rec_indices = np.array([ e[0] for e in sorted(edges) ])
+        gt_indices = np.array([ e[1] for e in sorted(edges) ])
+        costs = random.uniform(0, matching_threshold, len(edges))
+
+        size = max(num_rec, num_gt)
+        dense_costs = np.full((size, size), 2.0*matching_threshold)
+        dense_costs[rec_indices, gt_indices] = costs
+
+        assert cost_minimal_matches(rec_indices, gt_indices, costs, matching_threshold) == dense_matches(dense_costs, matching_threshold)
+
+    assert cost_minimal_matches(np.zeros((0,), dtype=np.int64), np.zeros((0,), dtype=np.int64), np.zeros((0,)), matching_threshold) == []
+
+def segmentation_and_annotations(seed):
+
+    random = np.random.RandomState(seed)
+    shape = (10, 100, 100)
+    resolution = (40.0, 4.0, 4.0)
+
+    # a few large segments, such that partners link the same segments often
+    labels = np.zeros(shape, dtype=np.uint64)
+    labels[:, :50, :] = 1
+    labels[:, 50:, :50] = 2
+    labels[:, 50:, 50:] = 3
+    segmentation = Volume(labels, resolution=resolution, offset=(80.0, 40.0, 20.0))
+
+    (gt, gt_locations) = random_annotations(60, shape, resolution, random)
+    (rec, _) = random_annotations(70, shape, resolution, random, jitter=100, base=np.concatenate([gt_locations, gt_locations[:10]]))
+    gt.offset = segmentation.offset
+
+    # the same locations, relative to a different offset
+    (ids, types, locations, partners) = rec.to_arrays()
+    offset = (120.0, 40.0, 16.0)
+    rec = Annotations.from_arrays(ids, types, locations + np.array(segmentation.offset) - np.array(offset), partners, offset)
+
+    return (segmentation, rec, gt)
+
+def test_matching_costs():
+
+    matching_threshold = 400
+    (segmentation, rec, gt) = segmentation_and_annotations(1)
+
+    (rec_indices, gt_indices, costs) = matching_costs(rec, gt, segmentation, matching_threshold)
+
+    expected = naive_cost_matrix(rec, gt, segmentation, matching_threshold)
+    (expected_rec_indices, expected_gt_indices) = np.nonzero(expected <= matching_threshold)
+
+    order = np.lexsort((gt_indices, rec_indices))
+    assert len(costs) > 0
+    assert np.array_equal(rec_indices[order], expected_rec_indices)
+    assert np.array_equal(gt_indices[order], expected_gt_indices)
+    assert np.array_equal(costs[order], expected[expected_rec_indices, expected_gt_indices])
+
+def test_matching_costs_at_threshold():
+
+    matching_threshold = 400
+    segmentation = Volume(np.ones((10, 200, 200), dtype=np.uint64), resolution=(40.0, 4.0, 4.0))
+
+    # rec partners shifted by exactly matching_threshold (cost 400), and by
+    # slightly more (no candidate)
+    gt_locations = np.array([[[80.0, 40.0, 40.0], [80.0, 48.0, 40.0]]]*4)
+    shifts = np.array([
+        [[0.0, 0.0, 0.0], [0.0, 0.0, 0.0]],
+        [[0.0, 0.0, 400.0], [0.0, 0.0, 400.0]],
+        [[0.0, 240.0, 320.0], [0.0, 240.0, 320.0]],
+        [[0.0, 0.0, 400.0], [0.0, 0.0, 400.0001]]])
+    ids = np.arange(8)
+    types = [ "presynaptic_site", "postsynaptic_site" ]*4
+    gt = Annotations.from_arrays(ids, types, gt_locations.reshape((-1, 3)), ids.reshape((-1, 2)))
+    rec = Annotations.from_arrays(ids, types, (gt_locations + shifts).reshape((-1, 3)), ids.reshape((-1, 2)))
+
+    (rec_indices, gt_indices, costs) = matching_costs(rec, gt, segmentation, matching_threshold)
+
+    expected = naive_cost_matrix(rec, gt, segmentation, matching_threshold)
+    assert expected[1, 1] == 400 and expected[2, 2] == 400 and expected[3, 3] == 800
+    assert sorted(zip(rec_indices, gt_indices, costs)) == sorted(
+        (i, j, expected[i, j]) for (i, j) in zip(*np.nonzero(expected <= matching_threshold)))
+    assert (3, 3) not in zip(rec_indices, gt_indices)
+
+def test_synaptic_partners_fscore():
+
+    matching_threshold = 400
+    (segmentation, rec, gt) = segmentation_and_annotations(1)
+
+    (fscore, precision, recall, fp, fn, matches) = synaptic_partners_fscore(rec, gt, segmentation, matching_threshold, all_stats=True)
+
+    expected = dense_matches(naive_cost_matrix(rec, gt, segmentation, matching_threshold), matching_threshold)
+    tp = len(expected)
+    expected_precision = float(tp)/len(rec.pre_post_partners)
+    expected_recall = float(tp)/len(gt.pre_post_partners)
+
+    assert len(matches) > 0
+    assert matches == expected
+    assert (fp, fn) == (len(rec.pre_post_partners) - tp, len(gt.pre_post_partners) - tp)
+    assert (precision, recall) == (expected_precision, expected_recall)
+    assert fscore == 2.0*expected_precision*expected_recall/(expected_precision + expected_recall)
@@ -0,0 +1,47 @@
+import h5py
+import numpy as np
+import pytest
+from cremi import Volume
+
+resolution = (40.0, 4.0, 4.0)
+
+def naive_lookup(data, locations):
+
+    return np.array([ data[tuple(int(round(l/r)) for (l, r) in zip(location, resolution))] for location in locations ])
+
+def test_lookup(tmpdir):
+
+    random = np.random.RandomState(0)
+    data = random.randint(0, 2**40, (8, 30, 40)).astype(np.uint64)
+
+    f = h5py.File(str(tmpdir.join("volume.hdf")), "w")
+    dataset = f.create_dataset("data", data=data, chunks=(2, 8, 8))
+
+    # unsorted locations, with duplicates (also of the same voxel at slightly
+    # different locations), and locations halfway between voxels
+    voxels = np.array([ random.randint(0, s, 200) for s in data.shape ]).T
+    locations = voxels*np.array(resolution) + random.uniform(-0.49, 0.49, (200, 3))*np.array(resolution)
+    locations = np.clip(locations, 0, None)
+    locations = np.concatenate([ locations, locations[::-3], voxels[:20]*np.array(resolution), [[20.0, 2.0, 6.0], [60.0, 114.0, 154.0]] ])
+
+    expected = naive_lookup(data, locations)
+
+    for volume in [Volume(data, resolution=resolution), Volume(dataset, resolution=resolution)]:
+
+        values = volume.lookup(locations)
+        assert values.dtype == data.dtype
+        assert np.array_equal(values, expected)
+
+        # a window into the volume
+        roi = volume.roi(offset=(80.0, 20.0, 40.0), shape=(160.0, 60.0, 80.0))
+        assert np.array_equal(roi.lookup([[0.0, 0.0, 0.0], [120.0, 56.0, 76.0], [0.0, 0.0, 0.0]]), [data[2, 5, 10], data[5, 19, 29], data[2, 5, 10]])
+
+        assert volume.lookup(np.zeros((0, 3))).shape == (0,)
+
+        for outside in [[-40.0, 0.0, 0.0], [0.0, 0.0, 158.0], [320.0, 0.0, 0.0]]:
+            with pytest.raises(IndexError):
+                volume.lookup(np.concatenate([ locations[:5], [outside] ]))
+        with pytest.raises(IndexError):
+            roi.lookup([[0.0, 60.0, 0.0]])
+
+    f.close()
@@ -0,0 +1,83 @@
+import h5py
+import numpy as np
+import pytest
+from cremi import Volume
+from cremi.Volume import DataWindow
+
+resolution = (40.0, 4.0, 4.0)
+offset = (400.0, 80.0, 40.0)
+
+def volumes(tmpdir):
+    """The same data as an array and as an HDF5 dataset."""
+
+    data = np.arange(8*30*40, dtype=np.uint64).reshape((8, 30, 40))
+    f = h5py.File(str(tmpdir.join("volume.hdf")), "w")
+    dataset = f.create_dataset("data", data=data, chunks=(2, 8, 8))
+
+    return (data, f, [ Volume(data, resolution=resolution, offset=offset), Volume(dataset, resolution=resolution, offset=offset) ])
+
+def test_roi(tmpdir):
+
+    (data, f, vols) = volumes(tmpdir)
+
+    for volume in vols:
+
+        # world units, offset in the same frame as the volume's
+        roi = volume.roi(offset=(480.0, 100.0, 60.0), shape=(160.0, 40.0, 80.0))
+        expected = data[2:6, 5:15, 5:25]
+
+        assert roi.data.shape == expected.shape
+        assert tuple(roi.offset) == (480.0, 100.0, 60.0)
+        assert tuple(roi.resolution) == resolution
+        assert np.array_equal(np.asarray(roi.data), expected)
+        assert np.array_equal(roi.data[1:3, ::3, -5:], expected[1:3, ::3, -5:])
+        assert np.array_equal(roi.data[-1, 2, :], expected[-1, 2, :])
+        assert np.array_equal(roi.data[..., 4], expected[..., 4])
+        assert np.array_equal(roi.data[0, [1, 3, -1], 2:4], expected[0, [1, 3, -1], 2:4])
+        assert roi.data[3, 9, 19] == expected[3, 9, 19]
+
+        # offsets are rounded to the closest voxel
+        assert np.array_equal(np.asarray(volume.roi((481.0, 101.0, 61.0), (160.0, 40.0, 80.0)).data), expected)
+
+        # a region of a region
+        nested = roi.roi(offset=(520.0, 120.0, 80.0), shape=(80.0, 20.0, 40.0))
+        assert tuple(nested.offset) == (520.0, 120.0, 80.0)
+        assert np.array_equal(np.asarray(nested.data), data[3:5, 10:15, 10:20])
+        assert np.array_equal(np.asarray(nested.data), np.asarray(roi.data)[1:3, 5:10, 5:15])
+        if isinstance(volume.data, h5py.Dataset):
+            # still a window into the dataset, not a window into a window
+            assert isinstance(nested.data, DataWindow)
+            assert nested.data.data is volume.data
+
+        # the whole volume
+        assert np.array_equal(np.asarray(volume.roi(offset, (320.0, 120.0, 160.0)).data), data)
+
+        # outside of the volume, or of the outer region
+        with pytest.raises(IndexError):
+            volume.roi((360.0, 80.0, 40.0), (80.0, 4.0, 4.0))
+        with pytest.raises(IndexError):
+            volume.roi(offset, (360.0, 4.0, 4.0))
+        with pytest.raises(IndexError):
+            roi.roi((480.0, 100.0, 60.0), (160.0, 44.0, 80.0))
+        with pytest.raises(IndexError):
+            roi.roi((440.0, 100.0, 60.0), (40.0, 4.0, 4.0))
+
+        # indices outside of a window
+        if isinstance(roi.data, DataWindow):
+            for key in [(4, 0, 0), (0, -11, 0), (0, [10], 0), (0, 0, 0, 0)]:
+                with pytest.raises(IndexError):
+                    roi.data[key]
+
+    f.close()
+
+def test_roi_write(tmpdir):
+
+    (data, f, vols) = volumes(tmpdir)
+    dataset = vols[1].data
+
+    roi = vols[1].roi(offset=(480.0, 100.0, 60.0), shape=(80.0, 8.0, 8.0))
+    roi.data[1, :, 1:] = 7
+    data[3, 5:7, 6:7] = 7
+
+    assert np.array_equal(dataset[:], data)
+    f.close()